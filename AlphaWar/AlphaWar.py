@@ -1,25 +1,94 @@
+import os
+import threading
 import time
+import_start = time.perf_counter()
 import pygame
 import pygame.font
 import pygame.mixer
 import numpy as np
-import matplotlib.pyplot as plt
 from alpha_war_funcs import *
-from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds
+from broadcast import ScorePublisher
+from calibration import BaselineStore, Calibration, RunningStats, baseline_key
+from device_registry import DeviceRegistry, DEFAULT_REGISTRY_PATH
+from latency import LatencyTracker, ROPE_MARKER
+from pipeline import ScorePipeline, SCORE, SCORE_FIELDS, player_config
+from rendering import AlphaWarRenderer, PLAYER_COLORS
+from report import ReportWorker
+from score_worker import ScoreWorker
+from tug_of_war import TugOfWar, arena_teams, SCREEN_SIZE, PLAYER_1_RECT, PLAYER_2_RECT, ROPE_RECT
+from brainflow.board_shim import BoardIds
+import_time = time.perf_counter() - import_start
 
 # Set the board IDs and serial ports for the players
 player_1_name = 'Player 1'
 player_1_board_id = BoardIds.CYTON_BOARD.value #BoardIds.SYNTHETIC_BOARD.value #
-player_1_serial_port = 'COM' # Enter the COM port for the first player (i.e, 'COM7')
+player_1_serial_port = None # Enter the COM port for the first player (i.e, 'COM7'), or None to use the device registered for this player with COM Finder (auto-detected if none is registered)
+player_1_channels = None # Board rows used as EEG channels (i.e, [1, 2, 3, 4]), None uses all of the board's EEG channels
 
 
 player_2_name = 'Player 2'
 player_2_board_id = BoardIds.CYTON_BOARD.value #BoardIds.SYNTHETIC_BOARD.value 
-player_2_serial_port = 'COM' # Enter the COM port for the first player (i.e, 'COM9')
+player_2_serial_port = None # Enter the COM port for the second player (i.e, 'COM9'), or None to use the registered device
+player_2_channels = None # Board rows used as EEG channels, None uses all of the board's EEG channels
+
+# Arena mode: up to 6 more players, as player_config(name, board_id, serial_port, channels) entries. The players then
+# play as two teams, players 1, 3, 5, ... pulling left and players 2, 4, 6, ... pulling right, with the average score of
+# their team. Leave it empty for a game between two players.
+extra_players = [] # i.e, [player_config('Player 3', BoardIds.CYTON_BOARD.value), player_config('Player 4', BoardIds.CYTON_BOARD.value)]
 
 # Set the duration of each epoch in seconds
 epoch_duration = 2
 
+# Seconds between two rope updates. Each update scores the last epoch_duration seconds, so consecutive epochs overlap.
+# Set it to epoch_duration for one update per (non-overlapping) epoch.
+hop_duration = 0.25
+
+# Top speed of the rope in pixels per epoch_duration. It is pulled towards the side with the higher score, the harder the
+# larger the difference, and moves smoothly at the frame rate (see RopePhysics in tug_of_war.py)
+rope_speed = 30
+
+# Frames per second of the game loop (events and rendering keep running while data is acquired in the background)
+frame_rate = 60
+
+# Record both boards' raw data, markers and metadata to recordings/<date>_<time>/ (see recording.py to read it back)
+record_session = False
+recordings_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recordings')
+# After each game of a recorded session, save a report of each player's spectrogram and band power and of the rope's
+# margin to reports/ in the session folder (built in a background process, see report.py)
+game_reports = True
+
+# Measure the delay from each sample to the rope move and display, per board and stage, and save it as JSON at the end
+# (latency.json in the session folder when recording, recordings/latency_<date>_<time>.json otherwise)
+track_latency = False
+# Also insert a marker (value 3) into both boards' streams on every frame that moves the rope, to check offline
+latency_markers = False
+
+# Run the boards, filters and scoring in a separate worker process that hands the scores to the game through shared
+# memory (see score_worker.py), so rendering and signal processing don't compete for the interpreter
+use_worker_process = False
+
+# Broadcast the scores (and optionally the latest raw epochs) on a local socket for spectator screens and other demos,
+# e.g. ('127.0.0.1', 5760) or a Unix socket path, None to not broadcast. Run `python broadcast.py` to watch the stream.
+broadcast_address = None
+broadcast_windows = False
+broadcast_window_decimation = 4 # Samples averaged into one in the broadcast epochs
+
+# Score every board over the same interval: the boards are resampled onto a shared time grid from their BrainFlow
+# timestamps, so a board whose data arrives later than the others' isn't compared on older EEG (see alignment.py)
+align_boards = True
+
+# Filtering of the EEG before scoring (None disables either filter):
+notch_frequency = 60 # Mains frequency in Hz (50 in Europe and most of Asia)
+bandpass = (1, 45) # Passband in Hz, removes the DC offset, slow drifts and high-frequency noise
+
+# Calibration: before the first game, players without a saved baseline keep their eyes open, then closed, for
+# calibration_duration seconds each. The rope then moves on each player's scores z-scored against their own baseline,
+# so different headsets and heads play on equal terms. Baselines are saved per player name in baselines.json, so
+# returning players can skip the calibration (the game asks first, and C on the game over screen calibrates again).
+calibrate_players = True
+calibration_duration = 15 # Seconds of each calibration phase (eyes open, eyes closed)
+baseline_decay = None # Weight of each new score in the baseline during a game (e.g. 0.001 to follow slow drifts), None to weight all scores equally. A fast decay absorbs a player's lasting change and the rope stalls (check with simulate.py)
+
 # Method for normalizing alpha power.
 alpha_normalization = 'betaalpha'  
 # - 'max': Returns the sum of alpha power across channels, with each channel's alpha power normalized by the channel's maximum FFT power.
@@ -27,75 +96,266 @@ alpha_normalization = 'betaalpha'
 # - 'betaalpha': Returns the ratio of total beta power (12-30 Hz) to total alpha power (8-12 Hz) across all channels.
 
 
-pygame.init()
-# Initialize Pygame mixer
-pygame.mixer.init(frequency=20, size=-16, channels=2)
+def main(max_epochs=None, max_frames=None, stats=None):
+    """
+    Runs the game.
 
-def main(): 
-    # Set the font
-    pygame.font.init()
-    font = pygame.font.Font(None, 36)
-    alpha_font = pygame.font.Font(None, 28)
-    label_font = pygame.font.Font(None, 24)
+    Args:
+        max_epochs (int, optional): Quit after this many scored epochs per player. Defaults to None (play until quit).
+        max_frames (int, optional): Quit after this many frames of the game loop. Defaults to None (play until quit).
+        stats (PerfStats, optional): Collector for the timings of the loop (board setup, acquisition, DSP, render
+                                     and frame times). Defaults to None (no timings recorded).
+    """
+    main_start = time.perf_counter()
     winner = ''
-    width, height = 1440, 800
-    rope_width = 250
-    rope_height = 10
+    width, height = SCREEN_SIZE
+    rope_rect = pygame.Rect(ROPE_RECT)
 
+    # Set up the players and the rope
+    player1 = pygame.Rect(PLAYER_1_RECT)
+    player2 = pygame.Rect(PLAYER_2_RECT)
+
+    # Boards, acquisition, filters and band power of every player, in this process or in a worker process
+    players = [player_config(player_1_name, player_1_board_id, player_1_serial_port, player_1_channels),
+               player_config(player_2_name, player_2_board_id, player_2_serial_port, player_2_channels)] + list(extra_players)
+    if len(players) > len(PLAYER_COLORS):
+        raise ValueError(f"At most {len(PLAYER_COLORS)} players can play, got {len(players)}")
+    names = [player['name'] for player in players]
+    teams = arena_teams(len(players))
+    record_path = os.path.join(recordings_dir, time.strftime('%Y-%m-%d_%H-%M-%S')) if record_session else None
+    if use_worker_process:
+        scorer = ScoreWorker(players, epoch_duration, hop_duration, alpha_normalization, notch_frequency, bandpass,
+                             record_path=record_path, align_boards=align_boards, registry_path=DEFAULT_REGISTRY_PATH)
+    else:
+        scorer = ScorePipeline(players, epoch_duration, hop_duration, alpha_normalization, notch_frequency, bandpass,
+                               record_path=record_path, registry=DeviceRegistry(DEFAULT_REGISTRY_PATH), align_boards=align_boards)
+
+    # Reports of the recorded games, from a process started before any acquisition thread is running
+    reports = None
+    if record_path is not None and game_reports:
+        reports = ReportWorker()
+        reports.start()
+    # The scoring worker is forked here too, the connection thread below only waits for its boards
+    if use_worker_process:
+        scorer.launch()
+    def report_finished(finished):
+        for number, path, result in finished:
+            print(f"[Report] Game {number}: saved to {path} ({result:.1f} s)" if path else f"[Report] Game {number}: {result}")
+
+    # Connect the boards in the background while the window opens
+    connection = {}
+    def connect():
+        connect_start = time.perf_counter()
+        try:
+            scorer.start(stats)
+        except Exception as e:
+            connection['error'] = e
+        connection['time'] = time.perf_counter() - connect_start
+    connect_thread = threading.Thread(target=connect, name='Board connection', daemon=True)
+    connect_thread.start()
+
+    window_start = time.perf_counter()
+    pygame.init()
+    # Initialize Pygame mixer
+    pygame.mixer.init(frequency=20, size=-16, channels=2)
+    pygame.font.init()
     screen = pygame.display.set_mode((width, height))
     pygame.display.set_caption('Tug of War')
+    clock = pygame.time.Clock()
 
-    # Set up the players and the rope
-    player1 = pygame.Rect(100, 250, 10, 300)
-    player2 = pygame.Rect(1340, 250, 10, 300)
-    
-    board1 = BrainFlowBoardSetup(board_id=player_1_board_id, name=player_1_name, serial_port=player_1_serial_port)
-    board2 = BrainFlowBoardSetup(board_id=player_2_board_id, name=player_2_name, serial_port=player_2_serial_port)
-    
-    board1.setup()
-    board2.setup()
-    
-    if board1.is_streaming() and board2.is_streaming():
-        print('Both players connected')
-    else:
-        raise Exception('Error connecting both players')
-    
-    board1_srate = board1.get_sampling_rate()
-    board2_srate = board2.get_sampling_rate()
-    
-    samples_per_epoch1 = int(epoch_duration * board1_srate)
-    samples_per_epoch2 = int(epoch_duration * board2_srate)
-    
     # Display initial message
-    init_message = label_font.render("Initializing, please wait...", True, (0, 0, 0))
-
-    # Display the message on the screen
-    screen.fill((255, 255, 255))
-    message_rect = init_message.get_rect(center=(screen.get_width() // 2, screen.get_height() // 2))
-    screen.blit(init_message, message_rect)
-    # screen.blit(init_message, (50, 50))  # Adjust (50, 50) to your preferred position
-    pygame.display.flip()  # Update the display to show the message
-    
-    time.sleep(epoch_duration + 1)
-    print('Collecting data...')
-
-    # Variables to track the average alpha power and history
-    alpha_power1_sum = 0.0
-    alpha_power2_sum = 0.0
-    count = 0
-    history_length = 100  # Number of data points to display
-    alpha_history1 = []
-    alpha_history2 = []
+    history_length = 100  # Number of data points to display (thousands are fine, e.g. a full session)
+    score_label = 'Alpha Power (z)' if calibrate_players else 'Alpha Power'
+    renderer = AlphaWarRenderer(screen, [player1, player2], history_length,
+                                x_label=f"Epochs ({epoch_duration}s each, every {hop_duration}s)", y_label=score_label,
+                                rope_y=rope_rect.y, rope_height=rope_rect.height, player_colors=PLAYER_COLORS[:len(players)])
+    renderer.draw_message("Connecting to the boards, please wait...")
+    renderer.present()
+    window_time = time.perf_counter() - window_start
+    if stats is not None:
+        stats.add('window_setup', window_time)
+
+    # Keep the window responsive until the boards are connected (a quit is handled once they are)
+    while connect_thread.is_alive():
+        pygame.event.pump()
+        connect_thread.join(1 / frame_rate if frame_rate else 0.01)
+    if 'error' in connection:
+        pygame.quit()
+        raise connection['error']
+    print('Both players connected' if len(players) == 2 else f'All {len(players)} players connected')
+
+    # Spectator stream, sending never waits on the subscribers
+    publisher = None
+    if broadcast_address is not None:
+        publisher = ScorePublisher(broadcast_address, info={
+            'boards': names, 'fields': list(SCORE_FIELDS), 'normalize': alpha_normalization,
+            'epoch_duration': epoch_duration, 'hop_duration': hop_duration,
+            'sampling_rates': [get_board_sampling_rate(player['board_id']) for player in players],
+            'window_decimation': broadcast_window_decimation if broadcast_windows else None})
+
+    def broadcast(records):
+        for i, board_records in enumerate(records):
+            publisher.publish_scores(i, board_records)
+            if broadcast_windows and len(board_records):
+                publisher.publish_window(i, scorer.latest_window(i), broadcast_window_decimation)
+
+    def score_text(name, score, average, paused):
+        if paused is not None:
+            return f'{name}: paused ({paused})'
+        if score is None:
+            return f'{name} {score_label}: -'
+        return f'{name} {score_label}: {score:.2f} (Avg: {average:.2f})'
+
+    # Play starts as soon as every board holds a full epoch of valid data, while still handling window events
+    quit_game = False
+    warmup_start = time.perf_counter()
+    waiting = None
+    while not scorer.is_warm():
+        warm = scorer.warm_boards()
+        if warm != waiting:
+            waiting = warm
+            pending = [name for name, ready in zip(names, warm) if not ready]
+            renderer.draw_message(f"Collecting data from {', '.join(pending)}..." if pending else "Starting...")
+            renderer.present()
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                quit_game = True
+        if quit_game:
+            break
+        clock.tick(frame_rate)
+    warmup_time = time.perf_counter() - warmup_start
+    startup_time = time.perf_counter() - main_start
+    print(f"[Startup] Ready in {startup_time:.2f} s: window {window_time:.2f} s and boards and scoring setup {connection['time']:.2f} s "
+          f"(in parallel), then {warmup_time:.2f} s until every board had a full valid epoch "
+          f"(imports took {import_time:.2f} s before that)")
+    if stats is not None:
+        stats.add('warmup', warmup_time)
+        stats.add('startup', startup_time)
+    # Running for a fixed number of epochs or frames (e.g. benchmark.py) also starts the next game right away
+    fixed_length = max_epochs is not None or max_frames is not None
+    frames = 0
+
+    latency = LatencyTracker() if track_latency else None
+
+    def ask(message, keys):
+        # Shows a question until one of keys is pressed, returns it (None if the player quit)
+        renderer.draw_message(message)
+        renderer.present()
+        while True:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                    return None
+                if event.type == pygame.KEYDOWN and event.key in keys:
+                    return event.key
+            clock.tick(frame_rate)
+
+    def calibrate(indices):
+        # Runs the calibration phases and saves the new baselines of the players at indices, False if the player quit.
+        # A player without a usable baseline (too few scores or no spread, e.g. the board was flat, paused or
+        # reconnecting) is calibrated again or, if the players choose so, plays uncalibrated. Their baseline isn't saved
+        print(f"Calibrating {', '.join(names[i] for i in indices)}")
+        calibration = Calibration(names, calibration_duration, settle_time=epoch_duration)
+        scorer.restart()
+        scorer.mark('calibration start', details={'players': [names[i] for i in indices], 'duration': calibration_duration})
+        calibration.start()
+        shown_message = None
+        while not calibration.is_done():
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                    scorer.mark('calibration end')
+                    return False
+            records = scorer.read()
+            if publisher is not None:
+                broadcast(records)
+            for i, board_records in enumerate(records):
+                calibration.add(i, board_records[:, SCORE])
+            message = calibration.message()
+            if message != shown_message:
+                renderer.draw_message(message)
+                shown_message = message
+            renderer.present()
+            clock.tick(frame_rate)
+        scorer.mark('calibration end')
+
+        failed = []
+        for i in indices:
+            baseline = calibration.baselines[i]
+            if not baseline.spread_known:
+                print(f"[{names[i]}] Warning: calibration failed ({baseline.count} scores, std {baseline.std:.3g}), baseline not saved")
+                failed.append(i)
+                continue
+            print(f"[{names[i]}] Baseline: {baseline.mean:.3f} +/- {baseline.std:.3f} over {baseline.count} scores")
+            baseline_store.put(names[i], keys[i], baseline, phases=calibration.phase_stats[i], save=False)
+            baseline.decay = baseline_decay
+            baselines[i] = baseline
+        baseline_store.save()
+
+        if failed:
+            answer = pygame.K_RETURN
+            if not fixed_length:
+                answer = ask(f"Calibration failed for {', '.join(names[i] for i in failed)}: press C to calibrate them "
+                             f"again, or Enter to play without their baseline", (pygame.K_RETURN, pygame.K_KP_ENTER, pygame.K_c))
+            if answer is None:
+                return False
+            if answer == pygame.K_c:
+                return calibrate(failed)
+            for i in failed:
+                # An empty baseline z-scores to 0 until it has followed the player for a few scores of each game
+                print(f"[{names[i]}] Playing without a baseline")
+                baselines[i] = RunningStats(decay=baseline_decay)
+        return True
+
+    # Baseline of each player: a saved one if the players at the boards confirm it is theirs (baselines are saved
+    # by player name, which may be a previous player's), or calibrated now
+    baselines = None
+    if calibrate_players:
+        baseline_store = BaselineStore()
+        keys = [baseline_key(player['board_id'], alpha_normalization, epoch_duration, hop_duration, notch_frequency, bandpass)
+                for player in players]
+        baselines = [baseline_store.get(name, key, decay=baseline_decay) for name, key in zip(names, keys)]
+        saved = [i for i, baseline in enumerate(baselines) if baseline is not None]
+        if saved and not quit_game and not fixed_length:
+            answer = ask(f"Saved baselines found for {', '.join(names[i] for i in saved)}: press Enter to use them, "
+                         f"or C to calibrate again", (pygame.K_RETURN, pygame.K_KP_ENTER, pygame.K_c))
+            if answer is None:
+                quit_game = True
+            elif answer == pygame.K_c:
+                baselines = [None] * len(players)
+        for i, baseline in enumerate(baselines):
+            if baseline is not None and not quit_game:
+                print(f"[{names[i]}] Using the saved baseline, skipping calibration")
+
+        missing = [i for i, baseline in enumerate(baselines) if baseline is None]
+        if missing and not quit_game:
+            quit_game = not calibrate(missing)
+
+    # Scores, averages, history and rope of both players
+    game = TugOfWar([player1, player2], rope_rect, rope_speed,
+                    hop_duration, epoch_duration, history_length, names=names, baselines=baselines, teams=teams)
 
     # Game loop
-    quit_game = False
+    game_number = 0
     while not quit_game:
         print('Starting game loop')
-        speed = 30
-        rope = pygame.Rect(595, 400, rope_width, rope_height)
+        game.reset()
+        game_number += 1
+        game_rounds = game.count
+        margin_times, margin_values = [0.0], [0.0]
+
+        # Start each game from the latest full epoch of each board
+        scorer.restart()
+
+        renderer.reset()
+        # The baselines and teams of the game are kept with the recording, so replay.py plays it by the same rules
+        scorer.mark('game start', value=1, details={
+            'teams': teams, 'baseline_decay': baseline_decay, 'baseline_keys': keys if calibrate_players else None,
+            'baselines': None if game.calibrated_baselines is None else [baseline.to_dict() for baseline in game.calibrated_baselines]})
 
         running = True
+        last_advance = game_start = time.perf_counter()
+        shown_paused = None
         while running:
+            frame_start = time.perf_counter()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
@@ -104,133 +364,100 @@ def main():
                     if event.key == pygame.K_ESCAPE:
                         running = False
                         quit_game = True
-            pygame.display.flip()
-            try:
-                data1 = board1.get_current_board_data(samples_per_epoch1)[1:9, :] 
-                data2 = board2.get_current_board_data(samples_per_epoch2)[1:9, :] 
-                time.sleep(epoch_duration)  
-            except:
-                print("Couldn't read data...")
-
-            if data1.size and data2.size: 
-                alpha_power1 = calculate_alpha_power(data1, player_1_board_id, normalize=alpha_normalization)
-                alpha_power2 = calculate_alpha_power(data2, player_2_board_id, normalize=alpha_normalization)
-
-                # Update cumulative sum and count for averages
-                alpha_power1_sum += alpha_power1
-                alpha_power2_sum += alpha_power2
-                count += 1
-
-                # Calculate averages
-                avg_alpha_power1 = alpha_power1_sum / count
-                avg_alpha_power2 = alpha_power2_sum / count
-
-                # Update alpha power history
-                if len(alpha_history1) >= history_length:
-                    alpha_history1.pop(0)
-                    alpha_history2.pop(0)
-                alpha_history1.append(alpha_power1)
-                alpha_history2.append(alpha_power2)
-
-                # Rope movement based on alpha power difference
-                diff = int(alpha_power2 > alpha_power1) * 2 - 1
-                rope.move_ip(diff * speed, 0)
-                pygame.display.flip()
-
-                # Clear screen
-                screen.fill((255, 255, 255))
-                
-                # Draw the rope and players
-                pygame.draw.rect(screen, (0, 0, 0), rope)
-                pygame.draw.rect(screen, (255, 0, 0), player1)
-                pygame.draw.rect(screen, (0, 0, 255), player2)
-
-                # Line graph for alpha power history
-                graph_x_start = 200
-                graph_y_start = 650
-                graph_width = 1000
-                graph_height = 100
-
-                # Draw background for the graph
-                pygame.draw.rect(screen, (230, 230, 230), (graph_x_start, graph_y_start, graph_width, graph_height))
-
-                # Draw x-axis and y-axis
-                pygame.draw.line(screen, (0, 0, 0), (graph_x_start, graph_y_start + graph_height), (graph_x_start + graph_width, graph_y_start + graph_height), 2)  # x-axis
-                pygame.draw.line(screen, (0, 0, 0), (graph_x_start, graph_y_start), (graph_x_start, graph_y_start + graph_height), 2)  # y-axis
-
-                # Check if we have enough data points to plot the graph
-                if len(alpha_history1) >= 2 and len(alpha_history2) >= 2:
-                    
-                    # Determine dynamic max_alpha and min_alpha based on data, rounded to ensure integer values
-                    min_alpha = int(min(min(alpha_history1), min(alpha_history2)) - 2)
-                    # max_alpha = int(max(max(alpha_history1), max(alpha_history2)) * 1.1)  # Add 10% buffer above
-                    raw_max_alpha = max(max(alpha_history1), max(alpha_history2)) * 1.1  # Add 10% buffer above the maximum data point
-                    max_alpha = int(np.ceil(raw_max_alpha))  # Round up to the nearest integer
-
-
-                    # Ensure integer tick interval
-                    tick_interval = max(1, (max_alpha - min_alpha) // 4)  # Choose an interval to divide the range into 4 or more ticks
-
-                    max_alpha = min_alpha + (tick_interval * 4)
-                    
-                    # Scale the points for each player's alpha power history
-                    points1 = [(graph_x_start + i * (graph_width // history_length), graph_y_start + graph_height - int(((alpha - min_alpha) / (max_alpha - min_alpha)) * graph_height)) for i, alpha in enumerate(alpha_history1)]
-                    points2 = [(graph_x_start + i * (graph_width // history_length), graph_y_start + graph_height - int(((alpha - min_alpha) / (max_alpha - min_alpha)) * graph_height)) for i, alpha in enumerate(alpha_history2)]
-
-                    # Draw lines for both players' alpha power history
-                    pygame.draw.lines(screen, (255, 0, 0), False, points1, 2)
-                    pygame.draw.lines(screen, (0, 0, 255), False, points2, 2)
-
-                    # Add y-axis labels and tick marks
-                    for i in range(5):
-                        # y_value = min_alpha + (max_alpha - min_alpha) * (i / 4)
-                        y_value = min_alpha + (tick_interval * i)
-                        y_position = graph_y_start + graph_height - int(((y_value - min_alpha) / (max_alpha - min_alpha)) * graph_height)
-                        tick_label = label_font.render(f"{y_value:.1f}", True, (0, 0, 0))
-                        screen.blit(tick_label, (graph_x_start - 40, y_position - tick_label.get_height() // 2))
-                        pygame.draw.line(screen, (0, 0, 0), (graph_x_start - 5, y_position), (graph_x_start, y_position), 2)
-
-                    # Add x-axis labels and tick marks for epochs (starting from 0 on the left and incrementing by 5)
-                    for i in range(0, history_length, 5):
-                        x_position = graph_x_start + i * (graph_width // history_length)
-                        tick_label = label_font.render(f"{i}", True, (0, 0, 0))
-                        screen.blit(tick_label, (x_position - tick_label.get_width() // 2, graph_y_start + graph_height + 5))
-                        pygame.draw.line(screen, (0, 0, 0), (x_position, graph_y_start + graph_height), (x_position, graph_y_start + graph_height + 5), 2)
-
-                # Add x-axis label
-                x_label = label_font.render(f"Epochs ({epoch_duration}s each)", True, (0, 0, 0))
-                screen.blit(x_label, (graph_x_start + graph_width // 2 - x_label.get_width() // 2, graph_y_start + graph_height + 25))
-
-                # Add y-axis label
-                y_label = label_font.render("Alpha Power", True, (0, 0, 0))
-                screen.blit(y_label, (graph_x_start - 155, graph_y_start + graph_height // 2 - y_label.get_height() // 2))
-                
-                center_offset = 300  # Distance from the center
-                bar_max_width = 300  # Maximum width for the bars
-                
-                # Display current and average alpha power values
-                alpha_text1 = alpha_font.render(f'{board1.get_board_name()} Alpha Power: {alpha_power1:.2f} (Avg: {avg_alpha_power1:.2f})', True, (255, 0, 0))
-                alpha_text2 = alpha_font.render(f'{board2.get_board_name()} Alpha Power: {alpha_power2:.2f} (Avg: {avg_alpha_power2:.2f})', True, (0, 0, 255))
-                screen.blit(alpha_text1, ((width // 2) - center_offset - bar_max_width, 70))
-                screen.blit(alpha_text2, ((width // 2) + 200, 70))
-
-                pygame.display.flip()
-
-                # Check if the rope has completely passed one of the player markers
-                if rope.right < player1.left or rope.left > player2.right:
-                    winner = 'Player 1' if rope.right < player1.left else 'Player 2'
-                    running = False
-                    pygame.display.flip()
-
-                if not running:
-                    text = font.render('Game Over! ' + winner + ' is the winner.', True, (0, 0, 0))
-                    screen.blit(text, (200, 200)) 
-                    text2 = font.render('Press space to play again or escape to quit.', True, (0, 0, 0))
-                    screen.blit(text2, (200, 250))
-                pygame.display.flip()
 
-        # Game over, wait for user to press space to play again or escape to quit
-        game_over = True
+            # Scores of the samples received since the last frame, each board produces a score every hop
+            records = scorer.read(stats)
+            scores = [board_records[:, SCORE].tolist() for board_records in records]
+            if publisher is not None:
+                broadcast(records)
+
+            # Follow each score from the timestamp of the newest sample of its window
+            tags = None
+            if latency is not None:
+                tags = [[latency.start(name, **{field: None if np.isnan(value) else float(value)
+                                                for field, value in zip(SCORE_FIELDS[1:], record[1:])})
+                         for record in board_records] for name, board_records in zip(names, records)]
+
+            # Players whose board is unhealthy or reconnecting sit out, the others keep playing
+            paused = scorer.paused_boards()
+            for i, reason in enumerate(paused):
+                if (reason is not None) != game.paused[i]:
+                    game.set_paused(i, reason is not None)
+
+            # Each round of scores (one score of every unpaused player) sets the force on the rope
+            updates = 0
+            if running:
+                updates = game.push_all(scores, max_updates=None if max_epochs is None else max_epochs - game.count, tags=tags)
+            moved = [tag for round_tags in game.applied_tags for tag in round_tags] if updates and latency is not None else []
+            if moved:
+                latency.stamp(moved, 'rope')
+            if updates and latency_markers:
+                scorer.insert_marker(ROPE_MARKER)
+            if stats is not None:
+                stats.count('epochs', updates)
+            if max_epochs is not None and game.count >= max_epochs:
+                running = False
+                quit_game = True
+
+            # Move the rope by the time since the last frame, in fixed physics ticks that each check for a winner
+            rope_moved = game.advance(frame_start - last_advance)
+            last_advance = frame_start
+            if rope_moved and reports is not None:
+                margin_times.append(frame_start - game_start)
+                margin_values.append(game.margin())
+            if game.winner is not None:
+                winner = game.winner
+                running = False
+
+            # Redraw only what changed since the last frame
+            render_start = time.perf_counter()
+            if rope_moved:
+                renderer.draw_rope(game.rope)
+            if updates:
+                renderer.draw_graph(game.history)
+            if updates or paused != shown_paused:
+                renderer.draw_scores([score_text(*player) for player in zip(names, game.scores, game.averages, paused)])
+                shown_paused = paused
+            if game.winner is not None:
+                renderer.draw_game_over(winner, recalibrate=calibrate_players)
+
+            # Single display update per frame, then wait for the next frame
+            renderer.present()
+            render_end = time.perf_counter()
+            if moved:
+                latency.stamp(moved, 'display')
+                for record in moved:
+                    latency.finish(record)
+            clock.tick(frame_rate)
+
+            frames += 1
+            if max_frames is not None and frames >= max_frames:
+                running = False
+                quit_game = True
+            if stats is not None:
+                stats.count('frames')
+                stats.add('render', render_end - render_start)
+                stats.add('frame_work', render_end - frame_start)
+                stats.add('frame_time', time.perf_counter() - frame_start)
+                # Age of the newest sample of each scored window when the loop read it (BrainFlow timestamps are UNIX time in seconds)
+                for board_records in records:
+                    for age in board_records[:, SCORE_FIELDS.index('read')] - board_records[:, SCORE_FIELDS.index('sample_time')]:
+                        stats.add('acquisition_latency', age)
+                    # Distance between the board's own timestamps and the common end of the windows scored together
+                    for error in board_records[:, SCORE_FIELDS.index('alignment_error')]:
+                        if np.isfinite(error):
+                            stats.add('alignment_error', abs(error))
+
+        scorer.mark('quit' if quit_game else f'{winner} won', value=2)
+        if reports is not None and game.count > game_rounds:
+            reports.submit(record_path, game_number, {
+                'names': names, 'teams': teams, 'winner': game.winner, 'channels': [player['channels'] for player in players],
+                'epoch_duration': epoch_duration, 'hop_duration': hop_duration, 'notch_frequency': notch_frequency,
+                'bandpass': bandpass, 'margin': {'times': margin_times, 'values': margin_values}})
+
+        # Game over, wait for user to press space to play again (C to calibrate every player first) or escape to quit
+        game_over = not fixed_length
+        recalibrate = False
         while game_over and not quit_game:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
@@ -242,10 +469,33 @@ def main():
                         quit_game = True
                     elif event.key == pygame.K_SPACE:
                         game_over = False
-
-    board1.stop()
-    board2.stop()
+                    elif event.key == pygame.K_c and calibrate_players:
+                        game_over = False
+                        recalibrate = True
+            if reports is not None:
+                report_finished(reports.poll())
+            clock.tick(frame_rate)
+        if recalibrate and not quit_game:
+            quit_game = not calibrate(list(range(len(players))))
+            game.calibrated_baselines = baselines
+
+    if latency is not None:
+        latency.report()
+        if record_path is not None:
+            latency_path = os.path.join(record_path, 'latency.json')
+        else:
+            os.makedirs(recordings_dir, exist_ok=True)
+            latency_path = os.path.join(recordings_dir, f"latency_{time.strftime('%Y-%m-%d_%H-%M-%S')}.json")
+        latency.export(latency_path)
+        print(f"Latency saved to {latency_path}")
+    if publisher is not None:
+        publisher.close()
+    # Stops acquiring, closes the recording and releases both boards (in the worker process when there is one)
+    scorer.stop()
     pygame.quit()
+    if reports is not None:
+        # The recording is closed, so the last game is fully written for its report
+        report_finished(reports.close())
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -1,8 +1,12 @@
+import argparse
 import serial.tools.list_ports
+from brainflow.board_shim import BoardIds
+from device_registry import DeviceRegistry
 
-def list_all_com_ports():
+def list_all_com_ports(registry=None):
     """
     Lists all available COM ports with detailed information.
+    If a registry is given, also shows which player each registered port belongs to.
     """
     ports = list(serial.tools.list_ports.comports())
     if not ports:
@@ -15,7 +19,43 @@ def list_all_com_ports():
             print(f" - Manufacturer: {getattr(port, 'manufacturer', 'N/A')}")
             print(f" - VID:PID: {getattr(port, 'vid', 'N/A')}:{getattr(port, 'pid', 'N/A')}")
             print(f" - HWID: {port.hwid}")
+            if registry is not None:
+                players = [device['player'] for device in registry.devices if registry.matches(device, port)]
+                print(f" - Registered to: {', '.join(players) if players else 'N/A'}")
             print("")
 
-# Run this function to get a detailed list of COM port information
-list_all_com_ports()
+def show_registry(registry):
+    """
+    Prints every device in the registry.
+    """
+    if not registry.devices:
+        print(f"No devices registered in {registry.path}.")
+    for device in registry.devices:
+        print(f"{device['player']}: board {device['board_id']}, last seen on {device['last_port']} "
+              f"(Serial Number: {device['serial_number']}, VID:PID: {device['vid_pid']})")
+
+# Run this script to get a detailed list of COM port information.
+# To remember which dongle belongs to which player (so AlphaWar finds it without a serial port in its config):
+#   python "COM Finder.py" --register "Player 1" --port COM7
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='List COM ports and manage the AlphaWar device registry.')
+    parser.add_argument('--register', metavar='PLAYER', help="Player slot to assign the port to, e.g. 'Player 1'.")
+    parser.add_argument('--port', help="Port to register, e.g. 'COM7'.")
+    parser.add_argument('--board-id', type=int, default=BoardIds.CYTON_BOARD.value, help='BrainFlow board ID of the board behind the dongle (default: Cyton).')
+    parser.add_argument('--forget', metavar='PLAYER', help='Player slot to remove from the registry.')
+    parser.add_argument('--show', action='store_true', help='Print the registered devices.')
+    args = parser.parse_args()
+
+    registry = DeviceRegistry()
+    if args.register:
+        if not args.port:
+            parser.error('--register requires --port')
+        device = registry.register(args.port, args.register, args.board_id)
+        print(f"Registered {device['last_port']} (Serial Number: {device['serial_number']}) as {device['player']}.")
+    elif args.forget:
+        registry.forget(args.forget)
+        print(f"Removed {args.forget} from the registry.")
+    elif args.show:
+        show_registry(registry)
+    else:
+        list_all_com_ports(registry)
@@ -0,0 +1,402 @@
+import threading
+import time
+from collections import deque
+import numpy as np
+
+###################
+# This file holds the acquisition subsystem for Alpha-war: a fixed-size ring buffer for board samples, a worker per
+# BrainFlowBoardSetup that keeps it filled, and a scheduler draining every board from a single thread, so the game
+# loop never has to sleep while data arrives. The ring buffer can keep only the rows the game reads (e.g. the EEG
+# channels and the timestamp), and its reads copy into buffers owned by the caller, so reading the boards allocates
+# nothing once the game runs.
+###################
+class SampleRingBuffer:
+    """
+    A fixed-capacity, thread-safe ring buffer holding the most recent samples of a board (all rows).
+
+    Attributes:
+        num_rows (int): Number of rows (BrainFlow channels) stored per sample.
+        capacity (int): Maximum number of samples kept in the buffer.
+        total_written (int): Number of samples written since creation (never wraps).
+    """
+
+    def __init__(self, num_rows, capacity):
+        """
+        Initializes the ring buffer.
+
+        Args:
+            num_rows (int): Number of rows (BrainFlow channels) stored per sample.
+            capacity (int): Maximum number of samples kept in the buffer.
+        """
+        self.num_rows = num_rows
+        self.capacity = capacity
+        self.total_written = 0
+        self._data = np.zeros((num_rows, capacity))
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """
+        Returns:
+            int: Number of valid samples currently held (at most capacity).
+        """
+        return min(self.total_written, self.capacity)
+
+    def write(self, chunk):
+        """
+        Appends a chunk of samples, overwriting the oldest samples once the buffer is full.
+
+        Args:
+            chunk (numpy.ndarray): Array of shape (num_rows, n_samples), as returned by get_board_data().
+        """
+        n = chunk.shape[1]
+        if n == 0:
+            return
+        if n > self.capacity:
+            # Only the newest samples can fit, drop the rest but keep the sample count honest
+            skipped = n - self.capacity
+            chunk = chunk[:, skipped:]
+            n = self.capacity
+        else:
+            skipped = 0
+
+        with self._lock:
+            start = (self.total_written + skipped) % self.capacity
+            first = min(n, self.capacity - start)
+            self._data[:, start:start + first] = chunk[:, :first]
+            if first < n:
+                self._data[:, :n - first] = chunk[:, first:]
+            self.total_written += skipped + n
+
+    def _copy(self, position, n, out, rows):
+        """
+        Copies n samples from a position still held by the buffer into out (the caller holds the lock).
+        """
+        first = position % self.capacity
+        head = min(n, self.capacity - first)
+        out[:, :head] = self._data[rows, first:first + head]
+        out[:, head:n] = self._data[rows, :n - head]
+
+    def latest(self, num_samples, out=None, rows=slice(None)):
+        """
+        Copies the most recent num_samples samples, in chronological order.
+
+        Args:
+            num_samples (int): Number of samples to return.
+            out (numpy.ndarray, optional): Preallocated array of shape (n_rows, num_samples) to copy into.
+            rows (slice, optional): Rows to copy. Defaults to every row.
+
+        Returns:
+            numpy.ndarray: The latest samples, or None if fewer than num_samples have been written.
+        """
+        if num_samples > self.capacity:
+            raise ValueError(f"Requested {num_samples} samples but the buffer only holds {self.capacity}.")
+        if out is None:
+            out = np.empty((len(range(self.num_rows)[rows]), num_samples))
+
+        with self._lock:
+            if self.total_written < num_samples:
+                return None
+            self._copy(self.total_written - num_samples, num_samples, out, rows)
+        return out
+
+    def read_since(self, position, max_samples=None, out=None):
+        """
+        Copies every sample written after a given position, for consumers that process each sample once.
+
+        Args:
+            position (int): Value of total_written at the previous read (0 to read from the start).
+            max_samples (int, optional): Read at most this many samples, the rest is left for the next call.
+            out (numpy.ndarray, optional): Preallocated array of shape (num_rows, capacity) to copy into, reused
+                                           between calls. At most its number of columns is read.
+
+        Returns:
+            tuple: The new samples (numpy.ndarray of shape (num_rows, n_new), a view of out when given) and the
+                   position to pass to the next call. If the buffer wrapped past position, only the samples still
+                   held are returned.
+        """
+        if out is not None:
+            max_samples = out.shape[1] if max_samples is None else min(max_samples, out.shape[1])
+        with self._lock:
+            start = max(position, self.total_written - self.capacity)
+            total = self.total_written if max_samples is None else min(self.total_written, start + max_samples)
+            n = total - start
+            out = np.empty((self.num_rows, n)) if out is None else out[:, :n]
+            self._copy(start, n, out, slice(None))
+        return out, total
+
+
+class BoardAcquisition:
+    """
+    Background worker that drains a BrainFlowBoardSetup with get_board_data() into a SampleRingBuffer.
+
+    The game loop reads windows from the ring buffer with latest_window() which never blocks on the board,
+    so event handling and rendering keep running at the frame rate.
+
+    Attributes:
+        board (BrainFlowBoardSetup): The board being drained. It must already be set up and streaming.
+        buffer (SampleRingBuffer): Ring buffer holding the most recent samples of every board row.
+        poll_interval (float): Seconds to wait between two drains of the board.
+        read_errors (int): Number of reads that raised an exception.
+        sinks (list): Objects whose write(chunk) method receives every chunk drained from the board (e.g. a recorder).
+        rows (numpy.ndarray): Board rows kept in the ring buffer, in this order (None for every row).
+    """
+
+    def __init__(self, board, window_samples, poll_interval=0.02, buffer_seconds=10, rows=None):
+        """
+        Initializes the acquisition worker for a board.
+
+        Args:
+            board (BrainFlowBoardSetup): A board that is set up and streaming.
+            window_samples (int): Largest window (in samples) the game will request. The ring buffer is at least twice this size.
+            poll_interval (float, optional): Seconds between two drains of the board. Defaults to 0.02.
+            buffer_seconds (float, optional): Seconds of data to keep in the ring buffer. Defaults to 10.
+            rows (list, optional): Board rows to keep in the ring buffer, in this order (e.g. the EEG channels and the
+                                   timestamp). The sinks still receive every row. Defaults to every row.
+        """
+        self.board = board
+        self.window_samples = window_samples
+        self.poll_interval = poll_interval
+        self.rows = None if rows is None else np.asarray(rows, dtype=np.intp)
+        if self.rows is not None and (self.rows.min() < 0 or self.rows.max() >= board.get_num_rows()):
+            raise ValueError(f"Rows {rows} aren't rows of the board ({board.get_num_rows()} rows)")
+        num_rows = board.get_num_rows() if rows is None else len(self.rows)
+        capacity = max(2 * window_samples, int(buffer_seconds * board.get_sampling_rate()))
+        self.buffer = SampleRingBuffer(num_rows, capacity)
+        self._staging = np.empty(0)  # Kept rows of the last drain, grown when a drain is larger
+        self.read_errors = 0
+        self._failing = False
+        self.sinks = []
+        self._drain_log = deque(maxlen=512)  # (total samples after a drain, UNIX time of the drain)
+        self._drain_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the background drain thread. Calling start() on a running worker does nothing.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"{self.board.get_board_name()} acquisition", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        """
+        Stops the background drain thread. The board itself keeps streaming, use board.stop() to release it.
+
+        Args:
+            timeout (float, optional): Seconds to wait for the thread to finish. Defaults to 1.0.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def is_running(self):
+        """
+        Returns:
+            bool: True if the drain thread is alive.
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        """
+        Drain loop executed by the worker thread.
+        """
+        while not self._stop_event.is_set():
+            self.poll()
+            self._stop_event.wait(self.poll_interval)
+
+    def poll(self):
+        """
+        Drains everything the board has accumulated since the last call into the ring buffer.
+
+        Returns:
+            int: The number of new samples written.
+        """
+        try:
+            data = self.board.get_board_data()
+        except Exception as e:
+            self.read_errors += 1
+            if not self._failing:
+                # Only the first error of a series, the board's health monitor decides what to do about it
+                print(f"[{self.board.get_board_name()}] Couldn't read data: {e}")
+                self._failing = True
+            return 0
+        self._failing = False
+        if data is None or data.size == 0:
+            return 0
+        self.buffer.write(data if self.rows is None else self._select_rows(data))
+        with self._drain_lock:
+            self._drain_log.append((self.buffer.total_written, time.time()))
+        for sink in self.sinks:
+            sink.write(data)
+        return data.shape[1]
+
+    def _select_rows(self, data):
+        """
+        Copies the kept rows of a drained chunk (only the samples the ring buffer can hold) into the staging buffer,
+        which is reused from one drain to the next.
+        """
+        data = data[:, -self.buffer.capacity:]
+        size = len(self.rows) * data.shape[1]
+        if self._staging.size < size:
+            self._staging = np.empty(2 * size)
+        # A contiguous out lets take() write straight into it, the rows were checked in __init__
+        chunk = self._staging[:size].reshape(len(self.rows), data.shape[1])
+        return np.take(data, self.rows, axis=0, out=chunk, mode='clip')
+
+    def add_sink(self, sink):
+        """
+        Registers an object that receives every chunk drained from the board, in order. Its write(chunk) method is
+        called from the drain thread, so it should hand the chunk off instead of doing slow work (e.g. disk writes).
+
+        Args:
+            sink: Object with a write(chunk) method taking a (num_rows, n_samples) array.
+        """
+        self.sinks.append(sink)
+
+    def drain_time(self, position):
+        """
+        Returns when a sample was drained from the board, i.e. when the game could first have seen it.
+
+        Args:
+            position (int): Position of the sample (counted like total_samples).
+
+        Returns:
+            float: UNIX time of the drain that received the sample, or None if it is too old to be in the log.
+        """
+        with self._drain_lock:
+            drained = None
+            for end, drain_time in reversed(self._drain_log):
+                if end <= position:
+                    return drained
+                drained = drain_time
+            # Older than every logged drain: only known if the log still holds the first drain
+            return drained if len(self._drain_log) < self._drain_log.maxlen else None
+
+    @property
+    def total_samples(self):
+        """
+        int: Number of samples received from the board since the worker was created.
+        """
+        return self.buffer.total_written
+
+    def has_full_window(self, num_samples=None):
+        """
+        Checks if the ring buffer holds a complete window.
+
+        Args:
+            num_samples (int, optional): Window length in samples. Defaults to window_samples.
+
+        Returns:
+            bool: True if at least num_samples samples have been received.
+        """
+        return self.buffer.total_written >= (num_samples or self.window_samples)
+
+    def latest_window(self, num_samples=None, out=None, rows=slice(None)):
+        """
+        Returns the latest complete window without blocking on the board.
+
+        Args:
+            num_samples (int, optional): Window length in samples. Defaults to window_samples.
+            out (numpy.ndarray, optional): Preallocated array to copy the window into.
+            rows (slice, optional): Rows of the ring buffer to copy. Defaults to every row.
+
+        Returns:
+            numpy.ndarray: Array of shape (n_rows, num_samples), or None if the window isn't complete yet.
+        """
+        return self.buffer.latest(num_samples or self.window_samples, out=out, rows=rows)
+
+    def read_since(self, position, max_samples=None, out=None):
+        """
+        Returns every sample received after a given position without blocking on the board.
+
+        Args:
+            position (int): Position returned by the previous call (0 to read from the start).
+            max_samples (int, optional): Read at most this many samples, the rest is left for the next call.
+            out (numpy.ndarray, optional): Preallocated array to copy into, see SampleRingBuffer.read_since().
+
+        Returns:
+            tuple: The new samples (numpy.ndarray of shape (num_rows, n_new)) and the position to pass to the next call.
+        """
+        return self.buffer.read_since(position, max_samples, out)
+
+
+class AcquisitionScheduler:
+    """
+    Single background thread draining several BoardAcquisition workers in turn, instead of one thread per board.
+
+    Every tick polls each board once, so adding players adds one get_board_data() call per tick, not a thread
+    competing for the interpreter.
+
+    Attributes:
+        acquisitions (list): The BoardAcquisition of every board (their own threads are not started).
+        poll_interval (float): Seconds between two ticks.
+        ticks (int): Number of ticks run.
+    """
+
+    def __init__(self, acquisitions, poll_interval=0.02):
+        """
+        Initializes the scheduler.
+
+        Args:
+            acquisitions (list): The BoardAcquisition of every board.
+            poll_interval (float, optional): Seconds between two ticks. Defaults to 0.02.
+        """
+        self.acquisitions = acquisitions
+        self.poll_interval = poll_interval
+        self.ticks = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the drain thread. Calling start() on a running scheduler does nothing.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='Acquisition scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        """
+        Stops the drain thread. The boards keep streaming.
+
+        Args:
+            timeout (float, optional): Seconds to wait for the thread to finish. Defaults to 1.0.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def is_running(self):
+        """
+        Returns:
+            bool: True if the drain thread is alive.
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def poll(self):
+        """
+        Drains every board once.
+
+        Returns:
+            int: The number of new samples written, over all boards.
+        """
+        self.ticks += 1
+        return sum(acquisition.poll() for acquisition in self.acquisitions)
+
+    def _run(self):
+        """
+        Drain loop executed by the scheduler thread, keeping a steady tick rate whatever the number of boards.
+        """
+        next_tick = time.perf_counter()
+        while not self._stop_event.is_set():
+            self.poll()
+            next_tick = max(next_tick + self.poll_interval, time.perf_counter())
+            self._stop_event.wait(next_tick - time.perf_counter())
+
@@ -0,0 +1,113 @@
+from collections import deque
+import numpy as np
+
+###################
+# This file holds the time alignment of Alpha-war's boards. BrainFlow stamps every sample with the time it reached
+# the computer, so two boards read the same number of samples at the same moment don't cover the same interval: each
+# has its own transport delay, and drops or bursts shift one against the other. A BoardClock per board maps its sample
+# positions to time from these timestamps, and resample() interpolates each board onto a shared time grid, so every
+# player is scored over the same interval (see ScorePipeline).
+###################
+class BoardClock:
+    """
+    Maps the sample positions of a board (counted like BoardAcquisition.total_samples) to time.
+
+    The board samples at a steady rate, but its BrainFlow timestamps jitter with the transport (the Cyton's dongle
+    delivers packets in bursts). Sample p is taken at offset + p / rate, offset being the earliest arrival of the last
+    fit_seconds of samples (the least delayed ones, which also follows a slow drift of the board's clock and recovers
+    from lost samples within fit_seconds).
+
+    Attributes:
+        rate (float): Sampling rate of the board.
+        offset (float): Time of sample position 0, None until the first timestamps.
+        seen (int): Position after the newest sample fitted.
+    """
+
+    def __init__(self, rate, fit_seconds=2.0):
+        """
+        Initializes the clock.
+
+        Args:
+            rate (float): Sampling rate of the board.
+            fit_seconds (float, optional): Seconds of samples the offset is fitted over. Defaults to 2.0.
+        """
+        self.rate = rate
+        self.fit_samples = max(1, int(fit_seconds * rate))
+        self._ramp = np.empty(0)  # position / rate of the samples of a chunk, and a scratch array of the same size
+        self._work = np.empty(0)
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the fitted offset (e.g. after a reconnect, whose timestamps don't follow the previous ones).
+        """
+        self.offset = None
+        self.seen = 0
+        self._fits = deque()  # (position after the chunk, earliest offset of the chunk)
+
+    def update(self, start, timestamps):
+        """
+        Fits the offset to the timestamps of new samples.
+
+        Args:
+            start (int): Position of the first sample.
+            timestamps (numpy.ndarray): BrainFlow timestamps of the samples from start on.
+        """
+        n = len(timestamps)
+        if n == 0:
+            return
+        if len(self._ramp) < n:
+            self._ramp = np.arange(max(n, 2 * len(self._ramp))) / self.rate
+            self._work = np.empty(len(self._ramp))
+        # Earliest timestamp - position / rate of the chunk, fmin skipping missing (NaN) timestamps
+        earliest = float(np.fmin.reduce(np.subtract(timestamps, self._ramp[:n], out=self._work[:n]))) - start / self.rate
+        if not np.isfinite(earliest):
+            return
+        end = start + n
+        self._fits.append((end, earliest))
+        self.seen = max(self.seen, end)
+        while self._fits[0][0] < self.seen - self.fit_samples:
+            self._fits.popleft()
+        self.offset = min(offset for _, offset in self._fits)
+
+    def time(self, position):
+        """
+        Returns:
+            float or numpy.ndarray: Time of the sample(s) at position (fractional positions are allowed).
+        """
+        return self.offset + np.asarray(position) / self.rate
+
+    def position(self, time):
+        """
+        Returns:
+            float or numpy.ndarray: Fractional sample position(s) at time.
+        """
+        return (np.asarray(time) - self.offset) * self.rate
+
+
+def resample(data, offset, n, out=None, work=None):
+    """
+    Linearly interpolates n samples spaced like those of data, the first one offset samples after the first sample of
+    data, i.e. a board moved onto a time grid at its own sampling rate. Every row and sample at once, on slices, so
+    nothing is allocated when out and work are given.
+
+    Args:
+        data (numpy.ndarray): Array of shape (n_rows, n + 1) of consecutive samples (n samples are enough if offset is 0).
+        offset (float): Fraction of a sample period (0 <= offset < 1) between the first sample of data and the first
+                        sample to interpolate.
+        n (int): Number of samples to interpolate.
+        out (numpy.ndarray, optional): Array of shape (n_rows, n) to write the samples into.
+        work (numpy.ndarray, optional): Scratch array of shape (n_rows, n).
+
+    Returns:
+        numpy.ndarray: Array of shape (n_rows, n).
+    """
+    if out is None:
+        out = np.empty((data.shape[0], n))
+    np.multiply(data[:, :n], 1.0 - offset, out=out)
+    if offset > 0:
+        if work is None:
+            work = np.empty_like(out)
+        np.multiply(data[:, 1:n + 1], offset, out=work)
+        out += work
+    return out
@@ -1,19 +1,23 @@
-import brainflow
 from brainflow.board_shim import BoardShim, BrainFlowInputParams, BrainFlowError, BoardIds
+from brainflow.exit_codes import BrainFlowExitCodes
 import serial.tools.list_ports
 import time
-import pygame
-import sys
-import pygame.font
-import argparse
-import pygame.mixer
+import copy
+import threading
+import multiprocessing
 import numpy as np
-import matplotlib.pyplot as plt
-from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds
+from functools import lru_cache
+from band_power import get_band_power_plan, score_windows_batch
+from board_health import BoardHealth
 
 ###################
 # This file holds the BrainFlowBoardSetup class, which is a wrapper around the BrainFlow BoardShim class. As well as other functions necessary for Alpha-war to work properly.
 ###################
+# Seconds of data BrainFlow keeps for a board that isn't drained. The acquisition workers drain every few
+# milliseconds and whole sessions are kept by the recorder (recording.py), so this only has to cover hiccups.
+STREAM_BUFFER_SECONDS = 60
+# BrainFlow errors of a serial port that is still held (e.g. just released by a probe), the only ones worth retrying
+PORT_BUSY_ERRORS = (BrainFlowExitCodes.PORT_ALREADY_OPEN_ERROR.value, BrainFlowExitCodes.UNABLE_TO_OPEN_PORT_ERROR.value)
 class BrainFlowBoardSetup:
     """
     A class to manage the setup, configuration, and control of a BrainFlow board.
@@ -24,6 +28,8 @@ class BrainFlowBoardSetup:
         name (str): A user-friendly name or identifier for the board setup instance.
         board_id (int): The ID of the BrainFlow board to use.
         serial_port (str): The serial port to which the BrainFlow board is connected.
+        port_source (str): Where serial_port came from: 'config', 'registry' or 'probe'.
+        registry (DeviceRegistry): Registry of known dongles consulted before probing (None to always probe).
         master_board (int): The ID of the master board (if using playback or synthetic boards).
         params (BrainFlowInputParams): Instance of BrainFlowInputParams representing the board's input parameters.
         board (BoardShim): Instance of BoardShim representing the active board.
@@ -31,11 +37,13 @@ class BrainFlowBoardSetup:
         streaming (bool): Flag indicating if the board is actively streaming data.
         eeg_channels (list): List of EEG channel indices for the board (empty if not applicable).
         sampling_rate (int): Sampling rate of the board.
+        health (BoardHealth): Lost samples, effective rate, flat or railed channels, read errors and reconnects.
+        reconnecting (bool): True while reconnect() runs (reads then return None).
     """
 
     _id_counter = 0  # Class-level variable to assign default IDs
 
-    def __init__(self, board_id, serial_port=None, master_board=None, name=None, **kwargs):
+    def __init__(self, board_id, serial_port=None, master_board=None, name=None, registry=None, **kwargs):
         """
         Initializes the BrainFlowBoardSetup class with the given board ID, serial port, master board, and additional parameters.
 
@@ -44,6 +52,9 @@ class BrainFlowBoardSetup:
             serial_port (str, optional): The serial port to which the BrainFlow board is connected.
             master_board (int, optional): The master board ID, used for playback or synthetic boards.
             name (str, optional): A user-friendly name or identifier for this instance. Defaults to 'Board X'.
+                The name is also the player slot looked up in the registry.
+            registry (DeviceRegistry, optional): Registry of known dongles, consulted before probing ports when no
+                serial port is provided. Auto-detected ports are recorded in it.
             **kwargs: Additional keyword arguments to be set as attributes on the BrainFlowInputParams instance.
         """
         self.instance_id = BrainFlowBoardSetup._id_counter  # Unique identifier for each instance
@@ -51,6 +62,8 @@ class BrainFlowBoardSetup:
         
         self.board_id = board_id
         self.serial_port = serial_port
+        self.port_source = 'config' if serial_port is not None else None
+        self.registry = registry
         self.master_board = master_board
 
         # Assign default name if not provided, based on the class-level ID counter
@@ -86,6 +99,15 @@ class BrainFlowBoardSetup:
         self.board = None
         self.session_prepared = False
         self.streaming = False
+        self.reconnecting = False
+        self._session_lock = threading.Lock()  # Held while reconnecting, reads skip the board instead of waiting
+        try:
+            package_channel = BoardShim.get_package_num_channel(self.master_board if self.master_board is not None else board_id)
+        except BrainFlowError:
+            package_channel = None
+        self.health = BoardHealth(self.sampling_rate, self.eeg_channels, package_channel)
+        self.setup_time = None  # Seconds the last setup() took
+        self.last_probe_report = []  # Result of every port probed by the last find_device_ports() call
     
     def __getattr__(self, name):
         """
@@ -127,62 +149,112 @@ class BrainFlowBoardSetup:
         
         return eeg_channels, sampling_rate
 
-    def find_device_ports(self):
+    def find_device_ports(self, timeout=5.0, exclude_ports=()):
         """
-        Finds all compatible BrainFlow devices by checking the available serial ports.
+        Finds all compatible BrainFlow devices by probing the available serial ports concurrently.
+
+        Every serial port is probed in its own process by initializing (and releasing) a session. Processes are
+        used rather than threads because BrainFlow serializes session calls within a process. A probe that takes
+        longer than `timeout` seconds is terminated and reported as timed out, so an unresponsive port can't stall
+        discovery. A probe that fails in any other way is reported as an error, with its message or exit code.
 
-        This method iterates over available serial ports on the computer and attempts
-        to detect and verify BrainFlow-compatible devices by initializing a session.
+        Args:
+            timeout (float, optional): Seconds to wait for the probes. Defaults to 5.0.
+            exclude_ports (iterable, optional): Ports in use by other boards, which are not probed.
 
         Returns:
-            list: A list of dictionaries containing 'port', 'serial_number', and 'description' for each compatible device.
-                    Returns an empty list if no devices are found.
+            list: A list of dictionaries containing 'port', 'serial_number', 'description' and 'probe_time' (seconds)
+                    for each compatible device, ranked fastest first. The result of every probe, including failed and
+                    timed out ones, is kept in self.last_probe_report.
+
+        Raises:
+            Exception: If no compatible device is found.
         """
-        BoardShim.disable_board_logger()
-        ports = serial.tools.list_ports.comports()
-        compatible_ports = []
+        ports = [port for port in serial.tools.list_ports.comports() if port.device not in exclude_ports]
 
+        probes = []
         for port in ports:
-            try:
-                self.params.serial_port = port.device
-                board = BoardShim(self.board_id, self.params)
-                board.prepare_session()
-                board.release_session()
-                
-                device_info = {
-                    'port': port.device,
-                    'serial_number': port.serial_number,
-                    'description': port.description
-                }
-                print(f"Compatible device found: Serial Number: {port.serial_number}, Description: {port.description}")
-                compatible_ports.append(device_info)
-            except BrainFlowError:
-                continue
-        
+            params = copy.copy(self.params)
+            params.serial_port = port.device
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            probe = multiprocessing.Process(target=_probe_serial_port, args=(self.board_id, params, sender), daemon=True)
+            probe.start()
+            probes.append((port, probe, receiver))
+
+        started = time.perf_counter()
+        deadline = started + timeout
+        self.last_probe_report = []
+        for port, probe, receiver in probes:
+            probe.join(max(0, deadline - time.perf_counter()))
+            if receiver.poll():
+                result = receiver.recv()
+            elif probe.is_alive():
+                result = {'status': 'timeout', 'probe_time': timeout}
+            else:
+                # The probe process died before it could report (e.g. a crash in the driver)
+                result = {'status': 'error', 'probe_time': time.perf_counter() - started, 'error': f"probe exited with code {probe.exitcode}"}
+            if probe.is_alive():
+                probe.terminate()
+            self.last_probe_report.append({
+                'port': port.device,
+                'serial_number': port.serial_number,
+                'description': port.description,
+                **result,
+            })
+        self.last_probe_report.sort(key=lambda probe: (probe['status'] != 'compatible', probe['probe_time']))
+
+        compatible_ports = [{key: probe[key] for key in ('port', 'serial_number', 'description', 'probe_time')}
+                            for probe in self.last_probe_report if probe['status'] == 'compatible']
+        for device_info in compatible_ports:
+            print(f"Compatible device found: Serial Number: {device_info['serial_number']}, Description: {device_info['description']} ({device_info['probe_time']:.2f} s)")
+
         if not compatible_ports:
             raise Exception("No compatible BrainFlow devices found.")
         
-        BoardShim.enable_board_logger()
         return compatible_ports
 
-    def setup(self):
+    def setup(self, ready_timeout=5.0, use_registry=True, buffer_seconds=STREAM_BUFFER_SECONDS, probe=True):
         """
         Prepares the session and starts the data stream from the BrainFlow board.
 
-        If no serial port is provided during initialization, this method attempts to auto-detect
-        a compatible device. Once the board is detected or provided, it prepares the session and starts streaming.
+        If no serial port is provided during initialization, this method first looks for a registered device
+        in the registry, and otherwise attempts to auto-detect a compatible device (which is then registered).
+        If a registered device fails to connect, it falls back to auto-detection.
+        Once the board is detected or provided, it prepares the session and starts streaming.
+        Instead of sleeping a fixed time, preparing the session is retried until the port is available, and
+        setup returns as soon as the first samples arrive (see wait_until_ready).
+
+        Auto-detection probes every serial port, including those of other boards. When several boards are set up,
+        use setup_boards, which runs one discovery for all of them and leaves out the ports already claimed.
+
+        Args:
+            ready_timeout (float, optional): Seconds to keep retrying the session and to wait for data. Defaults to 5.0.
+            use_registry (bool, optional): Whether to look the port up in the registry. Defaults to True.
+            buffer_seconds (float, optional): Seconds of data BrainFlow's stream buffer holds. Defaults to STREAM_BUFFER_SECONDS.
+            probe (bool, optional): Whether to auto-detect the port when none is known or the registered one fails.
+                If False, setup just fails instead. Defaults to True.
 
         Raises:
             BrainFlowError: If the board fails to prepare the session or start streaming.
         """
+        start = time.perf_counter()
         
         if self.master_board is None:
             if self.board_id in [BoardIds.PLAYBACK_FILE_BOARD.value, BoardIds.SYNTHETIC_BOARD.value]:
                 self.serial_port = ''
+            if self.serial_port is None and use_registry and self.registry is not None:
+                self.serial_port = self.registry.find_port(self.board_id, player=self.name)
+                if self.serial_port is not None:
+                    self.port_source = 'registry'
+                    print(f"[{self.name}] Using registered device on {self.serial_port}.")
             if self.serial_port is None:
+                if not probe:
+                    print(f"[{self.name}] No serial port provided or registered. Setup failed.")
+                    return
                 print("No serial port provided, attempting to auto-detect...")
                 ports_info = self.find_device_ports()
                 self.serial_port = ports_info[0]['port'] if ports_info else None
+                self.port_source = 'probe'
                 if not self.serial_port:
                     print("No compatible device found. Setup failed.")
                     return
@@ -195,15 +267,86 @@ class BrainFlowBoardSetup:
         self.params.serial_port = self.serial_port
         self.board = BoardShim(self.board_id, self.params)
         try:
-            time.sleep(2)
-            self.board.prepare_session()
+            self._prepare_session(ready_timeout)
             self.session_prepared = True
-            self.board.start_stream(450000)
+            buffer_size = max(1, int(buffer_seconds * self.sampling_rate)) if self.sampling_rate else 450000
+            self.board.start_stream(buffer_size)
             self.streaming = True # Flag to indicate if streaming is active
-            print(f"[{self.name}, {self.serial_port}] Board setup and streaming started successfully.")
+            self.health.reset()
+            if not self.wait_until_ready(ready_timeout):
+                print(f"[{self.name}, {self.serial_port}] Warning: no data received within {ready_timeout} s.")
+            self.setup_time = time.perf_counter() - start
+            print(f"[{self.name}, {self.serial_port}] Board setup and streaming started successfully ({self.setup_time:.2f} s).")
         except BrainFlowError as e:
             print(f"[{self.name}, {self.serial_port}] Error setting up board: {e}")
             self.board = None
+            if self.port_source == 'registry' and probe:
+                # The registered dongle is connected but its board didn't answer: fall back to probing
+                print(f"[{self.name}] Registered device failed to connect, attempting to auto-detect...")
+                self.serial_port = None
+                self.port_source = None
+                self.setup(ready_timeout=ready_timeout, use_registry=False, buffer_seconds=buffer_seconds)
+            return
+
+        if self.port_source == 'probe' and self.registry is not None:
+            try:
+                self.registry.register(self.serial_port, self.name, self.board_id)
+            except (OSError, ValueError) as e:
+                print(f"[{self.name}] Couldn't register device on {self.serial_port}: {e}")
+
+    def _prepare_session(self, timeout, retry_interval=0.25):
+        """
+        Prepares the session, retrying while the serial port is still held (e.g. just released by a probe). Any other
+        error (no board answering, wrong board, unplugged dongle) is raised right away.
+
+        Args:
+            timeout (float): Seconds to keep retrying before giving up.
+            retry_interval (float, optional): Seconds between two attempts. Defaults to 0.25.
+
+        Raises:
+            BrainFlowError: If the session can't be prepared, or the port is still held after timeout seconds.
+        """
+        deadline = time.perf_counter() + timeout
+        while True:
+            try:
+                self.board.prepare_session()
+                return
+            except BrainFlowError as e:
+                if not self._port_busy(e) or time.perf_counter() + retry_interval > deadline:
+                    raise
+                time.sleep(retry_interval)
+
+    def _port_busy(self, error):
+        """
+        Returns:
+            bool: True if a BrainFlowError means the serial port is held by someone else. A port that can't be opened
+                  only counts if it is still connected, otherwise the dongle is gone.
+        """
+        if error.exit_code == BrainFlowExitCodes.PORT_ALREADY_OPEN_ERROR.value:
+            return True
+        return error.exit_code in PORT_BUSY_ERRORS and bool(self.serial_port) and \
+            any(port.device == self.serial_port for port in serial.tools.list_ports.comports())
+
+    def wait_until_ready(self, timeout=5.0, min_samples=1, poll_interval=0.01):
+        """
+        Waits until the board has delivered data, instead of assuming it after a fixed sleep.
+
+        Args:
+            timeout (float, optional): Maximum number of seconds to wait. Defaults to 5.0.
+            min_samples (int, optional): Number of samples that must be in the BrainFlow buffer. Defaults to 1.
+            poll_interval (float, optional): Seconds between two checks. Defaults to 0.01.
+
+        Returns:
+            bool: True if min_samples samples are available, False if the board isn't streaming or timeout expired.
+        """
+        if self.board is None or not self.streaming:
+            return False
+        deadline = time.perf_counter() + timeout
+        while self.board.get_board_data_count() < min_samples:
+            if time.perf_counter() >= deadline:
+                return False
+            time.sleep(poll_interval)
+        return True
 
     def show_params(self):
         """
@@ -223,6 +366,16 @@ class BrainFlowBoardSetup:
             int: The sampling rate of the BrainFlow board.
         """
         return self.sampling_rate
+
+    def get_num_rows(self):
+        """
+        Retrieves the number of rows (channels of every kind) in the data returned by the BrainFlow board.
+
+        Returns:
+            int: The number of rows per sample. Uses the master board if provided.
+        """
+        board_to_use = self.master_board if self.master_board is not None else self.board_id
+        return BoardShim.get_num_rows(board_to_use)
     
     def is_streaming(self):
         """
@@ -244,17 +397,34 @@ class BrainFlowBoardSetup:
     
     def get_board_data(self):
         """
-        Retrieves all accumulated data from the BrainFlow board and clears it from the buffer.
+        Retrieves all accumulated data from the BrainFlow board and clears it from the buffer. Every read updates
+        the health counters.
 
         Returns:
             numpy.ndarray: The current data from the BrainFlow board if the board is set up.
-            None: If the board is not set up.
+            None: If the board is not set up or is reconnecting. After a failed reconnect this is silent, the
+                  acquisition keeps polling until the next attempt succeeds.
+
+        Raises:
+            BrainFlowError: If the read fails (counted in health.read_errors).
         """
-        if self.board is not None:
-            return self.board.get_board_data()
-        else:
-            print("Board is not set up.")
+        if not self._session_lock.acquire(blocking=False):
             return None
+        try:
+            if self.board is None:
+                if self.health.reconnects == 0:
+                    print("Board is not set up.")
+                return None
+            try:
+                data = self.board.get_board_data()
+            except BrainFlowError:
+                self.health.record_error()
+                raise
+            # Counted under the lock, so a reconnect can't reset the health between the read and its record
+            self.health.record(data)
+        finally:
+            self._session_lock.release()
+        return data
 
     def get_current_board_data(self, num_samples):
         """
@@ -281,7 +451,9 @@ class BrainFlowBoardSetup:
             marker (float): The marker value to be inserted.
             verbose (bool): Whether to print a confirmation message. Default is True.
         """
-        if self.board is not None and self.streaming:
+        if self.reconnecting:
+            print(f"[{self.name}] Board is reconnecting, marker {marker} not inserted.")
+        elif self.board is not None and self.streaming:
             try:
                 self.board.insert_marker(marker)
                 if verbose:
@@ -298,19 +470,56 @@ class BrainFlowBoardSetup:
         This method safely stops the data stream and releases any resources used by the BrainFlow board.
         It also resets the streaming and session flags.
         """
-        try:
-            if hasattr(self, 'board') and self.board is not None:
-                if self.streaming:
-                    self.board.stop_stream()
-                    self.streaming = False
-                    print(f"[{self.name}, {self.serial_port}] Streaming stopped.")
-                if self.session_prepared:
-                    self.board.release_session()
-                    self.session_prepared = False
-                    print(f"[{self.name}, {self.serial_port}] Session released.")
-        except BrainFlowError as e:
-            if "BOARD_NOT_CREATED_ERROR:15" not in str(e):
-                print(f"[{self.name}, {self.serial_port}] Error stopping board: {e}")        
+        if not hasattr(self, 'board') or self.board is None:
+            return
+        # The session is released even if stopping the stream fails (e.g. the dongle was unplugged)
+        if self.streaming:
+            try:
+                self.board.stop_stream()
+                print(f"[{self.name}, {self.serial_port}] Streaming stopped.")
+            except BrainFlowError as e:
+                print(f"[{self.name}, {self.serial_port}] Error stopping stream: {e}")
+            self.streaming = False
+        if self.session_prepared:
+            try:
+                self.board.release_session()
+                print(f"[{self.name}, {self.serial_port}] Session released.")
+            except BrainFlowError as e:
+                if "BOARD_NOT_CREATED_ERROR:15" not in str(e):
+                    print(f"[{self.name}, {self.serial_port}] Error stopping board: {e}")
+            self.session_prepared = False
+
+    def reconnect(self, ready_timeout=5.0):
+        """
+        Releases the session and sets the board up again (e.g. after its dongle dropped), from any thread. Reads
+        return None meanwhile, so the acquisition of the other boards goes on.
+
+        Only the board's own dongle is tried: its registered port if the registry finds it (the dongle may come back
+        on another port), otherwise the port it had. Ports aren't probed, as they may belong to the other boards.
+
+        Args:
+            ready_timeout (float, optional): Seconds to keep retrying the session and to wait for data. Defaults to 5.0.
+
+        Returns:
+            bool: True if the board is streaming again.
+        """
+        with self._session_lock:
+            self.reconnecting = True
+            try:
+                print(f"[{self.name}, {self.serial_port}] Reconnecting...")
+                self.stop()
+                self.board = None
+                if self.registry is not None and self.port_source in ('registry', 'probe'):
+                    port = self.registry.find_port(self.board_id, player=self.name)
+                    if port is not None:
+                        self.serial_port = port
+                        self.port_source = 'registry'
+                self.setup(ready_timeout=ready_timeout, probe=False)
+                self.health.reconnects += 1
+                self.health.reset()
+            finally:
+                self.reconnecting = False
+        return self.is_streaming()
 
     def __del__(self):
         """
@@ -321,9 +530,150 @@ class BrainFlowBoardSetup:
 
 
 
+def _probe_serial_port(board_id, params, connection):
+    """
+    Checks if a compatible device answers on the serial port in params. Run by find_device_ports in one process per port.
+
+    Args:
+        board_id (int): The ID of the BrainFlow board to look for.
+        params (BrainFlowInputParams): Input parameters with serial_port set to the port to probe.
+        connection (Connection): Pipe end the result dictionary ('status', 'probe_time' and 'error') is sent through.
+                                 The status is 'compatible', 'incompatible' (BrainFlow refused the port) or 'error'.
+    """
+    BoardShim.disable_board_logger()
+    result = {}
+    start = time.perf_counter()
+    try:
+        board = BoardShim(board_id, params)
+        board.prepare_session()
+        board.release_session()
+        result['status'] = 'compatible'
+    except BrainFlowError as e:
+        result['status'] = 'incompatible'
+        result['error'] = str(e)
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['probe_time'] = time.perf_counter() - start
+    connection.send(result)
+
+
+def setup_boards(boards, ready_timeout=5.0, discovery_timeout=5.0):
+    """
+    Sets up several BrainFlowBoardSetup instances in parallel.
+
+    Boards without a serial port first get their registered port (if their registry knows a connected dongle
+    for them). The rest share a single concurrent discovery per board type, and each one is given a
+    different compatible port (fastest probe first) before all boards are set up in parallel threads.
+    BrainFlow still prepares one session at a time, but the retries and readiness waits of the boards overlap.
+    Boards whose registered dongle doesn't answer go through a second shared discovery once the others are set up,
+    which leaves out every port another board claimed.
+
+    Args:
+        boards (list): The BrainFlowBoardSetup instances to set up.
+        ready_timeout (float, optional): Passed on to each board's setup(). Defaults to 5.0.
+        discovery_timeout (float, optional): Passed on to find_device_ports(). Defaults to 5.0.
+
+    Returns:
+        bool: True if every board is streaming.
+    """
+    # Discover ports once per board type for the boards that need auto-detection
+    needs_port = {}
+    for board in boards:
+        if board.serial_port is None and board.master_board is None and \
+                board.board_id not in [BoardIds.PLAYBACK_FILE_BOARD.value, BoardIds.SYNTHETIC_BOARD.value]:
+            needs_port.setdefault(board.board_id, []).append(board)
+
+    claimed_ports = {board.serial_port for board in boards if board.serial_port}
+
+    # Registered dongles are found without probing
+    for board_id, group in needs_port.items():
+        for board in group:
+            if board.registry is not None:
+                port = board.registry.find_port(board_id, player=board.name, exclude_ports=claimed_ports)
+                if port is not None:
+                    board.serial_port = port
+                    board.port_source = 'registry'
+                    claimed_ports.add(port)
+        needs_port[board_id] = [board for board in group if board.serial_port is None]
+
+    unassigned = _assign_discovered_ports(needs_port, claimed_ports, discovery_timeout)
+    _setup_in_threads([board for board in boards if board not in unassigned], ready_timeout)
+
+    # Registered dongles that didn't answer: probe the ports no other board claimed, as setup() alone would probe them all
+    failed = {}
+    for board in boards:
+        if board.port_source == 'registry' and not board.is_streaming():
+            print(f"[{board.name}] Registered device on {board.serial_port} failed to connect, attempting to auto-detect...")
+            board.serial_port = None
+            board.port_source = None
+            failed.setdefault(board.board_id, []).append(board)
+    if failed:
+        claimed_ports = {board.serial_port for board in boards if board.serial_port}
+        unassigned = _assign_discovered_ports(failed, claimed_ports, discovery_timeout)
+        _setup_in_threads([board for group in failed.values() for board in group if board not in unassigned], ready_timeout)
+
+    return all(board.is_streaming() for board in boards)
+
+
+def _assign_discovered_ports(needs_port, claimed_ports, discovery_timeout):
+    """
+    Runs one discovery per board type and gives each board a different unclaimed compatible port.
+
+    Args:
+        needs_port (dict): The boards without a port, per board ID.
+        claimed_ports (set): Ports in use by other boards. They are not probed, and the assigned ports are added.
+        discovery_timeout (float): Passed on to find_device_ports().
+
+    Returns:
+        list: The boards left without a port.
+    """
+    for board_id, group in needs_port.items():
+        if not group:
+            continue
+        try:
+            devices = group[0].find_device_ports(timeout=discovery_timeout, exclude_ports=claimed_ports)
+        except Exception as e:
+            print(f"Auto-detection failed for board {board_id}: {e}")
+            continue
+        available = [device['port'] for device in devices if device['port'] not in claimed_ports]
+        for board, port in zip(group, available):
+            board.serial_port = port
+            board.port_source = 'probe'
+            claimed_ports.add(port)
+
+    # Boards still without a port are skipped rather than left to run their own (competing) discovery
+    unassigned = [board for group in needs_port.values() for board in group if board.serial_port is None]
+    for board in unassigned:
+        print(f"[{board.name}] No unclaimed compatible device found. Setup skipped.")
+    return unassigned
+
+
+def _setup_in_threads(boards, ready_timeout):
+    """
+    Sets the boards up in parallel threads, without any auto-detection of their own, and waits for them.
+    """
+    threads = [threading.Thread(target=board.setup, kwargs={'ready_timeout': ready_timeout, 'probe': False},
+                                name=f"{board.name} setup")
+               for board in boards]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+@lru_cache(maxsize=None)
+def get_board_sampling_rate(board_id):
+    """
+    Cached BoardShim.get_sampling_rate, the sampling rate of a board ID never changes.
+    """
+    return BoardShim.get_sampling_rate(board_id)
+
+
 def calculate_alpha_power(data, board_id, normalize='betaalpha'):
     """
     Calculate the alpha power of EEG data with different normalization options.
+    This is a thin wrapper around the cached BandPowerPlan for the board's sampling rate and the window length.
     
     Parameters:
     - data: numpy array, shape (n_channels, n_samples)
@@ -339,44 +689,33 @@ def calculate_alpha_power(data, board_id, normalize='betaalpha'):
     Returns:
     - float: The calculated alpha power, normalized based on the specified method.
     """
-    # Compute the power spectrum for each channel
-    ps = np.abs(np.fft.fft(data, axis=1))**2
-    freqs = np.fft.fftfreq(data.shape[1], 1 / BoardShim.get_sampling_rate(board_id))
-    
-    # Define the alpha and beta frequency ranges
-    alpha_range = (freqs >= 8) & (freqs <= 12)
-    beta_range = (freqs > 12) & (freqs <= 30)
-    
-    # Calculate the alpha power for each channel by summing the power in the alpha band
-    alpha_powers = np.sum(ps[:, alpha_range], axis=1)
-    
-    # Normalization or ratio calculations based on the specified method
-    if normalize == 'max':
-        # Normalize by the maximum FFT value per channel
-        normalization_factor = np.max(ps, axis=1)
-        normalized_alpha_powers = alpha_powers / normalization_factor
-        return np.sum(normalized_alpha_powers)
-    
-    elif normalize == 'norm':
-        # Normalize by the vector norm of the power spectrum for each channel
-        normalization_factor = np.linalg.norm(ps, axis=1)
-        normalized_alpha_powers = alpha_powers / normalization_factor
-        return np.sum(normalized_alpha_powers)
-    
-    elif normalize == 'betaalpha':
-        # Calculate the ratio of beta power to alpha power across all channels
-        beta_powers = np.sum(ps[:, beta_range], axis=1)
-        total_alpha_power = np.sum(alpha_powers)
-        total_beta_power = np.sum(beta_powers)
-        
-        # Avoid division by zero
-        if total_alpha_power == 0:
-            return 0
-        beta_alpha_ratio = total_beta_power / total_alpha_power
-        return beta_alpha_ratio
-    
+    plan = get_band_power_plan(get_board_sampling_rate(board_id), data.shape[1], normalize)
+    return plan.score(data)
+
+
+def calculate_alpha_power_batch(data, board_ids, normalize='betaalpha', channels=None):
+    """
+    Calculate the alpha power of several boards at once, e.g. one per player.
+    Boards sharing a sampling rate and window length are scored in a single vectorized pass.
+
+    Parameters:
+    - data: numpy array of shape (n_boards, n_rows, n_samples), or list of (n_rows, n_samples) arrays
+        The latest window of each board. Boards with different sampling rates can have different lengths.
+    - board_ids: int or list of int
+        The board ID shared by every board, or one board ID per board.
+    - normalize: str, optional
+        Normalization method, see calculate_alpha_power.
+    - channels: list, optional
+        One row selection per board (e.g. BrainFlowBoardSetup.eeg_channels, a slice, or None for every row).
+
+    Returns:
+    - numpy array, shape (n_boards,): The alpha power of each board, as calculate_alpha_power would return it.
+    """
+    if np.isscalar(board_ids):
+        sampling_rates = get_board_sampling_rate(board_ids)
     else:
-        raise ValueError("The normalize parameter must be 'max', 'norm', or 'betaalpha'")
+        sampling_rates = [get_board_sampling_rate(board_id) for board_id in board_ids]
+    return score_windows_batch(data, sampling_rates, normalize=normalize, channels=channels)
 
 #######
 # Example streaming from a single board
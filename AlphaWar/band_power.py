@@ -0,0 +1,557 @@
+import inspect
+from functools import lru_cache
+import numpy as np
+
+###################
+# This file holds the band-power DSP for Alpha-war: cached spectral plans that score a window with the
+# 'max', 'norm' and 'betaalpha' modes of calculate_alpha_power, and a streaming engine that scores
+# overlapping windows every hop without recomputing the whole spectrum of a fresh window each time.
+###################
+ALPHA_BAND = (8, 12)  # Inclusive on both ends
+BETA_BAND = (12, 30)  # Exclusive low end, inclusive high end
+NORMALIZATION_MODES = ('max', 'norm', 'betaalpha')
+
+# NumPy >= 2.0 can write FFT results into a preallocated array, older versions always allocate the output
+_RFFT_HAS_OUT = 'out' in inspect.signature(np.fft.rfft).parameters
+
+
+class BandPowerPlan:
+    """
+    Precomputed setup for scoring windows of a fixed length and sampling rate.
+
+    Everything calculate_alpha_power used to rebuild on every call (frequency grid, alpha and beta bins,
+    two-sided bin weights) is computed once. Scoring uses a real FFT and writes into buffers owned by the
+    plan, so scoring a window does not allocate (apart from the FFT output on NumPy < 2.0).
+
+    Plans are shared through get_band_power_plan(), and their buffers are reused between calls: use a plan
+    from one thread at a time, and copy the arrays returned by power_spectrum() before the next call.
+
+    Attributes:
+        sampling_rate (int): Sampling rate of the data in Hz.
+        window_samples (int): Number of samples per window.
+        normalize (str): Normalization mode, one of 'max', 'norm' or 'betaalpha'.
+        freqs (numpy.ndarray): Frequencies of the one-sided spectrum bins.
+        alpha_bins (slice): Bins of the alpha band (8-12 Hz by default).
+        beta_bins (slice): Bins of the beta band (12-30 Hz by default).
+        two_sided_weights (numpy.ndarray): Number of times each one-sided bin appears in the two-sided spectrum.
+    """
+
+    def __init__(self, sampling_rate, window_samples, normalize='betaalpha', alpha_band=ALPHA_BAND, beta_band=BETA_BAND):
+        """
+        Initializes the plan.
+
+        Args:
+            sampling_rate (int): Sampling rate of the data in Hz.
+            window_samples (int): Number of samples per window.
+            normalize (str, optional): 'max', 'norm' or 'betaalpha'. Defaults to 'betaalpha'.
+            alpha_band (tuple, optional): (low, high) alpha band in Hz, inclusive. Defaults to ALPHA_BAND.
+            beta_band (tuple, optional): (low, high) beta band in Hz, low end exclusive. Defaults to BETA_BAND.
+
+        Raises:
+            ValueError: If normalize is unknown.
+        """
+        if normalize not in NORMALIZATION_MODES:
+            raise ValueError("The normalize parameter must be 'max', 'norm', or 'betaalpha'")
+
+        self.sampling_rate = sampling_rate
+        self.window_samples = window_samples
+        self.normalize = normalize
+        self.alpha_band = alpha_band
+        self.beta_band = beta_band
+
+        # One-sided spectrum layout, identical to the positive half of np.fft.fftfreq
+        self.freqs = np.fft.rfftfreq(window_samples, 1 / sampling_rate)
+        self.alpha_bins = self._band_slice((self.freqs >= alpha_band[0]) & (self.freqs <= alpha_band[1]))
+        self.beta_bins = self._band_slice((self.freqs > beta_band[0]) & (self.freqs <= beta_band[1]))
+
+        # Weight of each one-sided bin in the two-sided spectrum (DC and Nyquist appear once, the rest twice)
+        self.two_sided_weights = np.full(self.freqs.size, 2.0)
+        self.two_sided_weights[0] = 1.0
+        if window_samples % 2 == 0:
+            self.two_sided_weights[-1] = 1.0
+
+        self._band_basis = None
+        self._buffers = {}  # n_channels -> (spectrum, power, band sums, normalization factors)
+
+    @staticmethod
+    def _band_slice(mask):
+        """
+        Converts a boolean mask of contiguous bins into a slice, so band sums read views instead of copies.
+        """
+        bins = np.flatnonzero(mask)
+        if bins.size == 0:
+            return slice(0, 0)
+        return slice(bins[0], bins[-1] + 1)
+
+    @property
+    def n_alpha_bins(self):
+        """
+        int: Number of bins in the alpha band.
+        """
+        return self.alpha_bins.stop - self.alpha_bins.start
+
+    @property
+    def band_basis(self):
+        """
+        numpy.ndarray: DFT basis restricted to the alpha then beta bins, shape (window_samples, n_band_bins),
+        with basis[m, k] = exp(-2j*pi*bin_k*m/window_samples). Built on first use.
+        """
+        if self._band_basis is None:
+            band_bins = np.r_[self.alpha_bins, self.beta_bins]
+            self._band_basis = np.exp(-2j * np.pi * np.outer(np.arange(self.window_samples), band_bins) / self.window_samples)
+        return self._band_basis
+
+    def _get_buffers(self, shape):
+        """
+        Returns the reused output buffers for a data shape without the sample axis, e.g. (n_channels,)
+        or (n_boards, n_channels), allocating them on first use.
+        """
+        buffers = self._buffers.get(shape)
+        if buffers is None:
+            buffers = (np.empty(shape + (self.freqs.size,), dtype=complex),  # Spectrum
+                       np.empty(shape + (self.freqs.size,)),  # Power spectrum
+                       np.empty(shape),  # Alpha power per channel
+                       np.empty(shape),  # Normalization factor (or beta power) per channel
+                       np.empty(shape[:-1]),  # Total alpha power per board
+                       np.empty(shape[:-1]))  # Score per board
+            self._buffers[shape] = buffers
+        return buffers
+
+    def power_spectrum(self, data):
+        """
+        Computes the one-sided power spectrum of each channel.
+
+        Args:
+            data (numpy.ndarray): Array of shape (n_channels, window_samples), or (n_boards, n_channels, window_samples).
+
+        Returns:
+            numpy.ndarray: The plan's reused power buffer, with the sample axis replaced by n_bins.
+        """
+        spectrum, power = self._get_buffers(data.shape[:-1])[:2]
+        if _RFFT_HAS_OUT:
+            np.fft.rfft(data, axis=-1, out=spectrum)
+        else:
+            spectrum = np.fft.rfft(data, axis=-1)
+        np.abs(spectrum, out=power)
+        np.square(power, out=power)
+        return power
+
+    def score(self, data):
+        """
+        Scores a window with the plan's normalization mode.
+
+        Args:
+            data (numpy.ndarray): Array of shape (n_channels, window_samples).
+
+        Returns:
+            float: The same value calculate_alpha_power returns for this window.
+        """
+        if data.shape[1] != self.window_samples:
+            raise ValueError(f"Expected windows of {self.window_samples} samples, got {data.shape[1]}")
+        return self.score_power(self.power_spectrum(data))
+
+    def score_power(self, power):
+        """
+        Scores a one-sided power spectrum. The spectrum may be overwritten.
+
+        Args:
+            power (numpy.ndarray): Array of shape (n_channels, n_bins), e.g. from power_spectrum().
+
+        Returns:
+            float: The score for the configured normalization mode.
+        """
+        alpha_powers, normalization_factor = self._get_buffers(power.shape[:-1])[2:4]
+        np.sum(power[:, self.alpha_bins], axis=1, out=alpha_powers)
+
+        if self.normalize == 'max':
+            # Normalize by the maximum FFT value per channel
+            np.max(power, axis=1, out=normalization_factor)
+        elif self.normalize == 'norm':
+            # Normalize by the vector norm of the (two-sided) power spectrum for each channel
+            np.square(power, out=power)
+            np.dot(power, self.two_sided_weights, out=normalization_factor)
+            np.sqrt(normalization_factor, out=normalization_factor)
+        else:
+            # Ratio of beta power to alpha power across all channels, avoiding division by zero
+            total_alpha_power = np.sum(alpha_powers)
+            if total_alpha_power == 0:
+                return 0
+            return np.sum(power[:, self.beta_bins]) / total_alpha_power
+
+        np.divide(alpha_powers, normalization_factor, out=alpha_powers)
+        return np.sum(alpha_powers)
+
+    def score_batch(self, data, channel_mask=None):
+        """
+        Scores a stack of windows from several boards in one vectorized pass.
+
+        Args:
+            data (numpy.ndarray): Array of shape (n_boards, n_channels, window_samples).
+            channel_mask (numpy.ndarray, optional): Boolean array of shape (n_boards, n_channels), False for channels
+                to leave out (e.g. zero padding when boards have different channel counts). Defaults to all channels.
+
+        Returns:
+            numpy.ndarray: Array of shape (n_boards,), the same value calculate_alpha_power returns for each board.
+        """
+        if data.ndim != 3 or data.shape[2] != self.window_samples:
+            raise ValueError(f"Expected an array of shape (n_boards, n_channels, {self.window_samples}), got {data.shape}")
+        return self.score_power_batch(self.power_spectrum(data), channel_mask)
+
+    def score_power_batch(self, power, channel_mask=None):
+        """
+        Scores a stack of one-sided power spectra. The spectra may be overwritten.
+
+        Args:
+            power (numpy.ndarray): Array of shape (n_boards, n_channels, n_bins).
+            channel_mask (numpy.ndarray, optional): Boolean array of shape (n_boards, n_channels), False for channels to leave out.
+
+        Returns:
+            numpy.ndarray: Array of shape (n_boards,) with the score of each board.
+        """
+        _, _, alpha_powers, normalization_factor, total_alpha_power, scores = self._get_buffers(power.shape[:-1])
+        np.sum(power[..., self.alpha_bins], axis=-1, out=alpha_powers)
+        if channel_mask is not None:
+            alpha_powers *= channel_mask
+
+        if self.normalize == 'betaalpha':
+            # Ratio of beta power to alpha power across each board's channels, 0 where there is no alpha power
+            np.sum(power[..., self.beta_bins], axis=-1, out=normalization_factor)
+            if channel_mask is not None:
+                normalization_factor *= channel_mask
+            np.sum(alpha_powers, axis=-1, out=total_alpha_power)
+            np.sum(normalization_factor, axis=-1, out=scores)
+            np.divide(scores, total_alpha_power, out=scores, where=total_alpha_power != 0)
+            scores[total_alpha_power == 0] = 0
+            return scores.copy()
+
+        if self.normalize == 'max':
+            np.max(power, axis=-1, out=normalization_factor)
+        else:
+            np.square(power, out=power)
+            np.dot(power, self.two_sided_weights, out=normalization_factor)
+            np.sqrt(normalization_factor, out=normalization_factor)
+        if channel_mask is not None:
+            # Left out channels contribute 0 instead of 0/0
+            np.copyto(normalization_factor, 1.0, where=~channel_mask)
+        np.divide(alpha_powers, normalization_factor, out=alpha_powers)
+        np.sum(alpha_powers, axis=-1, out=scores)
+        return scores.copy()
+
+    def score_band_power(self, band_power):
+        """
+        Computes the 'betaalpha' score from the power of the band bins only (alpha bins first, then beta bins).
+
+        Args:
+            band_power (numpy.ndarray): Array of shape (n_channels, n_band_bins), in band_basis column order.
+
+        Returns:
+            float: The ratio of total beta power to total alpha power, 0 if there is no alpha power.
+        """
+        total_alpha_power = np.sum(band_power[:, :self.n_alpha_bins])
+        if total_alpha_power == 0:
+            return 0
+        return np.sum(band_power[:, self.n_alpha_bins:]) / total_alpha_power
+
+
+@lru_cache(maxsize=32)
+def get_band_power_plan(sampling_rate, window_samples, normalize='betaalpha', alpha_band=ALPHA_BAND, beta_band=BETA_BAND):
+    """
+    Returns the cached BandPowerPlan for a (sampling rate, window length, normalization, bands) combination.
+
+    Args:
+        sampling_rate (int): Sampling rate of the data in Hz.
+        window_samples (int): Number of samples per window.
+        normalize (str, optional): 'max', 'norm' or 'betaalpha'. Defaults to 'betaalpha'.
+        alpha_band (tuple, optional): (low, high) alpha band in Hz. Defaults to ALPHA_BAND.
+        beta_band (tuple, optional): (low, high) beta band in Hz. Defaults to BETA_BAND.
+
+    Returns:
+        BandPowerPlan: A plan shared by every caller using the same key (the least recently used of 32 plans is evicted).
+    """
+    return BandPowerPlan(sampling_rate, window_samples, normalize, alpha_band, beta_band)
+
+
+class SlidingBandPower:
+    """
+    Streaming band-power estimator scoring a sliding window every hop.
+
+    Samples are pushed in chunks of any size with update(). Once the window is full, a score is produced
+    every hop_samples new samples. The score equals calculate_alpha_power() applied to the same window.
+
+    - 'betaalpha' only needs the 8-30 Hz bins, so those bins are tracked with a sliding DFT that is updated
+      hop by hop (cost grows with the hop, not the window). The bins are recomputed exactly every
+      resync_hops hops to stop floating point drift from accumulating.
+    - 'max' and 'norm' normalize by the whole spectrum, so they score the reused window buffer with the
+      cached BandPowerPlan at each hop.
+
+    Attributes:
+        n_channels (int): Number of channels per chunk.
+        sampling_rate (int): Sampling rate of the data in Hz.
+        window_samples (int): Window length in samples.
+        hop_samples (int): Number of new samples between two scores.
+        normalize (str): Normalization mode, one of 'max', 'norm' or 'betaalpha'.
+        score (float): The latest score, None until the window has been filled once.
+        num_scores (int): Number of scores produced so far.
+        plan (BandPowerPlan): The cached plan for this sampling rate, window length and mode.
+    """
+
+    def __init__(self, n_channels, sampling_rate, window_samples, hop_samples, normalize='betaalpha', resync_hops=None):
+        """
+        Initializes the engine.
+
+        Args:
+            n_channels (int): Number of channels per chunk.
+            sampling_rate (int): Sampling rate of the data in Hz.
+            window_samples (int): Window length in samples.
+            hop_samples (int): Number of new samples between two scores. Must be between 1 and window_samples.
+            normalize (str, optional): 'max', 'norm' or 'betaalpha'. Defaults to 'betaalpha'.
+            resync_hops (int, optional): Hops between two exact recomputations of the sliding DFT bins.
+                Defaults to one window worth of hops.
+
+        Raises:
+            ValueError: If normalize is unknown or hop_samples is out of range.
+        """
+        if not 0 < hop_samples <= window_samples:
+            raise ValueError(f"hop_samples must be between 1 and window_samples ({window_samples}), got {hop_samples}")
+
+        self.n_channels = n_channels
+        self.sampling_rate = sampling_rate
+        self.window_samples = window_samples
+        self.hop_samples = hop_samples
+        self.normalize = normalize
+        self.resync_hops = resync_hops or max(1, window_samples // hop_samples)
+        self.plan = get_band_power_plan(sampling_rate, window_samples, normalize)
+
+        # Circular window and its chronological copy
+        self._window = np.zeros((n_channels, window_samples))
+        self._ordered = np.empty((n_channels, window_samples))
+
+        if normalize == 'betaalpha':
+            # Sliding DFT state for the alpha and beta bins only
+            self._basis = self.plan.band_basis
+            self._bins = np.zeros((n_channels, self._basis.shape[1]), dtype=complex)
+            self._band_power = np.empty((n_channels, self._basis.shape[1]))
+            self._delta = np.empty((n_channels, hop_samples))
+
+        self.reset()
+
+    def reset(self):
+        """
+        Clears the window so the next score is computed from fresh samples only.
+        """
+        self._write_pos = 0
+        self._samples_seen = 0
+        self._since_hop = 0
+        self._bins_valid = False
+        self._hops_since_resync = 0
+        self.score = None
+        self.num_scores = 0
+
+    def is_full(self):
+        """
+        Returns:
+            bool: True once a whole window has been received.
+        """
+        return self._samples_seen >= self.window_samples
+
+    def update(self, chunk, positions=None):
+        """
+        Pushes new samples and scores every completed hop.
+
+        Args:
+            chunk (numpy.ndarray): Array of shape (n_channels, n_samples) with the newest samples.
+            positions (list, optional): If given, the column in chunk of the last sample of each scored window is
+                appended to it (e.g. to look up the timestamp of the data behind each score).
+
+        Returns:
+            list: The scores produced by this chunk, oldest first (usually zero or one).
+        """
+        scores = []
+        n = chunk.shape[1]
+        offset = 0
+        while offset < n:
+            # Never cross the end of the circular window, the window-fill point or a hop boundary in one step
+            if self.is_full():
+                take = self.hop_samples - self._since_hop
+            else:
+                take = self.window_samples - self._samples_seen
+            take = min(take, n - offset, self.window_samples - self._write_pos)
+            piece = chunk[:, offset:offset + take]
+            start = self._write_pos
+
+            if self.normalize == 'betaalpha' and self._bins_valid:
+                self._slide_bins(piece, start, take)
+
+            was_full = self.is_full()
+            self._window[:, start:start + take] = piece
+            self._write_pos = (start + take) % self.window_samples
+            self._samples_seen += take
+            if was_full:
+                self._since_hop += take
+            offset += take
+
+            if self.is_full() and (not was_full or self._since_hop == self.hop_samples):
+                self._since_hop = 0
+                scores.append(self._compute_score())
+                if positions is not None:
+                    positions.append(offset - 1)
+        return scores
+
+    def _slide_bins(self, piece, start, take):
+        """
+        Advances the tracked DFT bins by `take` samples (sliding DFT over a whole piece at once).
+
+        With W = exp(-2j*pi/N), sliding the window by h samples gives
+        X_k <- W^(-k*h) * (X_k + sum_i (x_new[i] - x_old[i]) * W^(k*i)).
+        """
+        delta = np.subtract(piece, self._window[:, start:start + take], out=self._delta[:, :take])
+        self._bins += delta @ self._basis[:take]
+        self._bins *= np.conj(self._basis[take % self.window_samples])
+
+    def _ordered_window(self):
+        """
+        Copies the circular window into chronological order.
+
+        Returns:
+            numpy.ndarray: The reused (n_channels, window_samples) array.
+        """
+        tail = self.window_samples - self._write_pos
+        self._ordered[:, :tail] = self._window[:, self._write_pos:]
+        self._ordered[:, tail:] = self._window[:, :self._write_pos]
+        return self._ordered
+
+    def _compute_score(self):
+        """
+        Scores the current window with the configured normalization mode.
+
+        Returns:
+            float: The score, identical to calculate_alpha_power() on the same window.
+        """
+        if self.normalize == 'betaalpha':
+            if not self._bins_valid or self._hops_since_resync >= self.resync_hops:
+                np.dot(self._ordered_window(), self._basis, out=self._bins)
+                self._bins_valid = True
+                self._hops_since_resync = 0
+            else:
+                self._hops_since_resync += 1
+            np.abs(self._bins, out=self._band_power)
+            np.square(self._band_power, out=self._band_power)
+            score = self._score_band_power(self._band_power)
+        else:
+            score = self._score_window(self._ordered_window())
+
+        self.score = score
+        self.num_scores += 1
+        return score
+
+    def _score_band_power(self, band_power):
+        return self.plan.score_band_power(band_power)
+
+    def _score_window(self, window):
+        return self.plan.score(window)
+
+
+class BatchSlidingBandPower(SlidingBandPower):
+    """
+    SlidingBandPower for several boards that are fed the same number of samples at a time (same sampling rate, window
+    and hop, read in lockstep), scoring every board at each hop in one pass.
+
+    The channels of the boards are stacked, board after board, so the window copies, the sliding DFT and the FFTs
+    are one NumPy call per hop for the whole group whatever the number of boards; only the final sums are per board.
+    Each score is an array with one value per board, equal to what a SlidingBandPower per board would return.
+
+    Attributes:
+        n_boards (int): Number of boards.
+        board_channels (int): Number of channels of each board.
+    """
+
+    def __init__(self, n_boards, n_channels, sampling_rate, window_samples, hop_samples, normalize='betaalpha', resync_hops=None):
+        """
+        Initializes the engine.
+
+        Args:
+            n_boards (int): Number of boards.
+            n_channels (int): Number of channels of each board.
+            sampling_rate (int): Sampling rate of the data in Hz.
+            window_samples (int): Window length in samples.
+            hop_samples (int): Number of new samples between two scores.
+            normalize (str, optional): 'max', 'norm' or 'betaalpha'. Defaults to 'betaalpha'.
+            resync_hops (int, optional): Hops between two exact recomputations of the sliding DFT bins.
+        """
+        self.n_boards = n_boards
+        self.board_channels = n_channels
+        super().__init__(n_boards * n_channels, sampling_rate, window_samples, hop_samples, normalize, resync_hops)
+
+    def update(self, chunk, positions=None):
+        """
+        Pushes new samples of every board and scores every completed hop.
+
+        Args:
+            chunk (numpy.ndarray): Array of shape (n_boards * n_channels, n_samples), the channels of each board in turn.
+            positions (list, optional): See SlidingBandPower.update.
+
+        Returns:
+            list: One array of shape (n_boards,) per score produced by this chunk, oldest first.
+        """
+        return super().update(chunk, positions)
+
+    def _score_band_power(self, band_power):
+        band_power = band_power.reshape(self.n_boards, self.board_channels, -1)
+        n_alpha = self.plan.n_alpha_bins
+        total_alpha_power = band_power[..., :n_alpha].sum(axis=(1, 2))
+        total_beta_power = band_power[..., n_alpha:].sum(axis=(1, 2))
+        scores = np.zeros(self.n_boards)
+        np.divide(total_beta_power, total_alpha_power, out=scores, where=total_alpha_power != 0)
+        return scores
+
+    def _score_window(self, window):
+        return self.plan.score_batch(window.reshape(self.n_boards, self.board_channels, -1))
+
+
+def score_windows_batch(windows, sampling_rates, normalize='betaalpha', channels=None):
+    """
+    Scores the latest window of several boards, grouping boards that share a sampling rate and window
+    length so each group is scored in one vectorized pass.
+
+    Args:
+        windows (numpy.ndarray or list): A stacked array of shape (n_boards, n_rows, n_samples), or a list with one
+            (n_rows, n_samples) array per board (rows and samples may differ between boards).
+        sampling_rates (int or list): One sampling rate for every board, or one per board.
+        normalize (str, optional): 'max', 'norm' or 'betaalpha'. Defaults to 'betaalpha'.
+        channels (list, optional): One row selection per board (list of row indices, slice, or None for every row),
+            e.g. each board's eeg_channels. Defaults to every row of every board.
+
+    Returns:
+        numpy.ndarray: Array of shape (n_boards,) with the score of each board, in input order.
+    """
+    n_boards = len(windows)
+    if np.isscalar(sampling_rates):
+        sampling_rates = [sampling_rates] * n_boards
+    if channels is None:
+        channels = [None] * n_boards
+    if len(sampling_rates) != n_boards or len(channels) != n_boards:
+        raise ValueError("sampling_rates and channels must have one entry per board")
+
+    # Already stacked and scoring every row: a single pass without copying
+    if isinstance(windows, np.ndarray) and windows.ndim == 3 and len(set(sampling_rates)) == 1 and all(c is None for c in channels):
+        plan = get_band_power_plan(sampling_rates[0], windows.shape[2], normalize)
+        return plan.score_batch(windows)
+
+    groups = {}
+    for board_index, (window, rate) in enumerate(zip(windows, sampling_rates)):
+        groups.setdefault((rate, window.shape[-1]), []).append(board_index)
+
+    scores = np.empty(n_boards)
+    for (rate, n_samples), board_indices in groups.items():
+        selected = [windows[i] if channels[i] is None else windows[i][channels[i]] for i in board_indices]
+        n_channels = [w.shape[0] for w in selected]
+        stacked = np.zeros((len(selected), max(n_channels), n_samples))
+        for i, w in enumerate(selected):
+            stacked[i, :w.shape[0]] = w
+
+        channel_mask = None
+        if min(n_channels) != max(n_channels):
+            channel_mask = np.arange(max(n_channels)) < np.array(n_channels)[:, None]
+        plan = get_band_power_plan(rate, n_samples, normalize)
+        scores[board_indices] = plan.score_batch(stacked, channel_mask)
+    return scores
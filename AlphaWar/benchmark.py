@@ -0,0 +1,102 @@
+import argparse
+import os
+import platform
+import sys
+
+###################
+# Headless benchmark of the full Alpha-war loop. It runs AlphaWar.main() with synthetic boards (two, or more in arena mode) under SDL's dummy
+# video and audio drivers (no Cytons or monitor needed) for a fixed number of epochs or frames, and prints the
+# board setup, acquisition, DSP, render and frame times as JSON with percentiles (milliseconds).
+#   python benchmark.py --epochs 200 --output baseline.json
+###################
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run the AlphaWar loop headless with synthetic boards and report timings as JSON.')
+    parser.add_argument('--epochs', type=int, default=200, help='Scored epochs per player to run for (default: 200).')
+    parser.add_argument('--frames', type=int, default=None, help='Frames to run for instead of a number of epochs.')
+    parser.add_argument('--epoch-duration', type=float, default=None, help='Seconds per epoch (default: the value in AlphaWar.py).')
+    parser.add_argument('--hop-duration', type=float, default=None, help='Seconds between two scores (default: the value in AlphaWar.py).')
+    parser.add_argument('--frame-rate', type=int, default=None, help='Frame rate cap, 0 for uncapped (default: the value in AlphaWar.py).')
+    parser.add_argument('--normalize', choices=('max', 'norm', 'betaalpha'), default=None, help='Alpha power normalization (default: the value in AlphaWar.py).')
+    parser.add_argument('--players', type=int, default=2, help='Number of players, more than 2 plays in arena mode (default: 2).')
+    parser.add_argument('--worker', action='store_true', help='Score in a worker process (use_worker_process) instead of the game process.')
+    parser.add_argument('--output', default=None, help='File to write the JSON report to (it is always printed).')
+    return parser.parse_args()
+
+
+def run_benchmark(epochs=200, frames=None, epoch_duration=None, hop_duration=None, frame_rate=None, normalize=None, worker=False, players=2):
+    """
+    Runs the game loop headless with synthetic boards.
+
+    Args:
+        epochs (int, optional): Scored epochs per player to run for. Ignored if frames is given. Defaults to 200.
+        frames (int, optional): Frames to run for. Defaults to None.
+        epoch_duration (float, optional): Seconds per epoch. Defaults to the value in AlphaWar.py.
+        hop_duration (float, optional): Seconds between two scores. Defaults to the value in AlphaWar.py.
+        frame_rate (int, optional): Frame rate cap, 0 for uncapped. Defaults to the value in AlphaWar.py.
+        normalize (str, optional): Alpha power normalization. Defaults to the value in AlphaWar.py.
+        worker (bool, optional): Score in a worker process. The DSP time is then spent in the worker and not
+                                 reported, 'acquisition_read' is the time to read the scores from shared memory.
+                                 Defaults to False.
+        players (int, optional): Number of players (synthetic boards), more than 2 plays in arena mode. Defaults to 2.
+
+    Returns:
+        tuple: The PerfStats of the run and a dictionary describing its configuration.
+    """
+    # Must be set before pygame is initialized, which happens when the game starts
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
+
+    import numpy as np
+    from brainflow.board_shim import BoardShim, BoardIds
+    import AlphaWar
+    from perf_stats import PerfStats
+    from pipeline import player_config
+
+    BoardShim.disable_board_logger()
+    AlphaWar.player_1_board_id = BoardIds.SYNTHETIC_BOARD.value
+    AlphaWar.player_2_board_id = BoardIds.SYNTHETIC_BOARD.value
+    AlphaWar.player_1_serial_port = None
+    AlphaWar.player_2_serial_port = None
+    AlphaWar.extra_players = [player_config(f'Player {i + 1}', BoardIds.SYNTHETIC_BOARD.value) for i in range(2, players)]
+    # Measure the game itself, without the calibration phase or the saved baselines
+    AlphaWar.calibrate_players = False
+    if epoch_duration is not None:
+        AlphaWar.epoch_duration = epoch_duration
+    if hop_duration is not None:
+        AlphaWar.hop_duration = hop_duration
+    if frame_rate is not None:
+        AlphaWar.frame_rate = frame_rate
+    if normalize is not None:
+        AlphaWar.alpha_normalization = normalize
+    AlphaWar.use_worker_process = worker
+
+    config = {
+        'board_id': BoardIds.SYNTHETIC_BOARD.value,
+        'epochs': None if frames is not None else epochs,
+        'frames': frames,
+        'epoch_duration': AlphaWar.epoch_duration,
+        'hop_duration': AlphaWar.hop_duration,
+        'frame_rate': AlphaWar.frame_rate,
+        'alpha_normalization': AlphaWar.alpha_normalization,
+        'worker_process': worker,
+        'players': players,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'units': 'ms',
+    }
+
+    stats = PerfStats()
+    if frames is not None:
+        AlphaWar.main(max_frames=frames, stats=stats)
+    else:
+        AlphaWar.main(max_epochs=epochs, stats=stats)
+    return stats, config
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    args = parse_args()
+    stats, config = run_benchmark(args.epochs, args.frames, args.epoch_duration, args.hop_duration, args.frame_rate, args.normalize, args.worker,
+                                  args.players)
+    print(stats.to_json(args.output, extra={'config': config}))
@@ -0,0 +1,201 @@
+import time
+from collections import deque
+import numpy as np
+
+###################
+# This file holds the board health monitor of Alpha-war. Every chunk drained from a board updates its counters: lost
+# samples (gaps in the board's package counter), effective sampling rate, flat or railed EEG channels and read errors.
+# From them it tells whether the connection needs a reconnect (no data, too few samples, repeated read errors) or
+# whether only the signal is unusable (every channel flat or railed), in which case the player is paused until it
+# recovers. See BrainFlowBoardSetup.reconnect() and ScorePipeline for what is done about it.
+###################
+CYTON_FULL_SCALE_UV = 187500  # Full scale of the Cyton's ADS1299 at gain 24 (4.5 V / 24), in microvolts
+COUNTER_MODULUS = 256  # OpenBCI package counters (and BrainFlow's synthetic board) wrap at 256
+
+
+class BoardHealth:
+    """
+    Health counters of one board, updated from every chunk it returns.
+
+    Attributes:
+        sampling_rate (int): Nominal sampling rate of the board.
+        eeg_channels (list): EEG rows of the board data.
+        package_channel (int): Row of the package counter, None if the board has none.
+        samples (int): Samples received.
+        lost_samples (int): Samples missing from the package counter sequence.
+        gaps (int): Number of jumps in the package counter sequence.
+        read_errors (int): Reads that raised an error.
+        consecutive_errors (int): Reads that raised an error since the last successful one.
+        reconnects (int): Number of reconnects.
+        flat_channels (list): EEG rows that didn't change over the last check_seconds of data.
+        railed_channels (list): EEG rows at the rails of the amplifier over the last check_seconds of data.
+    """
+
+    def __init__(self, sampling_rate, eeg_channels, package_channel=None, rail_threshold=0.9 * CYTON_FULL_SCALE_UV,
+                 stall_timeout=1.0, rate_window=5.0, min_rate_fraction=0.5, max_consecutive_errors=5, check_seconds=1.0):
+        """
+        Initializes the counters.
+
+        Args:
+            sampling_rate (int): Nominal sampling rate of the board.
+            eeg_channels (list): EEG rows of the board data.
+            package_channel (int, optional): Row of the package counter, None to not count lost samples. Defaults to None.
+            rail_threshold (float, optional): Absolute value (in microvolts) from which a channel is railed.
+                                              Defaults to 90% of the Cyton's full scale.
+            stall_timeout (float, optional): Seconds without data after which the connection is lost. Defaults to 1.0.
+            rate_window (float, optional): Seconds over which the effective sampling rate is measured. Defaults to 5.0.
+            min_rate_fraction (float, optional): Fraction of the nominal rate below which the connection is degraded. Defaults to 0.5.
+            max_consecutive_errors (int, optional): Read errors in a row after which the connection is lost. Defaults to 5.
+            check_seconds (float, optional): Seconds of data the flat and railed channels are checked over. Defaults to 1.0.
+        """
+        self.sampling_rate = sampling_rate
+        self.eeg_channels = list(eeg_channels)
+        self.package_channel = package_channel
+        self.rail_threshold = rail_threshold
+        self.stall_timeout = stall_timeout
+        self.rate_window = rate_window
+        self.min_rate_fraction = min_rate_fraction
+        self.max_consecutive_errors = max_consecutive_errors
+        self.check_samples = max(1, int(check_seconds * (sampling_rate or 1)))
+        self.samples = 0
+        self.lost_samples = 0
+        self.gaps = 0
+        self.read_errors = 0
+        self.reconnects = 0
+        self.reset()
+
+    def reset(self, now=None):
+        """
+        Starts following a new stream (after a (re)connect): the stall timer, rate and sequence start again, the
+        cumulative counters are kept.
+        """
+        now = time.perf_counter() if now is None else now
+        self.connected_time = now
+        self.last_data_time = now
+        self.consecutive_errors = 0
+        self.flat_channels = []
+        self.railed_channels = []
+        self._arrivals = deque()  # (time, samples) of the chunks received within rate_window
+        self._last_counter = None
+        self._counter_step = None
+        self._block_min = None
+        self._block_max = None
+        self._block_samples = 0
+
+    def record(self, chunk, now=None):
+        """
+        Updates the counters with a chunk returned by get_board_data() (possibly empty).
+        """
+        now = time.perf_counter() if now is None else now
+        self.consecutive_errors = 0
+        n = 0 if chunk is None else chunk.shape[1]
+        if n == 0:
+            return
+        self.samples += n
+        self.last_data_time = now
+        self._arrivals.append((now, n))
+        while self._arrivals[0][0] < now - self.rate_window:
+            self._arrivals.popleft()
+
+        if self.package_channel is not None:
+            self._count_lost_samples(chunk[self.package_channel])
+
+        # Flat and railed channels over blocks of check_seconds of data
+        if self.eeg_channels:
+            eeg = chunk[self.eeg_channels]
+            block_min, block_max = eeg.min(axis=1), eeg.max(axis=1)
+            if self._block_min is None:
+                self._block_min, self._block_max = block_min, block_max
+            else:
+                np.minimum(self._block_min, block_min, out=self._block_min)
+                np.maximum(self._block_max, block_max, out=self._block_max)
+            self._block_samples += n
+            if self._block_samples >= self.check_samples:
+                self.flat_channels = [channel for channel, flat in zip(self.eeg_channels, self._block_max == self._block_min) if flat]
+                railed = np.maximum(np.abs(self._block_min), np.abs(self._block_max)) >= self.rail_threshold
+                self.railed_channels = [channel for channel, rail in zip(self.eeg_channels, railed) if rail]
+                self._block_min = self._block_max = None
+                self._block_samples = 0
+
+    def _count_lost_samples(self, counters):
+        """
+        Counts the samples missing between consecutive package counters (which wrap at COUNTER_MODULUS).
+        """
+        if self._last_counter is not None:
+            counters = np.concatenate(([self._last_counter], counters))
+        self._last_counter = counters[-1]
+        if len(counters) < 2:
+            return
+        steps = np.diff(counters).astype(np.int64) % COUNTER_MODULUS
+        if self._counter_step is None:
+            # Boards merging packets (e.g. the Cyton with its Daisy) step by more than 1
+            if not np.any(steps > 0):
+                return
+            self._counter_step = int(steps[steps > 0].min())
+        lost = steps[steps != self._counter_step]
+        self.gaps += len(lost)
+        self.lost_samples += int(np.sum((lost - self._counter_step) % COUNTER_MODULUS)) // self._counter_step
+
+    def record_error(self):
+        """
+        Counts a read that raised an error.
+        """
+        self.read_errors += 1
+        self.consecutive_errors += 1
+
+    def effective_rate(self, now=None):
+        """
+        Returns:
+            float: Samples per second received over the last rate_window seconds (or since the connection, if shorter).
+        """
+        now = time.perf_counter() if now is None else now
+        elapsed = min(self.rate_window, now - self.connected_time)
+        if elapsed <= 0:
+            return 0.0
+        return sum(n for arrival, n in self._arrivals if arrival >= now - self.rate_window) / elapsed
+
+    def connection_problem(self, now=None):
+        """
+        Returns:
+            str: Why the connection has to be re-established, or None if it is fine.
+        """
+        now = time.perf_counter() if now is None else now
+        if self.consecutive_errors >= self.max_consecutive_errors:
+            return f"{self.consecutive_errors} read errors in a row"
+        if now - self.last_data_time > self.stall_timeout:
+            return f"no data for {now - self.last_data_time:.1f} s"
+        if self.sampling_rate and now - self.connected_time >= self.rate_window:
+            rate = self.effective_rate(now)
+            if rate < self.min_rate_fraction * self.sampling_rate:
+                return f"{rate:.0f} of {self.sampling_rate} samples per second"
+        return None
+
+    def signal_problem(self):
+        """
+        Returns:
+            str: Why the EEG can't be scored although data arrives (every channel flat or railed), or None if it can.
+        """
+        unusable = set(self.flat_channels) | set(self.railed_channels)
+        if self.eeg_channels and unusable.issuperset(self.eeg_channels):
+            return "every channel flat or railed"
+        return None
+
+    def counters(self, now=None):
+        """
+        Returns:
+            dict: The counters, for logging.
+        """
+        return {'samples': self.samples, 'lost_samples': self.lost_samples, 'gaps': self.gaps,
+                'effective_rate': round(self.effective_rate(now), 2), 'read_errors': self.read_errors,
+                'reconnects': self.reconnects, 'flat_channels': list(self.flat_channels),
+                'railed_channels': list(self.railed_channels)}
+
+    def summary(self, now=None):
+        """
+        Returns:
+            str: The counters on one line.
+        """
+        counters = self.counters(now)
+        return (f"{counters['samples']} samples, {counters['lost_samples']} lost in {counters['gaps']} gaps, "
+                f"{counters['effective_rate']:.1f} Hz, {counters['read_errors']} read errors, {counters['reconnects']} reconnects, "
+                f"flat {counters['flat_channels'] or 'none'}, railed {counters['railed_channels'] or 'none'}")
@@ -0,0 +1,398 @@
+import argparse
+import collections
+import json
+import os
+import selectors
+import socket
+import struct
+import threading
+import time
+import numpy as np
+
+###################
+# This file holds the local broadcast of Alpha-war: the game publishes the scores of every board (and optionally
+# downsampled raw windows) on a localhost TCP or Unix socket, for spectator displays and other demos. Any number of
+# subscribers can connect. Frames are queued per subscriber and sent by a background thread; a subscriber that can't
+# keep up loses its oldest frames, it never slows the game down.
+#
+# Every frame is a 22-byte little-endian header followed by a rows x cols array:
+#   magic b'AW', version (uint8), kind (uint8), board (uint16), sequence (uint32), rows (uint32), cols (uint32),
+#   payload length in bytes (uint32)
+# - INFO (kind 0):    JSON (uint8 bytes) describing the boards, sent first to every subscriber
+# - SCORES (kind 1):  float64, one row per score with the columns listed in INFO['fields']
+# - WINDOW (kind 2):  float32, one row per EEG channel, the latest epoch downsampled by INFO['window_decimation']
+# Sequences count the frames of each board and kind, a gap means frames were dropped.
+#
+# Stand-in subscriber, printing what it receives:
+#   python broadcast.py --address 127.0.0.1:5760
+###################
+DEFAULT_ADDRESS = ('127.0.0.1', 5760)
+MAGIC = b'AW'
+VERSION = 1
+INFO, SCORES, WINDOW = 0, 1, 2
+KIND_NAMES = {INFO: 'info', SCORES: 'scores', WINDOW: 'window'}
+_HEADER = struct.Struct('<2sBBHIIII')
+_DTYPES = {INFO: np.dtype('u1'), SCORES: np.dtype('<f8'), WINDOW: np.dtype('<f4')}
+
+
+def encode_frame(kind, board, sequence, array):
+    """
+    Encodes a frame (header and payload).
+
+    Args:
+        kind (int): INFO, SCORES or WINDOW.
+        board (int): Index of the board.
+        sequence (int): Number of frames of this board and kind sent before.
+        array (numpy.ndarray): 1-D (INFO) or 2-D array, converted to the dtype of the kind.
+
+    Returns:
+        bytes: The frame.
+    """
+    payload = np.ascontiguousarray(array, dtype=_DTYPES[kind])
+    rows, cols = (payload.shape[0], 1) if payload.ndim == 1 else payload.shape
+    return _HEADER.pack(MAGIC, VERSION, kind, board, sequence & 0xFFFFFFFF, rows, cols, payload.nbytes) + payload.tobytes()
+
+
+def parse_address(address):
+    """
+    Returns a socket address: a (host, port) tuple from 'host:port', or a Unix socket path.
+    """
+    if isinstance(address, (tuple, list)):
+        return tuple(address)
+    host, _, port = address.rpartition(':')
+    if port.isdigit():
+        return (host or DEFAULT_ADDRESS[0], int(port))
+    return address
+
+
+def _socket_family(address):
+    return socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+
+
+class _Subscriber:
+    """
+    Connection of one subscriber, with the frames waiting to be sent to it.
+    """
+
+    def __init__(self, connection, address, max_frames):
+        self.connection = connection
+        self.address = address
+        self.frames = collections.deque()
+        self.max_frames = max_frames
+        self.sending = None  # memoryview of what is left of the frame being sent
+        self.dropped = 0
+
+
+class ScorePublisher:
+    """
+    Publishes frames to every connected subscriber without ever blocking the caller.
+
+    publish_*() encode a frame once and queue it for every subscriber. A background thread accepts connections and
+    writes the queues to the (non-blocking) sockets. When a subscriber has max_frames frames waiting, its oldest
+    waiting frame is dropped; a frame that has started to be sent is always completed, so the stream stays parsable.
+
+    Attributes:
+        address: The (host, port) or Unix socket path listened on.
+        info (dict): Description of the boards, sent to every subscriber when it connects.
+        max_frames (int): Frames queued per subscriber before the oldest are dropped.
+        published (int): Number of frames published.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, info=None, max_frames=256):
+        """
+        Starts listening and the sender thread.
+
+        Args:
+            address (optional): (host, port), 'host:port' or a Unix socket path. Defaults to DEFAULT_ADDRESS.
+            info (dict, optional): Description of the boards (JSON serializable). Defaults to None.
+            max_frames (int, optional): Frames queued per subscriber before the oldest are dropped. Defaults to 256.
+        """
+        self.address = parse_address(address)
+        self.info = info or {}
+        self.max_frames = max_frames
+        self.published = 0
+        self._sequences = collections.Counter()
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)  # Left behind by a previous run
+        self._server = socket.socket(_socket_family(self.address), socket.SOCK_STREAM)
+        if not isinstance(self.address, str):
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(self.address)
+        self._server.listen()
+        self._server.setblocking(False)
+        if not isinstance(self.address, str):
+            self.address = self._server.getsockname()[:2]  # The actual port when port 0 was requested
+
+        # publish() wakes the sender thread through this pair instead of making it poll
+        self._wake_receiver, self._wake_sender = socket.socketpair()
+        self._wake_receiver.setblocking(False)
+        self._wake_sender.setblocking(False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._server, selectors.EVENT_READ, 'accept')
+        self._selector.register(self._wake_receiver, selectors.EVENT_READ, 'wake')
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='Broadcast', daemon=True)
+        self._thread.start()
+        print(f"[Broadcast] Publishing on {self.address}")
+
+    @property
+    def subscribers(self):
+        """
+        int: Number of connected subscribers.
+        """
+        with self._lock:
+            return len(self._subscribers)
+
+    @property
+    def dropped(self):
+        """
+        int: Frames dropped for the currently connected subscribers.
+        """
+        with self._lock:
+            return sum(subscriber.dropped for subscriber in self._subscribers)
+
+    def publish(self, kind, board, array):
+        """
+        Queues a frame for every subscriber. Does nothing (not even encoding) while there are none.
+
+        Args:
+            kind (int): SCORES or WINDOW.
+            board (int): Index of the board.
+            array (numpy.ndarray): The rows of the frame.
+        """
+        sequence = self._sequences[kind, board]
+        self._sequences[kind, board] += 1
+        if not self._subscribers:
+            return
+        frame = encode_frame(kind, board, sequence, array)
+        with self._lock:
+            for subscriber in self._subscribers:
+                if len(subscriber.frames) >= self.max_frames:
+                    subscriber.frames.popleft()
+                    subscriber.dropped += 1
+                subscriber.frames.append(frame)
+        self.published += 1
+        try:
+            self._wake_sender.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # Already woken
+
+    def publish_scores(self, board, records):
+        """
+        Publishes the score records of a board (see pipeline.SCORE_FIELDS). Empty records are not sent.
+        """
+        if len(records):
+            self.publish(SCORES, board, records)
+
+    def publish_window(self, board, window, decimation=1):
+        """
+        Publishes a window of a board, downsampled by averaging every `decimation` samples.
+
+        Args:
+            board (int): Index of the board.
+            window (numpy.ndarray): Array of shape (n_channels, n_samples), None is ignored.
+            decimation (int, optional): Samples averaged into one. Defaults to 1.
+        """
+        if window is None or not self._subscribers:
+            return
+        if decimation > 1:
+            n = window.shape[1] // decimation * decimation
+            window = window[:, window.shape[1] - n:].reshape(window.shape[0], -1, decimation).mean(axis=2)
+        self.publish(WINDOW, board, window)
+
+    def _run(self):
+        """
+        Sender loop executed by the broadcast thread.
+        """
+        pending = False
+        while not self._stop_event.is_set():
+            # Subscribers with a full socket buffer are retried soon, otherwise wait for a frame or a connection
+            for key, _ in self._selector.select(timeout=0.01 if pending else 0.5):
+                if key.data == 'accept':
+                    self._accept()
+                elif key.data == 'wake':
+                    try:
+                        while self._wake_receiver.recv(4096):
+                            pass
+                    except (BlockingIOError, OSError):
+                        pass
+            with self._lock:
+                subscribers = list(self._subscribers)
+            pending = False
+            for subscriber in subscribers:
+                pending |= self._send(subscriber)
+
+    def _accept(self):
+        try:
+            connection, address = self._server.accept()
+        except (BlockingIOError, OSError):
+            return
+        connection.setblocking(False)
+        if connection.family == socket.AF_INET:
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        subscriber = _Subscriber(connection, address or 'unix', self.max_frames)
+        subscriber.frames.append(encode_frame(INFO, 0, 0, np.frombuffer(json.dumps(self.info).encode(), dtype=np.uint8)))
+        with self._lock:
+            self._subscribers.append(subscriber)
+        print(f"[Broadcast] Subscriber connected ({subscriber.address})")
+
+    def _send(self, subscriber):
+        """
+        Writes as much of a subscriber's queue as its socket accepts without blocking.
+
+        Returns:
+            bool: True if frames are still waiting.
+        """
+        try:
+            while True:
+                if subscriber.sending is None:
+                    with self._lock:
+                        if not subscriber.frames:
+                            return False
+                        subscriber.sending = memoryview(subscriber.frames.popleft())
+                sent = subscriber.connection.send(subscriber.sending)
+                subscriber.sending = subscriber.sending[sent:] if sent < len(subscriber.sending) else None
+        except (BlockingIOError, InterruptedError):
+            return True  # Socket buffer full, the rest waits (and the oldest frames are dropped if it keeps up)
+        except OSError:
+            self._disconnect(subscriber)
+            return False
+
+    def _disconnect(self, subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+        subscriber.connection.close()
+        print(f"[Broadcast] Subscriber disconnected ({subscriber.address}, {subscriber.dropped} frames dropped)")
+
+    def close(self):
+        """
+        Stops the sender thread and closes every connection.
+        """
+        self._stop_event.set()
+        try:
+            self._wake_sender.send(b'\0')
+        except OSError:
+            pass
+        self._thread.join(timeout=1.0)
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, []
+        for subscriber in subscribers:
+            subscriber.connection.close()
+        self._selector.close()
+        self._server.close()
+        self._wake_receiver.close()
+        self._wake_sender.close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+
+class ScoreSubscriber:
+    """
+    Receives the frames of a ScorePublisher.
+
+    Attributes:
+        info (dict): Description of the boards, from the first frame.
+        missed (int): Frames missing from the sequences received so far (dropped by the publisher).
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=5.0):
+        """
+        Connects to a publisher and reads its INFO frame.
+
+        Args:
+            address (optional): (host, port), 'host:port' or a Unix socket path. Defaults to DEFAULT_ADDRESS.
+            timeout (float, optional): Seconds to wait for the connection. Defaults to 5.0.
+        """
+        address = parse_address(address)
+        self._socket = socket.socket(_socket_family(address), socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(address)
+        self._socket.settimeout(None)
+        self._expected = {}
+        self.missed = 0
+        kind, _, _, payload = self.receive()
+        if kind != INFO:
+            raise ValueError(f"Expected an info frame first, got kind {kind}")
+        self.info = json.loads(payload.tobytes().decode())
+
+    def _receive_exactly(self, n):
+        buffer = bytearray(n)
+        view = memoryview(buffer)
+        while view:
+            received = self._socket.recv_into(view)
+            if not received:
+                raise ConnectionError('Publisher closed the connection')
+            view = view[received:]
+        return buffer
+
+    def receive(self):
+        """
+        Waits for the next frame.
+
+        Returns:
+            tuple: (kind, board, sequence, array) with the array shaped (rows, cols), or (rows,) for INFO.
+
+        Raises:
+            ConnectionError: If the publisher closed the connection.
+            ValueError: If the stream is not made of frames.
+        """
+        magic, version, kind, board, sequence, rows, cols, length = _HEADER.unpack(self._receive_exactly(_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not an Alpha-war broadcast frame (magic {magic!r}, version {version})")
+        array = np.frombuffer(self._receive_exactly(length), dtype=_DTYPES[kind])
+        if kind != INFO:
+            array = array.reshape(rows, cols)
+            expected = self._expected.get((kind, board), sequence)
+            self.missed += (sequence - expected) & 0xFFFFFFFF
+            self._expected[kind, board] = (sequence + 1) & 0xFFFFFFFF
+        return kind, board, sequence, array
+
+    def __iter__(self):
+        """
+        Yields frames until the publisher closes the connection.
+        """
+        while True:
+            try:
+                yield self.receive()
+            except ConnectionError:
+                return
+
+    def close(self):
+        self._socket.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Print the scores broadcast by a running Alpha-war game.')
+    parser.add_argument('--address', default=f"{DEFAULT_ADDRESS[0]}:{DEFAULT_ADDRESS[1]}", help='host:port or Unix socket path of the game (default: %(default)s).')
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds to sleep after each frame, to act as a slow subscriber.')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    subscriber = ScoreSubscriber(args.address)
+    boards = subscriber.info.get('boards', [])
+    fields = subscriber.info.get('fields', [])
+    print(f"Connected, boards: {boards}, score fields: {fields}")
+    last_report = time.perf_counter()
+    received = collections.Counter()
+    try:
+        for kind, board, sequence, array in subscriber:
+            received[kind] += 1
+            name = boards[board] if board < len(boards) else board
+            if kind == SCORES:
+                for record in array:
+                    print(f"[{name}] score {record[0]:.3f}, {1000 * (time.time() - record[1]):.0f} ms after the sample")
+            now = time.perf_counter()
+            if now - last_report > 5:
+                print(f"{dict((KIND_NAMES[k], n) for k, n in received.items())} frames received, {subscriber.missed} dropped")
+                last_report = now
+            if args.delay:
+                time.sleep(args.delay)
+    except KeyboardInterrupt:
+        pass
+    subscriber.close()
@@ -0,0 +1,285 @@
+import json
+import math
+import os
+import time
+import numpy as np
+
+###################
+# This file holds the per-player calibration of Alpha-war. Before a match each player goes through an eyes-open and
+# an eyes-closed phase, and the scores collected build a baseline (running mean and variance, Welford's algorithm).
+# During play the rope moves on scores z-scored against each player's baseline, which keeps updating (optionally
+# exponentially weighted, to follow slow drifts), so headsets with different impedances play on equal terms.
+# Every game starts again from the calibrated baseline, and only the calibrated baselines are cached on disk per
+# player, so returning players can skip the calibration.
+###################
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+CALIBRATION_PHASES = (
+    ('eyes open', 'keep your eyes open and relax'),
+    ('eyes closed', 'close your eyes and relax'),
+)
+
+
+class RunningStats:
+    """
+    Running mean and variance in O(1) memory.
+
+    Uses Welford's algorithm, so the statistics are exact over every value so far. With a decay, once 1/decay values
+    have been seen, it switches to an exponentially weighted mean and variance where each new value has weight decay.
+    The values can also be arrays (element-wise statistics, e.g. one player in every game of simulate.py).
+
+    Attributes:
+        decay (float): Weight of each new value in exponentially weighted mode, None for cumulative statistics.
+        count (int): Number of values seen.
+        mean (float): Running mean.
+        variance (float): Running (population) variance.
+    """
+
+    def __init__(self, decay=None, mean=0.0, variance=0.0, count=0):
+        """
+        Initializes the statistics, empty or from saved values.
+
+        Args:
+            decay (float, optional): Weight of each new value once warmed up, None for cumulative statistics. Defaults to None.
+            mean (float, optional): Initial mean. Defaults to 0.0.
+            variance (float, optional): Initial variance. Defaults to 0.0.
+            count (int, optional): Number of values the initial statistics stand for. Defaults to 0.
+        """
+        self.decay = decay
+        self.mean = mean
+        self.variance = variance
+        self.count = count
+
+    def update(self, value):
+        """
+        Adds a value to the statistics.
+        """
+        self.count += 1
+        delta = value - self.mean
+        if self.decay is None or self.count * self.decay < 1:
+            # Welford's update of the mean and population variance
+            self.mean += delta / self.count
+            self.variance += (delta * (value - self.mean) - self.variance) / self.count
+        else:
+            increment = self.decay * delta
+            self.mean += increment
+            self.variance = (1 - self.decay) * (self.variance + delta * increment)
+
+    @property
+    def std(self):
+        """
+        float: Running standard deviation.
+        """
+        if np.ndim(self.variance) == 0:
+            return math.sqrt(max(self.variance, 0.0))
+        return np.sqrt(np.maximum(self.variance, 0.0))
+
+    @property
+    def spread_known(self):
+        """
+        bool: Whether at least two values with a spread were seen, i.e. values can be z-scored (element-wise for arrays).
+        """
+        std = self.std
+        if np.ndim(std) > 0:
+            return (std > 1e-12 * np.maximum(np.abs(self.mean), 1.0)) & (self.count >= 2)
+        return self.count >= 2 and std > 1e-12 * max(abs(self.mean), 1.0)
+
+    def zscore(self, value):
+        """
+        Returns how many standard deviations a value is from the mean (0 while the spread is unknown).
+        """
+        known = self.spread_known
+        if np.ndim(known) > 0:
+            return np.where(known, (value - self.mean) / np.where(known, self.std, 1.0), 0.0)
+        if not known:
+            return 0.0
+        return (value - self.mean) / self.std
+
+    def copy(self):
+        """
+        Returns:
+            RunningStats: Independent statistics with the same values (e.g. a calibrated baseline to follow a player
+                          through one game, leaving the calibration as it was).
+        """
+        return RunningStats(self.decay, self.mean, self.variance, self.count)
+
+    def to_dict(self):
+        return {'mean': self.mean, 'variance': self.variance, 'count': self.count}
+
+    @classmethod
+    def from_dict(cls, values, decay=None):
+        return cls(decay=decay, mean=values['mean'], variance=values['variance'], count=values['count'])
+
+
+def baseline_key(board_id, normalize, epoch_duration, hop_duration, notch_frequency, bandpass):
+    """
+    Returns the key of the settings a baseline depends on. Scores computed with other settings can't use it.
+    """
+    band = f"{bandpass[0]}-{bandpass[1]}" if bandpass is not None else 'none'
+    return f"board{board_id}/{normalize}/epoch{epoch_duration}/hop{hop_duration}/notch{notch_frequency}/band{band}"
+
+
+class Calibration:
+    """
+    The calibration phases of a match, collecting the scores of every player into a baseline.
+
+    Each phase lasts `duration` seconds. The scores of the first `settle_time` seconds of a phase still cover data from
+    the previous phase and are ignored.
+
+    Attributes:
+        players (list): Names of the players.
+        baselines (list): RunningStats of every player over all calibration phases.
+        phase_stats (list): RunningStats of every player for each phase, by phase name.
+    """
+
+    def __init__(self, players, duration=15, settle_time=2, phases=CALIBRATION_PHASES):
+        """
+        Initializes the calibration.
+
+        Args:
+            players (list): Names of the players.
+            duration (float, optional): Seconds per phase. Defaults to 15.
+            settle_time (float, optional): Seconds ignored at the start of each phase (use the epoch duration). Defaults to 2.
+            phases (tuple, optional): (name, instruction) of each phase. Defaults to CALIBRATION_PHASES.
+        """
+        self.players = players
+        self.duration = duration
+        self.settle_time = settle_time
+        self.phases = phases
+        self.baselines = [RunningStats() for _ in players]
+        self.phase_stats = [{name: RunningStats() for name, _ in phases} for _ in players]
+        self.start_time = None
+
+    def start(self, now=None):
+        """
+        Starts the first phase.
+        """
+        self.start_time = time.perf_counter() if now is None else now
+
+    def phase(self, now=None):
+        """
+        Returns:
+            int: Index of the current phase, None once the calibration is over.
+        """
+        elapsed = (time.perf_counter() if now is None else now) - self.start_time
+        index = int(elapsed // self.duration)
+        return index if index < len(self.phases) else None
+
+    def remaining(self, now=None):
+        """
+        Returns:
+            float: Seconds left in the current phase.
+        """
+        elapsed = (time.perf_counter() if now is None else now) - self.start_time
+        return self.duration - elapsed % self.duration
+
+    def is_done(self, now=None):
+        return self.phase(now) is None
+
+    def message(self, now=None):
+        """
+        Returns:
+            str: The instruction for the current phase, with the seconds left.
+        """
+        phase = self.phase(now)
+        if phase is None:
+            return "Calibration done"
+        name, instruction = self.phases[phase]
+        return f"Calibration {phase + 1}/{len(self.phases)} ({name}): everyone {instruction}... {math.ceil(self.remaining(now))} s"
+
+    def add(self, player, scores, now=None):
+        """
+        Adds new scores of a player to the current phase (ignored while the phase settles or after the last phase).
+
+        Args:
+            player (int): Index of the player.
+            scores (list): New scores of the player.
+        """
+        now = time.perf_counter() if now is None else now
+        phase = self.phase(now)
+        if phase is None or self.duration - self.remaining(now) < self.settle_time:
+            return
+        for score in scores:
+            self.baselines[player].update(score)
+            self.phase_stats[player][self.phases[phase][0]].update(score)
+
+
+class BaselineStore:
+    """
+    On-disk cache of player baselines, stored as JSON by player name and settings key.
+
+    Attributes:
+        path (str): Path of the JSON file.
+        max_age_days (float): Baselines older than this are treated as missing (None keeps them forever).
+        baselines (dict): {player: {settings key: entry}} with 'stats', 'phases' and 'updated' in each entry.
+    """
+
+    def __init__(self, path=DEFAULT_BASELINE_PATH, max_age_days=30):
+        """
+        Initializes the store and loads it from disk if the file exists.
+
+        Args:
+            path (str, optional): Path of the JSON file. Defaults to baselines.json next to this file.
+            max_age_days (float, optional): Days after which a baseline must be calibrated again. Defaults to 30.
+        """
+        self.path = path
+        self.max_age_days = max_age_days
+        self.baselines = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.baselines = json.load(f).get('players', {})
+            except (OSError, ValueError) as e:
+                print(f"Warning: couldn't read baselines {path}: {e}")
+
+    def get(self, player, key, decay=None):
+        """
+        Returns the cached baseline of a player for some settings.
+
+        Args:
+            player (str): Name of the player.
+            key (str): Settings key from baseline_key().
+            decay (float, optional): Decay of the returned RunningStats. Defaults to None.
+
+        Returns:
+            RunningStats: The baseline, or None if there is none (or it is too old, or can't z-score).
+        """
+        entry = self.baselines.get(player, {}).get(key)
+        if entry is None:
+            return None
+        if self.max_age_days is not None and time.time() - entry['updated'] > self.max_age_days * 86400:
+            return None
+        baseline = RunningStats.from_dict(entry['stats'], decay=decay)
+        return baseline if baseline.spread_known else None
+
+    def put(self, player, key, stats, phases=None, save=True):
+        """
+        Stores the baseline of a player.
+
+        Args:
+            player (str): Name of the player.
+            key (str): Settings key from baseline_key().
+            stats (RunningStats): The baseline.
+            phases (dict, optional): RunningStats of each calibration phase, kept for reference. Defaults to None.
+            save (bool, optional): Whether to write the file. Defaults to True.
+
+        Raises:
+            ValueError: If the baseline has too few scores or no spread (e.g. the board was flat during the calibration).
+        """
+        if not stats.spread_known:
+            raise ValueError(f"Baseline of {player} can't z-score ({stats.count} scores, std {stats.std:.3g}), not saving it")
+        entry = self.baselines.setdefault(player, {}).get(key, {})
+        entry.update(stats=stats.to_dict(), updated=time.time())
+        if phases is not None:
+            entry['phases'] = {name: phase.to_dict() for name, phase in phases.items()}
+        self.baselines[player][key] = entry
+        if save:
+            self.save()
+
+    def save(self):
+        """
+        Writes the store to disk (through a temporary file, so an interrupted write can't corrupt it).
+        """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': 1, 'players': self.baselines}, f, indent=2)
+        os.replace(tmp_path, self.path)
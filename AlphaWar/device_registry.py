@@ -0,0 +1,185 @@
+import json
+import os
+import time
+import threading
+import serial.tools.list_ports
+
+###################
+# This file holds the DeviceRegistry class, a small on-disk record of which dongle (identified by its USB serial
+# number, VID:PID and hardware ID) belongs to which player slot and board ID. Looking a known dongle up only needs a
+# scan of the serial ports, so reconnecting known hardware skips the probing done by find_device_ports. Boards are set
+# up in parallel threads sharing one registry, so every change and write holds the registry's lock.
+###################
+DEFAULT_REGISTRY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'device_registry.json')
+
+
+def get_port_identity(port):
+    """
+    Returns the stable hardware identity of a serial port, i.e. the parts that don't change when the COM number does.
+
+    Args:
+        port (ListPortInfo): A port from serial.tools.list_ports.comports().
+
+    Returns:
+        dict: 'serial_number', 'vid_pid' (e.g. '0403:6015', None if unknown) and 'hwid'.
+    """
+    vid_pid = None
+    if port.vid is not None and port.pid is not None:
+        vid_pid = f"{port.vid:04X}:{port.pid:04X}"
+    return {
+        'serial_number': port.serial_number,
+        'vid_pid': vid_pid,
+        'hwid': port.hwid,
+    }
+
+
+class DeviceRegistry:
+    """
+    Persistent mapping from hardware identity to player slot and board ID, stored as JSON.
+
+    Attributes:
+        path (str): Path of the JSON file backing the registry.
+        devices (list): One dictionary per registered device with 'player', 'board_id', 'serial_number',
+                        'vid_pid', 'hwid', 'last_port' and 'updated'.
+        lock (threading.RLock): Held while the devices are changed or written, so threads can share the registry.
+    """
+
+    def __init__(self, path=DEFAULT_REGISTRY_PATH):
+        """
+        Initializes the registry and loads it from disk if the file exists.
+
+        Args:
+            path (str, optional): Path of the JSON file. Defaults to device_registry.json next to this file.
+        """
+        self.path = path
+        self.devices = []
+        self.lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        """
+        Loads the registry from disk. A missing or unreadable file leaves the registry empty.
+        """
+        with self.lock:
+            if not os.path.exists(self.path):
+                self.devices = []
+                return
+            try:
+                with open(self.path) as f:
+                    self.devices = json.load(f).get('devices', [])
+            except (OSError, ValueError) as e:
+                print(f"Warning: couldn't read device registry {self.path}: {e}")
+                self.devices = []
+
+    def save(self):
+        """
+        Writes the registry to disk (through a temporary file, so an interrupted write can't corrupt it). The temporary
+        file is named after the process and thread, so writers never share one.
+        """
+        with self.lock:
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'version': 1, 'devices': self.devices}, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def matches(device, port):
+        """
+        Checks if a connected port is the hardware a registry entry describes.
+
+        The USB serial number is used when the dongle reports one, otherwise the hardware ID.
+        """
+        identity = get_port_identity(port)
+        if device.get('serial_number'):
+            return identity['serial_number'] == device['serial_number'] and \
+                (device.get('vid_pid') is None or identity['vid_pid'] == device['vid_pid'])
+        return device.get('hwid') not in (None, '', 'n/a') and identity['hwid'] == device['hwid']
+
+    def register(self, port, player, board_id, save=True):
+        """
+        Assigns the hardware behind a serial port to a player slot and board ID.
+
+        Any previous entry for the same player slot or the same hardware is replaced.
+
+        Args:
+            port (ListPortInfo or str): The port (or its device name, e.g. 'COM7') the dongle is connected to.
+            player (str): The player slot, e.g. 'Player 1'.
+            board_id (int): The BrainFlow board ID of the board behind the dongle.
+            save (bool, optional): Whether to write the registry to disk. Defaults to True.
+
+        Returns:
+            dict: The new registry entry.
+
+        Raises:
+            ValueError: If port is a device name that isn't currently connected.
+        """
+        if isinstance(port, str):
+            port = self._find_connected_port(port)
+
+        device = {
+            'player': player,
+            'board_id': board_id,
+            **get_port_identity(port),
+            'last_port': port.device,
+            'updated': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        with self.lock:
+            self.devices = [entry for entry in self.devices
+                            if entry['player'] != player and not self.matches(entry, port)]
+            self.devices.append(device)
+            if save:
+                self.save()
+        return device
+
+    def forget(self, player, save=True):
+        """
+        Removes the entry of a player slot.
+
+        Args:
+            player (str): The player slot to remove.
+            save (bool, optional): Whether to write the registry to disk. Defaults to True.
+        """
+        with self.lock:
+            self.devices = [device for device in self.devices if device['player'] != player]
+            if save:
+                self.save()
+
+    def find_port(self, board_id, player=None, exclude_ports=()):
+        """
+        Finds the current serial port of a registered dongle without probing it.
+
+        Args:
+            board_id (int): The BrainFlow board ID the dongle must be registered with.
+            player (str, optional): Only consider the entry of this player slot. Defaults to any player.
+            exclude_ports (iterable, optional): Ports that are already in use and must not be returned.
+
+        Returns:
+            str: The device name of the port (e.g. 'COM7'), or None if no registered dongle is connected.
+        """
+        with self.lock:
+            candidates = [device for device in self.devices
+                          if device['board_id'] == board_id and (player is None or device['player'] == player)]
+        if not candidates:
+            return None
+
+        for port in serial.tools.list_ports.comports():
+            if port.device in exclude_ports:
+                continue
+            for device in candidates:
+                if self.matches(device, port):
+                    if device.get('last_port') != port.device:
+                        with self.lock:
+                            device['last_port'] = port.device
+                            self.save()
+                    return port.device
+        return None
+
+    @staticmethod
+    def _find_connected_port(device_name):
+        """
+        Returns the ListPortInfo of a connected port from its device name.
+        """
+        for port in serial.tools.list_ports.comports():
+            if port.device == device_name:
+                return port
+        raise ValueError(f"Serial port {device_name} is not connected.")
@@ -0,0 +1,273 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from band_power import NORMALIZATION_MODES, get_band_power_plan
+
+###################
+# Micro-benchmarks of calculate_alpha_power for every normalization mode, across channel counts, sampling rates
+# (Cyton+Daisy 125 Hz, Cyton 250 Hz, 500 Hz and 1 kHz variants) and window lengths. Each case reports per-call latency,
+# peak memory allocated by a call and throughput in epochs per second, and is cross-checked against the original
+# FFT implementation. Results are written to JSON, and a previous results file can be compared against for regressions.
+#   python dsp_benchmark.py --output dsp_baseline.json
+#   python dsp_benchmark.py --compare dsp_baseline.json
+###################
+CHANNEL_COUNTS = (8, 16, 32)
+SAMPLING_RATES = (125, 250, 500, 1000)
+WINDOW_DURATIONS = (1, 2, 4)  # Seconds
+
+
+def reference_alpha_power(data, sampling_rate, normalize='betaalpha'):
+    """
+    The original calculate_alpha_power (full two-sided FFT, with the sampling rate passed in instead of a board ID).
+    Used as the reference for the correctness cross-check, and benchmarked with --reference for comparison.
+    """
+    # Compute the power spectrum for each channel
+    ps = np.abs(np.fft.fft(data, axis=1))**2
+    freqs = np.fft.fftfreq(data.shape[1], 1 / sampling_rate)
+
+    # Define the alpha and beta frequency ranges
+    alpha_range = (freqs >= 8) & (freqs <= 12)
+    beta_range = (freqs > 12) & (freqs <= 30)
+
+    # Calculate the alpha power for each channel by summing the power in the alpha band
+    alpha_powers = np.sum(ps[:, alpha_range], axis=1)
+
+    # Normalization or ratio calculations based on the specified method
+    if normalize == 'max':
+        # Normalize by the maximum FFT value per channel
+        normalization_factor = np.max(ps, axis=1)
+        normalized_alpha_powers = alpha_powers / normalization_factor
+        return np.sum(normalized_alpha_powers)
+
+    elif normalize == 'norm':
+        # Normalize by the vector norm of the power spectrum for each channel
+        normalization_factor = np.linalg.norm(ps, axis=1)
+        normalized_alpha_powers = alpha_powers / normalization_factor
+        return np.sum(normalized_alpha_powers)
+
+    elif normalize == 'betaalpha':
+        # Calculate the ratio of beta power to alpha power across all channels
+        beta_powers = np.sum(ps[:, beta_range], axis=1)
+        total_alpha_power = np.sum(alpha_powers)
+        total_beta_power = np.sum(beta_powers)
+
+        # Avoid division by zero
+        if total_alpha_power == 0:
+            return 0
+
+        return total_beta_power / total_alpha_power
+
+    else:
+        raise ValueError("The normalize parameter must be 'max', 'norm', or 'betaalpha'")
+
+
+def current_alpha_power(data, sampling_rate, normalize='betaalpha'):
+    """
+    What calculate_alpha_power runs once it has looked up the board's sampling rate. Board IDs don't exist for
+    every benchmarked rate, so the rate is passed in directly.
+    """
+    return get_band_power_plan(sampling_rate, data.shape[1], normalize).score(data)
+
+
+def make_test_data(n_channels, sampling_rate, n_samples, seed=0):
+    """
+    Returns EEG-like test data: an alpha and a beta sine with random phase per channel, plus white noise (in uV).
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_samples) / sampling_rate
+    phases = rng.uniform(0, 2 * np.pi, (n_channels, 2))
+    data = 20 * np.sin(2 * np.pi * 10 * t + phases[:, :1]) + 8 * np.sin(2 * np.pi * 20 * t + phases[:, 1:])
+    return data + rng.normal(0, 5, (n_channels, n_samples))
+
+
+def time_calls(function, args, min_calls=50, max_calls=2000, time_budget=0.2):
+    """
+    Times individual calls of a function, after one warm-up call.
+
+    Returns:
+        numpy.ndarray: Duration of each call in seconds.
+    """
+    function(*args)
+    durations = []
+    deadline = time.perf_counter() + time_budget
+    while len(durations) < max_calls and (len(durations) < min_calls or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        function(*args)
+        durations.append(time.perf_counter() - start)
+    return np.array(durations)
+
+
+def measure_allocations(function, args, calls=5):
+    """
+    Measures the memory allocated by a call with tracemalloc (NumPy reports its buffers to it), after a warm-up call.
+
+    Returns:
+        tuple: Largest peak (bytes) of traced memory above the starting point during a call, and the number of
+               bytes still held after the calls.
+    """
+    function(*args)
+    tracemalloc.start()
+    try:
+        peak = 0
+        baseline, _ = tracemalloc.get_traced_memory()
+        for _ in range(calls):
+            tracemalloc.reset_peak()
+            start, _ = tracemalloc.get_traced_memory()
+            function(*args)
+            _, call_peak = tracemalloc.get_traced_memory()
+            peak = max(peak, call_peak - start)
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+    return peak, retained
+
+
+def benchmark_case(function, normalize, n_channels, sampling_rate, window_duration, time_budget=0.2):
+    """
+    Benchmarks one configuration and cross-checks it against the reference implementation.
+
+    Returns:
+        dict: The configuration, latency statistics (microseconds), allocations, throughput and cross-check error.
+    """
+    n_samples = int(window_duration * sampling_rate)
+    data = make_test_data(n_channels, sampling_rate, n_samples)
+
+    expected = float(reference_alpha_power(data, sampling_rate, normalize))
+    actual = float(function(data, sampling_rate, normalize))
+    relative_error = abs(actual - expected) / max(abs(expected), np.finfo(float).tiny)
+
+    durations = time_calls(function, (data, sampling_rate, normalize), time_budget=time_budget) * 1e6
+    peak_bytes, retained_bytes = measure_allocations(function, (data, sampling_rate, normalize))
+    return {
+        'case': f"{normalize}/ch{n_channels}/fs{sampling_rate}/w{window_duration}s",
+        'normalize': normalize,
+        'channels': n_channels,
+        'sampling_rate': sampling_rate,
+        'window_s': window_duration,
+        'window_samples': n_samples,
+        'calls': int(durations.size),
+        'latency_us': {
+            'mean': float(durations.mean()),
+            'min': float(durations.min()),
+            'p50': float(np.percentile(durations, 50)),
+            'p90': float(np.percentile(durations, 90)),
+            'p99': float(np.percentile(durations, 99)),
+        },
+        'epochs_per_s': float(1e6 / np.median(durations)),
+        'alloc_peak_bytes': int(peak_bytes),
+        'alloc_retained_bytes': int(retained_bytes),
+        'relative_error': float(relative_error),
+    }
+
+
+def run_suite(modes=NORMALIZATION_MODES, channel_counts=CHANNEL_COUNTS, sampling_rates=SAMPLING_RATES,
+              window_durations=WINDOW_DURATIONS, reference=False, time_budget=0.2):
+    """
+    Runs every combination of the given modes, channel counts, sampling rates and window lengths.
+
+    Args:
+        modes (tuple, optional): Normalization modes. Defaults to all of them.
+        channel_counts (tuple, optional): Channel counts. Defaults to CHANNEL_COUNTS.
+        sampling_rates (tuple, optional): Sampling rates in Hz. Defaults to SAMPLING_RATES.
+        window_durations (tuple, optional): Window lengths in seconds. Defaults to WINDOW_DURATIONS.
+        reference (bool, optional): Benchmark the original implementation instead of the current one. Defaults to False.
+        time_budget (float, optional): Seconds spent timing each case. Defaults to 0.2.
+
+    Returns:
+        dict: 'config', 'environment' and one entry per case under 'results'.
+    """
+    function = reference_alpha_power if reference else current_alpha_power
+    results = []
+    for normalize in modes:
+        for n_channels in channel_counts:
+            for sampling_rate in sampling_rates:
+                for window_duration in window_durations:
+                    result = benchmark_case(function, normalize, n_channels, sampling_rate, window_duration, time_budget)
+                    print(f"{result['case']:<28} p50 {result['latency_us']['p50']:9.1f} us  "
+                          f"{result['epochs_per_s']:10.0f} epochs/s  peak {result['alloc_peak_bytes']:>9} B  "
+                          f"err {result['relative_error']:.1e}")
+                    results.append(result)
+    return {
+        'config': {
+            'implementation': 'reference' if reference else 'current',
+            'modes': list(modes),
+            'channel_counts': list(channel_counts),
+            'sampling_rates': list(sampling_rates),
+            'window_durations': list(window_durations),
+            'time_budget_s': time_budget,
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def compare_results(current, baseline, threshold=1.2):
+    """
+    Compares the median latency of every case with a previous run.
+
+    Args:
+        current (dict): Results of run_suite().
+        baseline (dict): Results of a previous run (e.g. loaded from its JSON file).
+        threshold (float, optional): Latency ratio above which a case counts as a regression. Defaults to 1.2.
+
+    Returns:
+        list: The cases that regressed, as (case, baseline p50 us, current p50 us) tuples.
+    """
+    baseline_cases = {result['case']: result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        previous = baseline_cases.get(result['case'])
+        if previous is None:
+            continue
+        ratio = result['latency_us']['p50'] / previous['latency_us']['p50']
+        if ratio > threshold:
+            regressions.append((result['case'], previous['latency_us']['p50'], result['latency_us']['p50']))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark calculate_alpha_power across modes, channel counts, sampling rates and window lengths.')
+    parser.add_argument('--modes', nargs='+', choices=NORMALIZATION_MODES, default=list(NORMALIZATION_MODES))
+    parser.add_argument('--channels', nargs='+', type=int, default=list(CHANNEL_COUNTS))
+    parser.add_argument('--rates', nargs='+', type=int, default=list(SAMPLING_RATES))
+    parser.add_argument('--windows', nargs='+', type=float, default=list(WINDOW_DURATIONS), help='Window lengths in seconds.')
+    parser.add_argument('--time-budget', type=float, default=0.2, help='Seconds spent timing each case (default: 0.2).')
+    parser.add_argument('--reference', action='store_true', help='Benchmark the original implementation instead of the current one.')
+    parser.add_argument('--output', default='dsp_benchmark.json', help='File to write the results to (default: dsp_benchmark.json).')
+    parser.add_argument('--compare', metavar='BASELINE', help='Results file of a previous run to check for regressions.')
+    parser.add_argument('--threshold', type=float, default=1.2, help='Latency ratio counted as a regression (default: 1.2).')
+    parser.add_argument('--tolerance', type=float, default=1e-9, help='Largest relative error accepted by the cross-check (default: 1e-9).')
+    args = parser.parse_args()
+
+    suite = run_suite(args.modes, args.channels, args.rates, args.windows, args.reference, args.time_budget)
+    with open(args.output, 'w') as f:
+        json.dump(suite, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    failed = [result['case'] for result in suite['results'] if not result['relative_error'] <= args.tolerance]
+    if failed:
+        print(f"Cross-check against the reference failed for: {', '.join(failed)}")
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(suite, json.load(f), args.threshold)
+        for case, previous, latest in regressions:
+            print(f"Regression in {case}: {previous:.1f} us -> {latest:.1f} us ({latest / previous:.2f}x)")
+        if not regressions:
+            print(f"No case is more than {args.threshold}x slower than {args.compare}")
+
+    sys.exit(1 if failed or regressions else 0)
@@ -0,0 +1,187 @@
+from functools import lru_cache
+import numpy as np
+
+###################
+# This file holds the preprocessing stage of Alpha-war: causal IIR filters (a mains notch and a bandpass, as
+# second-order sections) applied to the EEG rows between the ring-buffer reads and the band-power computation.
+# The filter state is kept between chunks, so every sample is filtered exactly once, and all channels of a board
+# (and boards that can share a call) are filtered by a single sosfilt call.
+# scipy.signal takes about a second to import, so it is only imported once a filter is designed (the game then
+# imports it while the boards connect, and not at all when scoring in a worker process).
+###################
+DEFAULT_NOTCH_FREQUENCY = 60  # Hz, mains frequency (50 Hz in Europe and most of Asia)
+DEFAULT_BANDPASS = (1, 45)  # Hz, removes the DC offset and slow drifts, and high-frequency noise
+
+
+@lru_cache(maxsize=32)
+def design_filter(sampling_rate, notch_frequency=DEFAULT_NOTCH_FREQUENCY, bandpass=DEFAULT_BANDPASS, order=4, notch_quality=30):
+    """
+    Designs the preprocessing filter of a sampling rate (cached, the same design is shared by every board).
+
+    Args:
+        sampling_rate (int): Sampling rate of the data in Hz.
+        notch_frequency (float, optional): Frequency of the notch in Hz, None for no notch. Defaults to DEFAULT_NOTCH_FREQUENCY.
+        bandpass (tuple, optional): (low, high) edges of the Butterworth bandpass in Hz, None for no bandpass. Defaults to DEFAULT_BANDPASS.
+        order (int, optional): Order of the Butterworth bandpass. Defaults to 4.
+        notch_quality (float, optional): Quality factor of the notch. Defaults to 30.
+
+    Returns:
+        numpy.ndarray: Second-order sections of shape (n_sections, 6), shared by every caller (don't modify them),
+                       None if there is nothing to filter.
+
+    Raises:
+        ValueError: If a frequency is not below the Nyquist frequency.
+    """
+    from scipy.signal import butter, iirnotch, tf2sos
+
+    nyquist = sampling_rate / 2
+    sections = []
+    if bandpass is not None:
+        low, high = bandpass
+        if not 0 < low < high < nyquist:
+            raise ValueError(f"The bandpass {bandpass} Hz must be within (0, {nyquist}) Hz")
+        sections.append(butter(order, (low, high), btype='bandpass', fs=sampling_rate, output='sos'))
+    if notch_frequency is not None:
+        if not 0 < notch_frequency < nyquist:
+            raise ValueError(f"The notch frequency {notch_frequency} Hz must be within (0, {nyquist}) Hz")
+        b, a = iirnotch(notch_frequency, notch_quality, fs=sampling_rate)
+        sections.append(tf2sos(b, a))
+    if not sections:
+        return None
+    return np.concatenate(sections)
+
+
+class StreamingFilter:
+    """
+    Causal filter for the channels of one board, keeping its state between chunks.
+
+    The state starts at the steady state of the first sample of each channel, so the DC offset of the electrodes
+    doesn't produce a transient. Call reset() when the stream jumps (e.g. samples were skipped).
+
+    Attributes:
+        n_channels (int): Number of channels per chunk.
+        sampling_rate (int): Sampling rate of the data in Hz.
+        sos (numpy.ndarray): The second-order sections, None if the filter passes data through.
+    """
+
+    def __init__(self, n_channels, sampling_rate, notch_frequency=DEFAULT_NOTCH_FREQUENCY, bandpass=DEFAULT_BANDPASS, order=4):
+        """
+        Initializes the filter.
+
+        Args:
+            n_channels (int): Number of channels per chunk.
+            sampling_rate (int): Sampling rate of the data in Hz.
+            notch_frequency (float, optional): Frequency of the notch in Hz, None for no notch. Defaults to DEFAULT_NOTCH_FREQUENCY.
+            bandpass (tuple, optional): (low, high) bandpass edges in Hz, None for no bandpass. Defaults to DEFAULT_BANDPASS.
+            order (int, optional): Order of the Butterworth bandpass. Defaults to 4.
+        """
+        self.n_channels = n_channels
+        self.sampling_rate = sampling_rate
+        self.sos = design_filter(sampling_rate, notch_frequency, tuple(bandpass) if bandpass is not None else None, order)
+        self._zi_unit = None
+        if self.sos is not None:
+            from scipy.signal import sosfilt_zi
+            self._zi_unit = sosfilt_zi(self.sos)[:, None, :]
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the filter state, the next chunk starts the filter again from its first sample.
+        """
+        self.zi = None
+
+    def _initial_state(self, chunk):
+        """
+        Returns the steady-state filter state for the first sample of each channel of a chunk.
+        """
+        return self._zi_unit * chunk[None, :, 0, None]
+
+    def process(self, chunk):
+        """
+        Filters the next samples of the stream.
+
+        Args:
+            chunk (numpy.ndarray): Array of shape (n_channels, n_samples) with the samples following the previous chunk.
+
+        Returns:
+            numpy.ndarray: The filtered samples (a new array, chunk is not modified).
+        """
+        if self.sos is None or chunk.shape[1] == 0:
+            return np.array(chunk, dtype=float)
+        from scipy.signal import sosfilt
+
+        if self.zi is None:
+            self.zi = self._initial_state(chunk)
+        filtered, self.zi = sosfilt(self.sos, chunk, axis=-1, zi=self.zi)
+        return filtered
+
+
+class FilterBank:
+    """
+    The StreamingFilters of several boards, filtered together where possible.
+
+    Boards with the same filter design whose chunks have the same length are stacked along the channel axis and
+    filtered by one sosfilt call (this is the usual case when replaying, where every board gets the same number of
+    samples per step); the others are filtered one by one.
+
+    Attributes:
+        filters (list): The StreamingFilter of each board.
+    """
+
+    def __init__(self, filters):
+        """
+        Initializes the bank.
+
+        Args:
+            filters (list): The StreamingFilter of each board, in the order chunks are passed to process().
+        """
+        self.filters = filters
+
+    def reset(self):
+        """
+        Forgets the filter state of every board.
+        """
+        for streaming_filter in self.filters:
+            streaming_filter.reset()
+
+    def process(self, chunks):
+        """
+        Filters the next chunk of every board.
+
+        Args:
+            chunks (list): One (n_channels, n_samples) array per board.
+
+        Returns:
+            list: The filtered chunk of each board.
+        """
+        from scipy.signal import sosfilt
+
+        results = [None] * len(chunks)
+        groups = {}
+        for i, (streaming_filter, chunk) in enumerate(zip(self.filters, chunks)):
+            if streaming_filter.sos is None or chunk.shape[1] == 0:
+                results[i] = streaming_filter.process(chunk)
+            else:
+                groups.setdefault((id(streaming_filter.sos), chunk.shape[1]), []).append(i)
+
+        for indices in groups.values():
+            if len(indices) == 1:
+                results[indices[0]] = self.filters[indices[0]].process(chunks[indices[0]])
+                continue
+
+            # One call for the whole group, with the states of its boards stacked like their channels
+            members = [self.filters[i] for i in indices]
+            for i, streaming_filter in zip(indices, members):
+                if streaming_filter.zi is None:
+                    streaming_filter.zi = streaming_filter._initial_state(chunks[i])
+            stacked = np.concatenate([chunks[i] for i in indices])
+            zi = np.concatenate([streaming_filter.zi for streaming_filter in members], axis=1)
+            filtered, zi = sosfilt(members[0].sos, stacked, axis=-1, zi=zi)
+
+            start = 0
+            for i, streaming_filter in zip(indices, members):
+                stop = start + streaming_filter.n_channels
+                results[i] = filtered[start:stop]
+                streaming_filter.zi = zi[:, start:stop]
+                start = stop
+        return results
@@ -0,0 +1,204 @@
+import json
+import time
+from collections import deque
+import numpy as np
+
+###################
+# This file holds the end-to-end latency instrumentation of Alpha-war. Every score is followed from the BrainFlow
+# timestamp of the newest sample in its window through the stages of the game loop, and the delay of each stage
+# (relative to that sample) is kept in a rolling histogram per board. The histograms and the most recent records can
+# be exported as JSON at the end of a session.
+###################
+# Stages of a score, in pipeline order
+STAGES = ('acquired', 'read', 'dsp', 'rope', 'display')
+# - 'acquired': the acquisition thread drained the sample from the board
+# - 'read':     the game loop read it from the ring buffer
+# - 'dsp':      its window was scored
+# - 'rope':     the score moved the rope
+# - 'display':  the frame showing that rope position was sent to the display
+
+# Marker value inserted into the board streams at every rope move when markers are enabled
+ROPE_MARKER = 3
+
+
+class RollingHistogram:
+    """
+    Histogram of the last `window` values of a latency, with fixed bins.
+
+    Attributes:
+        edges (numpy.ndarray): Bin edges in seconds. Values above the last edge are counted in the last bin.
+        window (int): Number of recent values kept.
+        total (int): Number of values added since creation.
+    """
+
+    def __init__(self, edges, window=2000):
+        """
+        Initializes an empty histogram.
+
+        Args:
+            edges (numpy.ndarray): Bin edges in seconds.
+            window (int, optional): Number of recent values kept. Defaults to 2000.
+        """
+        self.edges = edges
+        self.window = window
+        self.total = 0
+        self._values = np.zeros(window)
+        self._bins = np.zeros(window, dtype=np.intp)
+        self._counts = np.zeros(len(edges) - 1, dtype=np.int64)
+
+    def add(self, value):
+        """
+        Adds a value, dropping the oldest one once the window is full.
+        """
+        slot = self.total % self.window
+        if self.total >= self.window:
+            self._counts[self._bins[slot]] -= 1
+        bin_index = min(max(int(np.searchsorted(self.edges, value, side='right')) - 1, 0), len(self._counts) - 1)
+        self._values[slot] = value
+        self._bins[slot] = bin_index
+        self._counts[bin_index] += 1
+        self.total += 1
+
+    def values(self):
+        """
+        Returns:
+            numpy.ndarray: The values in the window (not in chronological order).
+        """
+        return self._values[:min(self.total, self.window)]
+
+    @property
+    def counts(self):
+        """
+        numpy.ndarray: Number of values of the window in each bin.
+        """
+        return self._counts.copy()
+
+    def summary(self, scale=1000.0):
+        """
+        Summarizes the window.
+
+        Args:
+            scale (float, optional): Factor applied to the values, 1000 to report milliseconds. Defaults to 1000.
+
+        Returns:
+            dict: count, mean, p50, p90, p99 and max of the window (None if empty).
+        """
+        values = self.values() * scale
+        if values.size == 0:
+            return None
+        p50, p90, p99 = np.percentile(values, (50, 90, 99))
+        return {'count': int(values.size), 'mean': float(values.mean()), 'p50': float(p50), 'p90': float(p90),
+                'p99': float(p99), 'max': float(values.max())}
+
+
+class LatencyTracker:
+    """
+    Follows scores through the stages of the game loop and keeps a rolling histogram per board and stage.
+
+    Usage: start() a record when a score is computed (with the timestamp of the newest sample of its window), stamp()
+    the later stages as they happen and finish() it once it has been displayed.
+
+    Attributes:
+        stages (tuple): Stage names, in pipeline order.
+        histograms (dict): {board: {stage: RollingHistogram}} of the delay from the sample to each stage.
+        records (deque): The most recent finished records, for export.
+    """
+
+    def __init__(self, stages=STAGES, window=2000, bin_width=0.005, max_latency=2.0, keep_records=10000):
+        """
+        Initializes the tracker.
+
+        Args:
+            stages (tuple, optional): Stage names, in pipeline order. Defaults to STAGES.
+            window (int, optional): Number of recent scores in each histogram. Defaults to 2000.
+            bin_width (float, optional): Width of the histogram bins in seconds. Defaults to 0.005.
+            max_latency (float, optional): Upper edge of the last bin in seconds. Defaults to 2.0.
+            keep_records (int, optional): Number of finished records kept for export. Defaults to 10000.
+        """
+        self.stages = stages
+        self.window = window
+        self.edges = np.arange(0, max_latency + bin_width / 2, bin_width)
+        self.histograms = {}
+        self.records = deque(maxlen=keep_records)
+        self.started = time.time()
+
+    def start(self, board, sample_time, **stage_times):
+        """
+        Starts the record of a score.
+
+        Args:
+            board (str): Name of the board the score belongs to.
+            sample_time (float): BrainFlow timestamp (UNIX time) of the newest sample in the scored window.
+            **stage_times: UNIX times of the stages already reached, e.g. acquired=..., read=..., dsp=...
+
+        Returns:
+            dict: The record, to pass to stamp() and finish().
+        """
+        record = {'board': board, 'sample_time': sample_time}
+        record.update(stage_times)
+        return record
+
+    def stamp(self, records, stage, stage_time=None):
+        """
+        Stamps the time a stage was reached on one or more records.
+
+        Args:
+            records (dict or list): A record, or a list of records (None entries are skipped).
+            stage (str): The stage.
+            stage_time (float, optional): UNIX time the stage was reached. Defaults to now.
+        """
+        stage_time = time.time() if stage_time is None else stage_time
+        for record in [records] if isinstance(records, dict) else records:
+            if record is not None:
+                record[stage] = stage_time
+
+    def finish(self, record):
+        """
+        Adds the delay of every stamped stage of a record to the histograms of its board.
+        """
+        if record is None:
+            return
+        histograms = self.histograms.get(record['board'])
+        if histograms is None:
+            histograms = self.histograms[record['board']] = {stage: RollingHistogram(self.edges, self.window) for stage in self.stages}
+        for stage in self.stages:
+            if record.get(stage) is not None:
+                histograms[stage].add(record[stage] - record['sample_time'])
+        self.records.append(record)
+
+    def summary(self):
+        """
+        Returns:
+            dict: {board: {stage: summary in milliseconds}} over the rolling window.
+        """
+        return {board: {stage: histogram.summary() for stage, histogram in histograms.items()}
+                for board, histograms in self.histograms.items()}
+
+    def report(self):
+        """
+        Prints the median and 99th percentile delay of each stage for each board.
+        """
+        for board, stages in self.summary().items():
+            parts = [f"{stage} {stats['p50']:.0f}/{stats['p99']:.0f}" for stage, stats in stages.items() if stats]
+            print(f"[{board}] Latency from sample, p50/p99 ms: {', '.join(parts)}")
+
+    def export(self, path):
+        """
+        Writes the histograms, their summaries and the recent records as JSON.
+
+        Args:
+            path (str): The file to write.
+        """
+        document = {
+            'started': self.started,
+            'stages': list(self.stages),
+            'units': {'summary': 'ms', 'edges': 's', 'records': 'UNIX time (s)'},
+            'edges': self.edges.tolist(),
+            'summary': self.summary(),
+            'histograms': {board: {stage: {'counts': histogram.counts.tolist(), 'total': histogram.total}
+                                   for stage, histogram in histograms.items()}
+                           for board, histograms in self.histograms.items()},
+            'records': list(self.records),
+        }
+        with open(path, 'w') as f:
+            json.dump(document, f, indent=2)
@@ -0,0 +1,110 @@
+import json
+import time
+from contextlib import contextmanager
+import numpy as np
+
+###################
+# This file holds PerfStats, a small collector of timing samples (seconds) for the Alpha-war loop. main() records
+# into it when one is passed in, and benchmark.py turns it into a JSON summary with percentiles.
+###################
+class PerfStats:
+    """
+    Collects named samples (usually durations in seconds) and summarizes them with percentiles.
+
+    Attributes:
+        samples (dict): Samples recorded for each metric name, in recording order.
+        counters (dict): Named counts (e.g. frames, epochs).
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty collector.
+        """
+        self.samples = {}
+        self.counters = {}
+        self.start_time = time.perf_counter()
+
+    def add(self, metric, value):
+        """
+        Records one sample of a metric.
+
+        Args:
+            metric (str): Name of the metric, e.g. 'frame_time'.
+            value (float): The sample (seconds for durations).
+        """
+        self.samples.setdefault(metric, []).append(value)
+
+    def count(self, counter, n=1):
+        """
+        Increments a named counter.
+
+        Args:
+            counter (str): Name of the counter, e.g. 'frames'.
+            n (int, optional): Amount to add. Defaults to 1.
+        """
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    @contextmanager
+    def time(self, metric):
+        """
+        Context manager recording the wall time of its block as a sample of a metric.
+
+        Args:
+            metric (str): Name of the metric.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(metric, time.perf_counter() - start)
+
+    def summary(self, percentiles=(50, 90, 95, 99), scale=1000.0):
+        """
+        Summarizes every metric.
+
+        Args:
+            percentiles (tuple, optional): Percentiles to report. Defaults to (50, 90, 95, 99).
+            scale (float, optional): Factor applied to the samples, e.g. 1000 to report seconds as milliseconds. Defaults to 1000.
+
+        Returns:
+            dict: 'elapsed_s', 'counters' and, under 'metrics', the count, mean, min, max and percentiles of each metric.
+        """
+        metrics = {}
+        for metric, values in self.samples.items():
+            values = np.asarray(values) * scale
+            if values.size == 0:
+                continue
+            stats = {
+                'count': int(values.size),
+                'mean': float(values.mean()),
+                'min': float(values.min()),
+                'max': float(values.max()),
+            }
+            for p, value in zip(percentiles, np.percentile(values, percentiles)):
+                stats[f'p{p}'] = float(value)
+            metrics[metric] = stats
+        return {
+            'elapsed_s': time.perf_counter() - self.start_time,
+            'counters': dict(self.counters),
+            'metrics': metrics,
+        }
+
+    def to_json(self, path=None, extra=None, **kwargs):
+        """
+        Returns the summary as JSON and optionally writes it to a file.
+
+        Args:
+            path (str, optional): File to write the JSON to. Defaults to None (not written).
+            extra (dict, optional): Additional top-level fields, e.g. the benchmark configuration.
+            **kwargs: Passed to summary().
+
+        Returns:
+            str: The JSON document.
+        """
+        document = dict(extra or {})
+        document.update(self.summary(**kwargs))
+        text = json.dumps(document, indent=2)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text + '\n')
+        return text
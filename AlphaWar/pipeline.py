@@ -0,0 +1,534 @@
+import threading
+import time
+from collections import deque
+import numpy as np
+from brainflow.board_shim import BoardShim
+from alpha_war_funcs import BrainFlowBoardSetup, setup_boards
+from acquisition import AcquisitionScheduler, BoardAcquisition
+from alignment import BoardClock, resample
+from band_power import BatchSlidingBandPower
+from filters import FilterBank, StreamingFilter
+from recording import SessionRecorder
+
+###################
+# This file holds the scoring pipeline of Alpha-war: the boards, their acquisition, the EEG filters and the sliding
+# band-power engines, from the BrainFlow sessions to a stream of scores per board. A single scheduler drains every
+# board, and boards with the same sampling rate and channel count are read in lockstep and scored together, so the
+# cost of a read grows slowly with the number of players. The boards are resampled onto a shared time grid from their
+# BrainFlow timestamps, so every player is scored over the same interval (see alignment.py). A board whose connection drops is reconnected in the
+# background while the others keep playing. The game runs the pipeline in its own process, or in a worker process
+# that publishes the scores through shared memory (see score_worker.py).
+###################
+# Columns of the score records returned by ScorePipeline.read()
+SCORE_FIELDS = ('score', 'sample_time', 'acquired', 'read', 'dsp', 'window_time', 'alignment_error')
+# - 'score':           the alpha power score of the window
+# - 'sample_time':     BrainFlow timestamp (UNIX time) of the newest sample of the window
+# - 'acquired':        UNIX time that sample was drained from the board (NaN if unknown)
+# - 'read':            UNIX time it was read from the ring buffer
+# - 'dsp':             UNIX time the window was scored
+# - 'window_time':     UNIX time the window ends at, the same for every board scored over that interval (the board's
+#                      own timestamp when the boards aren't aligned)
+# - 'alignment_error': seconds between the board's own timestamp at the end of the window and window_time, i.e. how far
+#                      BrainFlow's timestamps put the board's window from the common interval (NaN when not aligned)
+SCORE = SCORE_FIELDS.index('score')
+
+
+def player_config(name, board_id, serial_port=None, channels=None):
+    """
+    Returns the description of a player's board, as passed to ScorePipeline (plain values, so it can be sent to
+    another process).
+    """
+    return {'name': name, 'board_id': board_id, 'serial_port': serial_port, 'channels': channels}
+
+
+class ScorePipeline:
+    """
+    Boards, acquisition, filtering and scoring of every player.
+
+    Every board is drained by one scheduler thread (or on every read() when not threaded), its EEG channels are
+    filtered and a score is produced every hop from the last epoch.
+
+    Every read scores the boards up to a common end time, the newest time every board has a sample for (from a
+    BoardClock fitted to its BrainFlow timestamps): each board is interpolated onto the same time grid, so windows
+    scored together cover the same interval whatever the transport delay of each board. Boards sharing a sampling
+    rate, epoch, hop and channel count form a group, fed the same number of grid samples and scored together by one
+    BatchSlidingBandPower. Boards that don't have a full epoch yet (e.g. still connecting) are skipped, their group
+    goes on without them. Without alignment, every read takes the same number of samples from each board of a group
+    instead (what the slowest one has, a board ahead by more than a hop skips its oldest samples).
+
+    Every read also checks the health of each board (see board_health.py). A board whose connection is lost is
+    reconnected in a background thread, and a board whose channels are all flat or railed is left out; either way
+    it is skipped (its player paused, see paused_boards()) until it is healthy and has been fed a whole new epoch.
+
+    Attributes:
+        players (list): player_config() of every board.
+        names (list): Name of every board.
+        boards (list): BrainFlowBoardSetup of every board, once started.
+        acquisitions (list): BoardAcquisition of every board, once started.
+        recorder (SessionRecorder): The session recorder, None when not recording.
+        problems (list): Why each board is paused ('reconnecting', 'no data for 1.2 s', ...), None if it is healthy.
+    """
+
+    def __init__(self, players, epoch_duration, hop_duration, normalize='betaalpha', notch_frequency=None,
+                 bandpass=None, record_path=None, registry=None, threaded=True, reconnect_boards=True,
+                 reconnect_interval=5.0, align_boards=True, clock=time.perf_counter):
+        """
+        Initializes the pipeline. Nothing is connected until start().
+
+        Args:
+            players (list): player_config() of every board.
+            epoch_duration (float): Seconds of data in each score.
+            hop_duration (float): Seconds between two scores.
+            normalize (str, optional): Alpha power normalization. Defaults to 'betaalpha'.
+            notch_frequency (float, optional): Notch filter frequency in Hz, None for no notch. Defaults to None.
+            bandpass (tuple, optional): (low, high) bandpass edges in Hz, None for no bandpass. Defaults to None.
+            record_path (str, optional): Session folder to record the boards to, None to not record. Defaults to None.
+            registry (DeviceRegistry, optional): Registry of known dongles. Defaults to None.
+            threaded (bool, optional): Drain the boards in background threads. Otherwise every read() drains them
+                                       first (for a process that does nothing else). Defaults to True.
+            reconnect_boards (bool, optional): Reconnect boards whose connection is lost. Defaults to True.
+            reconnect_interval (float, optional): Seconds between two reconnect attempts of a board. Defaults to 5.0.
+            align_boards (bool, optional): Score every board over the same interval, from their timestamps. Defaults to True.
+            clock (callable, optional): Seconds now, for the health checks (e.g. the clock of a replayed session).
+                                        Defaults to time.perf_counter.
+        """
+        self.players = players
+        self.names = [player['name'] for player in players]
+        self.epoch_duration = epoch_duration
+        self.hop_duration = hop_duration
+        self.normalize = normalize
+        self.notch_frequency = notch_frequency
+        self.bandpass = bandpass
+        self.record_path = record_path
+        self.registry = registry
+        self.threaded = threaded
+        self.reconnect_boards = reconnect_boards
+        self.reconnect_interval = reconnect_interval
+        self.align_boards = align_boards
+        self.clock = clock
+        self.boards = []
+        self.acquisitions = []
+        self.recorder = None
+
+    def start(self, stats=None, boards=None):
+        """
+        Connects every board (in parallel) and starts acquiring.
+
+        Args:
+            stats (PerfStats, optional): Receives the board setup time as 'board_setup'. Defaults to None.
+            boards (list, optional): Streaming boards to score instead of connecting the players' boards (e.g. the
+                                     ReplayBoard of every player in replay.py). Defaults to None.
+
+        Raises:
+            Exception: If a board couldn't be connected (the boards that were connected are released).
+        """
+        if boards is not None:
+            self.boards = list(boards)
+        else:
+            self.boards = [BrainFlowBoardSetup(board_id=player['board_id'], name=player['name'], serial_port=player['serial_port'],
+                                               registry=self.registry) for player in self.players]
+
+            # Connect every board at the same time, each returns as soon as its data starts flowing
+            setup_start = time.perf_counter()
+            setup_boards(self.boards)
+            if stats is not None:
+                stats.add('board_setup', time.perf_counter() - setup_start)
+            if not all(board.is_streaming() for board in self.boards):
+                for board in self.boards:
+                    board.stop()
+                raise Exception(f"Error connecting {'both' if len(self.boards) == 2 else 'all'} players")
+
+        self.channels = [player['channels'] or board.eeg_channels for player, board in zip(self.players, self.boards)]
+        self.timestamp_channels = [BoardShim.get_timestamp_channel(board.board_id) for board in self.boards]
+        rates = [board.get_sampling_rate() for board in self.boards]
+        self.samples_per_epoch = [int(self.epoch_duration * rate) for rate in rates]
+        samples_per_hop = [max(1, int(self.hop_duration * rate)) for rate in rates]
+
+        # Drain every board from one background thread so the game loop never waits on them. The ring buffers only
+        # keep the rows that are read: the EEG channels, then the timestamp
+        self.acquisitions = [BoardAcquisition(board, samples, rows=list(channels) + [timestamp_channel])
+                             for board, samples, channels, timestamp_channel
+                             in zip(self.boards, self.samples_per_epoch, self.channels, self.timestamp_channels)]
+        self.scheduler = AcquisitionScheduler(self.acquisitions)
+        if self.record_path is not None:
+            self.recorder = SessionRecorder(self.record_path)
+            for acquisition in self.acquisitions:
+                self.recorder.attach(acquisition)
+        if self.threaded:
+            self.scheduler.start()
+
+        # Sliding-window band power, scoring the last epoch of every board of a group every hop
+        groups = {}
+        for i, key in enumerate(zip(rates, self.samples_per_epoch, samples_per_hop, map(len, self.channels))):
+            groups.setdefault(key, []).append(i)
+        self.groups = list(groups.values())
+        self.group_rates = [rate for rate, _, _, _ in groups]
+        self.engines = [BatchSlidingBandPower(len(members), n_channels, rate, samples, hop, normalize=self.normalize)
+                        for (rate, samples, hop, n_channels), members in groups.items()]
+        self.samples_per_hop = samples_per_hop
+        self.rates = rates
+
+        # Buffers every read reuses, so scoring allocates nothing per read for the boards' samples: the rows read from
+        # each ring buffer (a read takes at most an epoch and a hop), the board on the time grid and the group chunks
+        read_samples = [epoch + hop + 2 for epoch, hop in zip(self.samples_per_epoch, samples_per_hop)]
+        self._reads = [np.empty((len(channels) + 1, samples)) for channels, samples in zip(self.channels, read_samples)]
+        self._aligned = [np.empty((len(channels) + 1, samples)) for channels, samples in zip(self.channels, read_samples)]
+        self._work = [np.empty_like(aligned) for aligned in self._aligned]
+        self._windows = [np.empty((len(channels), samples)) for channels, samples in zip(self.channels, self.samples_per_epoch)]
+        self._chunks = [np.zeros((engine.n_channels, read_samples[members[0]])) for engine, members in zip(self.engines, self.groups)]
+
+        # Causal filters keeping their state between reads, so every sample is filtered once
+        self.filters = FilterBank([StreamingFilter(len(channels), rate, self.notch_frequency, self.bandpass)
+                                   for channels, rate in zip(self.channels, rates)])
+        self.positions = [0] * len(self.boards)
+        self.fed = [0] * len(self.boards)
+        self.active = [False] * len(self.boards)
+
+        # Clock of each board and the newest time of each group's grid, for the time alignment
+        self.clocks = [BoardClock(rate) for rate in rates]
+        self.grid_times = [None] * len(self.groups)
+        self.alignment_errors = [deque(maxlen=1000) for _ in self.boards]
+
+        # Health of each board: why it is paused and its reconnect thread
+        self.problems = [None] * len(self.boards)
+        self._reconnects = [None] * len(self.boards)
+        self._next_reconnect = [0.0] * len(self.boards)
+        self._healthy_from = [0] * len(self.boards)
+
+    def _has_valid_window(self, board):
+        """
+        Returns:
+            bool: True if the board has a full epoch of EEG that is finite and not flat on every channel (a board
+                  that just started streaming can send NaNs or a constant until its electrodes settle).
+        """
+        window = self.latest_window(board, self._windows[board])
+        return window is not None and bool(np.isfinite(window).all()) and bool(np.ptp(window, axis=1).max() > 0)
+
+    def warm_boards(self):
+        """
+        Returns:
+            list: For every board, True once it holds a full, valid epoch of data.
+        """
+        if not self.threaded:
+            self._poll()
+        self._check_health()
+        return [self._has_valid_window(i) for i in range(len(self.boards))]
+
+    def is_warm(self):
+        """
+        Returns:
+            bool: True once every board holds a full, valid epoch of data.
+        """
+        return all(self.warm_boards())
+
+    def restart(self):
+        """
+        Starts scoring again from the latest full epoch of each board (e.g. at the start of a game).
+        """
+        for engine in self.engines:
+            engine.reset()
+        self.filters.reset()
+        self.positions = [max(0, acquisition.total_samples - samples)
+                          for acquisition, samples in zip(self.acquisitions, self.samples_per_epoch)]
+        self.fed = [0] * len(self.boards)
+        self.grid_times = [None] * len(self.groups)
+
+    def _poll(self):
+        self.scheduler.poll()
+
+    def _check_health(self):
+        """
+        Pauses the boards that are unhealthy and starts reconnecting the ones whose connection is lost.
+        """
+        now = self.clock()
+        for i, board in enumerate(self.boards):
+            reconnect = self._reconnects[i]
+            if reconnect is not None and not reconnect.is_alive():
+                self._reconnects[i] = reconnect = None
+                if board.is_streaming():
+                    self.mark(f"{self.names[i]} reconnected")
+                else:
+                    print(f"[{self.names[i]}] Reconnect failed, trying again in {self.reconnect_interval} s")
+                    self._next_reconnect[i] = now + self.reconnect_interval
+
+            if reconnect is not None:
+                problem = 'reconnecting'
+            elif self.reconnect_boards and not board.is_streaming() and now < self._next_reconnect[i]:
+                problem = 'reconnect failed, trying again'  # Fixed, so the pause is printed once per attempt
+            else:
+                problem = board.health.connection_problem(now)
+                if problem is not None and self.reconnect_boards and now >= self._next_reconnect[i]:
+                    print(f"[{self.names[i]}] Connection lost ({problem})")
+                    self.mark(f"{self.names[i]} reconnect")
+                    self._reconnects[i] = threading.Thread(target=board.reconnect, name=f"{self.names[i]} reconnect", daemon=True)
+                    self._reconnects[i].start()
+                    problem = 'reconnecting'
+                elif problem is None:
+                    problem = board.health.signal_problem()
+
+            if problem != self.problems[i]:
+                print(f"[{self.names[i]}] " + (f"Paused: {problem}" if problem is not None else "Healthy again, rejoining after an epoch"))
+                self.problems[i] = problem
+                if problem is None:
+                    self._healthy_from[i] = self.acquisitions[i].total_samples
+            if problem is not None:
+                self.active[i] = False
+
+    def paused_boards(self):
+        """
+        Returns:
+            list: For every board, why it isn't scored (e.g. 'reconnecting' or 'waiting for a full epoch'), None
+                  if it is.
+        """
+        paused = []
+        for i, problem in enumerate(self.problems):
+            # A board that (re)joins scores once it has been fed an epoch received after it joined
+            if problem is None and (not self.active[i] or self.fed[i] < self.samples_per_epoch[i]):
+                problem = 'waiting for a full epoch'
+            paused.append(problem)
+        return paused
+
+    def health(self):
+        """
+        Returns:
+            list: The health counters of every board (see BoardHealth.counters()), for logging.
+        """
+        now = self.clock()
+        return [board.health.counters(now) for board in self.boards]
+
+    def _activate_boards(self):
+        """
+        (Re)joins the boards that are healthy and have a full epoch: from their latest epoch, with fresh filter state
+        and their clock fitted to the samples received since they are healthy.
+        """
+        for i, acquisition in enumerate(self.acquisitions):
+            if self.active[i] or self.problems[i] is not None or not acquisition.has_full_window():
+                continue
+            if acquisition.total_samples - self._healthy_from[i] < self.samples_per_hop[i]:
+                continue
+            self.fed[i] = 0
+            self.filters.filters[i].reset()
+            if not self.align_boards:
+                self.positions[i] = acquisition.total_samples - self.samples_per_epoch[i]
+                self.active[i] = True
+                continue
+            start = max(self._healthy_from[i], acquisition.total_samples - self.samples_per_epoch[i])
+            data, self.positions[i] = acquisition.read_since(start, out=self._reads[i])
+            self.clocks[i].reset()
+            self.clocks[i].update(self.positions[i] - data.shape[1], data[-1])
+            self.active[i] = self.clocks[i].offset is not None
+
+    def _end_time(self):
+        """
+        Returns:
+            float: The newest time every active board has a sample for, None if no board is active.
+        """
+        ends = [self.clocks[i].time(self.acquisitions[i].total_samples - 1) for i in range(len(self.boards)) if self.active[i]]
+        return min(ends) if ends else None
+
+    def _read_group(self, members):
+        """
+        Reads the same number of new samples from every active board of a group.
+
+        Returns:
+            list: For each board of the group, None if it is skipped, else a tuple (see _read_aligned()) whose
+                  window times are the board's own timestamps.
+        """
+        active = [i for i in members if self.active[i]]
+        if not active:
+            return [None] * len(members)
+
+        available = {i: self.acquisitions[i].total_samples - self.positions[i] for i in active}
+        n = min(min(available.values()), self._reads[active[0]].shape[1])
+        reads = []
+        for i in members:
+            if not self.active[i]:
+                reads.append(None)
+                continue
+            behind = available[i] - n - self.samples_per_hop[i]
+            if behind > 0:
+                self.positions[i] += behind
+            data, self.positions[i] = self.acquisitions[i].read_since(self.positions[i], n, out=self._reads[i])
+            reads.append((data[:-1], data, self.positions[i] - data.shape[1], 0, None, None))
+        return reads
+
+    def _read_aligned(self, group, end_time):
+        """
+        Interpolates every active board of a group onto the group's time grid, up to end_time.
+
+        Returns:
+            list: For each board of the group, None if it is skipped, else a tuple of the EEG on the grid (shape
+                  (n_channels, n)), the samples read from the ring buffer (EEG rows then the timestamp), the position
+                  of the first of them, the column (0 or 1) of the newest sample the first grid sample depends on,
+                  the time of the first grid sample and the board's own timestamps on the grid. The arrays are views
+                  of buffers reused by the next read.
+        """
+        members = self.groups[group]
+        if not any(self.active[i] for i in members):
+            # The group starts from the latest epoch again once a board joins
+            self.grid_times[group] = None
+            return [None] * len(members)
+
+        rate = self.group_rates[group]
+        epoch = self.samples_per_epoch[members[0]]
+        last = self.grid_times[group]
+        if last is None or (end_time - last) * rate > epoch:
+            # Starting, or behind by more than an epoch (which replaces the whole window anyway), from the latest
+            # epoch but not before a board became healthy (e.g. samples from before a reconnect)
+            healthy = max(self.clocks[i].time(self._healthy_from[i]) for i in members if self.active[i])
+            n = min(epoch, int(np.floor((end_time - healthy) * rate + 1e-6)) + 1)
+            first_time = end_time - (n - 1) / rate
+        else:
+            n = int(np.floor((end_time - last) * rate + 1e-6))
+            first_time = last + 1 / rate
+        n = max(n, 0)
+        if n:
+            self.grid_times[group] = first_time + (n - 1) / rate
+
+        reads = []
+        for i in members:
+            if not self.active[i]:
+                reads.append(None)
+                continue
+            # The grid is at the board's own rate: every grid sample lies the same fraction of a sample after a
+            # board sample, from the position of the first one
+            position = float(self.clocks[i].position(first_time))
+            first = max(0, int(np.floor(position)))
+            offset = min(max(position - first, 0.0), 1.0)
+            data, end = self.acquisitions[i].read_since(first, n + 1, out=self._reads[i])
+            if data.shape[1] and data.shape[1] < n + 1:
+                # Rounding put the last grid sample past the newest board sample
+                data = self._reads[i][:, :n + 1]
+                data[:, end - first:] = data[:, end - first - 1:end - first]
+
+            clock = self.clocks[i]
+            if end > clock.seen:
+                new = max(first, clock.seen)
+                clock.update(new, data[-1, new - first:end - first])
+            aligned = resample(data, offset, n, out=self._aligned[i][:, :n], work=self._work[i][:, :n])
+            reads.append((aligned[:-1], data, first, 1 if offset > 0 else 0, first_time, aligned[-1]))
+        return reads
+
+    def read(self, stats=None):
+        """
+        Scores the samples received since the last read, each board produces a score every hop.
+
+        Args:
+            stats (PerfStats, optional): Receives the read and DSP times as 'acquisition_read' and 'dsp'. Defaults to None.
+
+        Returns:
+            list: One array of shape (n_scores, len(SCORE_FIELDS)) per board, oldest score first.
+        """
+        if not self.threaded:
+            self._poll()
+        self._check_health()
+        read_start = time.perf_counter()
+        read_time = time.time()
+        self._activate_boards()
+        end_time = self._end_time() if self.align_boards else None
+        reads = [None] * len(self.boards)
+        for group, members in enumerate(self.groups):
+            group_reads = self._read_aligned(group, end_time) if self.align_boards else self._read_group(members)
+            for i, board_read in zip(members, group_reads):
+                reads[i] = board_read
+
+        dsp_start = time.perf_counter()
+        n_samples = [0 if board_read is None else board_read[0].shape[1] for board_read in reads]
+        filtered = self.filters.process([board_read[0] if board_read is not None else np.empty((len(channels), 0))
+                                         for board_read, channels in zip(reads, self.channels)])
+        group_scores = []
+        for group, (members, engine) in enumerate(zip(self.groups, self.engines)):
+            # Skipped boards are fed zeros, their scores are dropped until they have filled a whole epoch
+            n = max(n_samples[i] for i in members)
+            chunk = self._chunks[group][:, :n]
+            for slot, i in enumerate(members):
+                rows = chunk[slot * engine.board_channels:(slot + 1) * engine.board_channels]
+                if n_samples[i]:
+                    rows[:] = filtered[i]
+                else:
+                    rows[:] = 0
+            positions = []
+            group_scores.append((engine.update(chunk, positions), positions))
+        dsp_end = time.perf_counter()
+        dsp_time = time.time()
+
+        # Timestamps of the newest sample of each scored window
+        records = [np.empty((0, len(SCORE_FIELDS))) for _ in self.boards]
+        for members, (scores, positions) in zip(self.groups, group_scores):
+            for slot, i in enumerate(members):
+                if not self.active[i]:
+                    continue
+                _, data, first, lead, first_time, aligned_times = reads[i]
+                board_records = []
+                for score, p in zip(scores, positions):
+                    if self.fed[i] + p + 1 < self.samples_per_epoch[i]:
+                        continue
+                    # The newest board sample the window depends on, and where the window ends on the grid
+                    acquired = self.acquisitions[i].drain_time(first + p + lead)
+                    sample_time = data[-1, p + lead]
+                    if first_time is None:
+                        window_time, error = sample_time, np.nan
+                    else:
+                        window_time = first_time + p / self.rates[i]
+                        error = aligned_times[p] - window_time
+                        self.alignment_errors[i].append(error)
+                    board_records.append((score[slot], sample_time, np.nan if acquired is None else acquired,
+                                          read_time, dsp_time, window_time, error))
+                if board_records:
+                    records[i] = np.array(board_records)
+                self.fed[i] += n_samples[i]
+
+        if stats is not None:
+            stats.add('acquisition_read', dsp_start - read_start)
+            stats.add('dsp', dsp_end - dsp_start)
+        return records
+
+    def latest_window(self, board, out=None):
+        """
+        Returns the latest epoch of a board's EEG channels (as acquired, before filtering).
+
+        Args:
+            board (int): Index of the board.
+            out (numpy.ndarray, optional): Preallocated array of shape (n_channels, samples_per_epoch) to copy into.
+
+        Returns:
+            numpy.ndarray: The window, or None until a full epoch has been received.
+        """
+        return self.acquisitions[board].latest_window(out=out, rows=slice(0, len(self.channels[board])))
+
+    def mark(self, label, value=None, details=None):
+        """
+        Records a session event (and inserts value as a marker into every board) when recording, see SessionRecorder.mark.
+        """
+        if self.recorder is not None:
+            self.recorder.mark(label, value=value, boards=self.boards, details=details)
+
+    def insert_marker(self, value):
+        """
+        Inserts a marker into the stream of every board.
+        """
+        for board in self.boards:
+            board.insert_marker(value, verbose=False)
+
+    def stop(self):
+        """
+        Stops acquiring, closes the recording and releases every board.
+        """
+        if self.acquisitions:
+            # A reconnect in progress must finish before its board is released
+            for reconnect in self._reconnects:
+                if reconnect is not None:
+                    reconnect.join()
+            self.scheduler.stop()
+            now = self.clock()
+            for name, board, errors in zip(self.names, self.boards, self.alignment_errors):
+                print(f"[{name}] Health: {board.health.summary(now)}")
+                if errors:
+                    p50, p99 = np.percentile(np.abs(errors), (50, 99)) * 1000
+                    print(f"[{name}] Window alignment error p50/p99: {p50:.1f}/{p99:.1f} ms")
+        if self.recorder is not None:
+            # Drain what arrived since the last poll, so the end of the session is recorded too
+            self._poll()
+            self.recorder.close()
+        for board in self.boards:
+            board.stop()
@@ -0,0 +1,432 @@
+import json
+import os
+import queue
+import re
+import threading
+import time
+import numpy as np
+from brainflow.board_shim import BoardShim, BrainFlowError
+
+###################
+# This file holds the session recorder of Alpha-war and its reader. SessionRecorder receives every chunk drained by a
+# BoardAcquisition and appends it, on a background thread, to fixed-size preallocated .npy chunk files (one folder per
+# board) described by a JSON index with the board metadata and markers. RecordedSession opens a recording through
+# memory maps, so multi-hour sessions can be analysed without loading them into RAM.
+#
+# Layout of a session folder:
+#   index.json                  Boards (metadata, chunk files, sample counts, markers) and session events
+#   <board>/chunk_00000.npy     float64 array of shape (num_rows, chunk_samples), same rows as get_board_data()
+###################
+INDEX_FILE = 'index.json'
+INDEX_VERSION = 1
+
+
+def _board_info(board_id, getter):
+    """
+    Returns a BoardShim channel description for a board ID, or None if the board doesn't have it.
+    """
+    try:
+        return getter(board_id)
+    except BrainFlowError:
+        return None
+
+
+class _BoardWriter:
+    """
+    Appends the data of one board to its chunk files. Only used from the recorder's writer thread.
+    """
+
+    def __init__(self, folder, metadata, chunk_samples):
+        self.folder = folder
+        self.metadata = metadata
+        self.num_rows = metadata['num_rows']
+        self.chunk_samples = chunk_samples
+        self.marker_channel = metadata['marker_channel']
+        self.timestamp_channel = metadata['timestamp_channel']
+        self.chunks = []  # {'file', 'samples'} of every chunk, the last one may be partially filled
+        self.markers = []
+        self.total_samples = 0
+        self._chunk = None
+        os.makedirs(folder, exist_ok=True)
+
+    def _open_chunk(self):
+        name = f"chunk_{len(self.chunks):05d}.npy"
+        self._chunk = np.lib.format.open_memmap(os.path.join(self.folder, name), mode='w+', dtype=np.float64,
+                                                shape=(self.num_rows, self.chunk_samples))
+        self.chunks.append({'file': name, 'samples': 0})
+
+    def _close_chunk(self):
+        if self._chunk is not None:
+            self._chunk.flush()
+            self._chunk = None
+
+    def write(self, data):
+        """
+        Appends a (num_rows, n) chunk, starting new chunk files as they fill up.
+
+        Returns:
+            bool: True if a chunk file was completed.
+        """
+        self._scan_markers(data)
+        completed = False
+        written = 0
+        n = data.shape[1]
+        while written < n:
+            if self._chunk is None:
+                self._open_chunk()
+            entry = self.chunks[-1]
+            count = min(n - written, self.chunk_samples - entry['samples'])
+            self._chunk[:, entry['samples']:entry['samples'] + count] = data[:, written:written + count]
+            entry['samples'] += count
+            written += count
+            if entry['samples'] == self.chunk_samples:
+                self._close_chunk()
+                completed = True
+        self.total_samples += n
+        return completed
+
+    def _scan_markers(self, data):
+        """
+        Records the samples where BrainFlow's marker channel is set (e.g. by insert_marker).
+        """
+        if self.marker_channel is None:
+            return
+        for i in np.flatnonzero(data[self.marker_channel]):
+            self.markers.append({
+                'sample': int(self.total_samples + i),
+                'value': float(data[self.marker_channel, i]),
+                'timestamp': float(data[self.timestamp_channel, i]) if self.timestamp_channel is not None else None,
+            })
+
+    def flush(self):
+        if self._chunk is not None:
+            self._chunk.flush()
+
+    def close(self):
+        self._close_chunk()
+
+    def describe(self):
+        return dict(self.metadata, chunk_samples=self.chunk_samples, total_samples=self.total_samples,
+                    chunks=[dict(chunk) for chunk in self.chunks], markers=list(self.markers))
+
+
+class SessionRecorder:
+    """
+    Records the data of one or more boards to a session folder while the game runs.
+
+    Chunks reach the recorder through BoardAcquisition.add_sink (see attach) and are written by a background thread,
+    so neither the drain thread nor the game loop waits on the disk. Memory use is bounded by the chunks waiting in
+    the queue, independent of the length of the session.
+
+    Attributes:
+        path (str): The session folder.
+        chunk_seconds (float): Length of each chunk file in seconds of data.
+        index_interval (float): Seconds between two rewrites of the index while recording.
+        events (list): Session-level events added with mark().
+        dropped_chunks (int): Chunks that couldn't be written.
+    """
+
+    def __init__(self, path, chunk_seconds=60, index_interval=5.0):
+        """
+        Initializes the recorder and starts its writer thread.
+
+        Args:
+            path (str): The session folder. It is created if needed and must not already hold a recording.
+            chunk_seconds (float, optional): Seconds of data per chunk file. Defaults to 60.
+            index_interval (float, optional): Seconds between two rewrites of the index. Defaults to 5.0.
+
+        Raises:
+            FileExistsError: If path already holds a recording.
+        """
+        if os.path.exists(os.path.join(path, INDEX_FILE)):
+            raise FileExistsError(f"{path} already holds a recording.")
+        os.makedirs(path, exist_ok=True)
+
+        self.path = path
+        self.chunk_seconds = chunk_seconds
+        self.index_interval = index_interval
+        self.created = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.events = []
+        self.dropped_chunks = 0
+        self._writers = {}
+        self._queued_samples = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='Session recorder', daemon=True)
+        self._thread.start()
+
+    def attach(self, acquisition):
+        """
+        Starts recording every chunk drained by a BoardAcquisition. Attach before starting the acquisition to
+        record the session from its first sample.
+
+        Args:
+            acquisition (BoardAcquisition): The acquisition worker of the board.
+
+        Returns:
+            str: The key (folder name) of the board in the recording.
+        """
+        board = acquisition.board
+        board_id = board.master_board if board.master_board is not None else board.board_id
+        key = re.sub(r'[^\w\-]+', '_', board.get_board_name()).strip('_') or f"board_{len(self._writers)}"
+        while key in self._writers:
+            key += '_'
+
+        metadata = {
+            'name': board.get_board_name(),
+            'board_id': board.board_id,
+            'master_board': board.master_board,
+            'serial_port': board.serial_port,
+            'sampling_rate': board.get_sampling_rate(),
+            'num_rows': board.get_num_rows(),
+            'eeg_channels': list(board.eeg_channels),
+            'timestamp_channel': _board_info(board_id, BoardShim.get_timestamp_channel),
+            'marker_channel': _board_info(board_id, BoardShim.get_marker_channel),
+        }
+        chunk_samples = max(1, int(self.chunk_seconds * metadata['sampling_rate']))
+        with self._lock:
+            self._writers[key] = _BoardWriter(os.path.join(self.path, key), metadata, chunk_samples)
+            self._queued_samples[key] = 0
+        acquisition.add_sink(_RecorderSink(self, key))
+        self._save_index()
+        return key
+
+    def _enqueue(self, key, chunk):
+        """
+        Queues a chunk for the writer thread (called from the drain thread of the board).
+        """
+        if self._closed:
+            return
+        with self._lock:
+            self._queued_samples[key] += chunk.shape[1]
+        self._queue.put((key, chunk))
+
+    def mark(self, label, value=None, boards=None, details=None):
+        """
+        Records a session event (e.g. 'game start') with the current sample position of every board.
+
+        Args:
+            label (str): Description of the event.
+            value (float, optional): If given, also inserted as a BrainFlow marker into the stream of each board in
+                                     boards, so it is found at the exact sample in the marker channel. Defaults to None.
+            boards (list, optional): BrainFlowBoardSetup instances to insert the marker into. Defaults to None.
+            details (dict, optional): JSON-serializable information saved with the event (e.g. the baselines a game
+                                      starts from, for replay.py). Defaults to None.
+        """
+        with self._lock:
+            event = {'label': label, 'value': value, 'time': time.time(), 'samples': dict(self._queued_samples)}
+            if details is not None:
+                event['details'] = details
+            self.events.append(event)
+        if value is not None:
+            for board in boards or []:
+                board.insert_marker(value, verbose=False)
+
+    def _run(self):
+        """
+        Writer loop executed by the recorder thread.
+        """
+        last_index = time.perf_counter()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.index_interval)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+
+            index_due = time.perf_counter() - last_index >= self.index_interval
+            if item:
+                key, chunk = item
+                try:
+                    index_due |= self._writers[key].write(chunk)
+                except OSError as e:
+                    self.dropped_chunks += 1
+                    print(f"[Recorder, {key}] Couldn't write data: {e}")
+            if index_due:
+                for writer in list(self._writers.values()):
+                    writer.flush()
+                self._save_index()
+                last_index = time.perf_counter()
+
+    def _save_index(self):
+        """
+        Writes the index (through a temporary file, so an interrupted write can't corrupt it).
+        """
+        with self._lock:
+            index = {
+                'version': INDEX_VERSION,
+                'created': self.created,
+                'chunk_seconds': self.chunk_seconds,
+                'boards': {key: writer.describe() for key, writer in self._writers.items()},
+                'events': list(self.events),
+            }
+        tmp_path = os.path.join(self.path, INDEX_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.path, INDEX_FILE))
+
+    def close(self, timeout=10.0):
+        """
+        Writes everything still queued, closes the chunk files and writes the final index.
+        Stop the acquisition workers first, chunks drained after close() are not recorded.
+
+        Args:
+            timeout (float, optional): Seconds to wait for the queued chunks to be written. Defaults to 10.0.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+        for writer in self._writers.values():
+            writer.close()
+        self._save_index()
+        total = {key: writer.total_samples for key, writer in self._writers.items()}
+        print(f"[Recorder] Session saved to {self.path} ({', '.join(f'{key}: {n} samples' for key, n in total.items())}).")
+
+
+class _RecorderSink:
+    """
+    Adapter passed to BoardAcquisition.add_sink, forwarding the chunks of one board to the recorder.
+    """
+
+    def __init__(self, recorder, key):
+        self.recorder = recorder
+        self.key = key
+
+    def write(self, chunk):
+        self.recorder._enqueue(self.key, chunk)
+
+
+class RecordedBoard:
+    """
+    Read-only, memory-mapped view of the data of one board in a recording.
+
+    Attributes:
+        key (str): Folder name of the board in the session.
+        metadata (dict): The board's entry in the index (name, board_id, sampling_rate, eeg_channels, ...).
+        markers (list): Samples where BrainFlow's marker channel was set, as {'sample', 'value', 'timestamp'}.
+    """
+
+    def __init__(self, folder, key, metadata):
+        """
+        Initializes the view. Chunk files are only mapped when they are read.
+        """
+        self.folder = folder
+        self.key = key
+        self.metadata = metadata
+        self.markers = metadata.get('markers', [])
+        self._chunks = [chunk for chunk in metadata['chunks'] if chunk['samples'] > 0]
+        self._starts = np.cumsum([0] + [chunk['samples'] for chunk in self._chunks])
+
+    def __len__(self):
+        """
+        Returns:
+            int: Number of samples recorded.
+        """
+        return int(self._starts[-1])
+
+    @property
+    def sampling_rate(self):
+        return self.metadata['sampling_rate']
+
+    @property
+    def eeg_channels(self):
+        return self.metadata['eeg_channels']
+
+    def chunk(self, i):
+        """
+        Returns a chunk file as a read-only memory map.
+
+        Args:
+            i (int): Index of the chunk.
+
+        Returns:
+            numpy.memmap: Array of shape (num_rows, samples in the chunk).
+        """
+        chunk = self._chunks[i]
+        data = np.load(os.path.join(self.folder, chunk['file']), mmap_mode='r')
+        return data[:, :chunk['samples']]
+
+    def iter_chunks(self):
+        """
+        Yields every chunk in order as a read-only memory map, e.g. to process a session chunk by chunk.
+        """
+        for i in range(len(self._chunks)):
+            yield self.chunk(i)
+
+    def read(self, start=0, stop=None, rows=None):
+        """
+        Copies a range of samples into memory.
+
+        Args:
+            start (int, optional): First sample. Defaults to 0.
+            stop (int, optional): Sample after the last one. Defaults to the end of the recording.
+            rows (list, optional): Rows to read (e.g. eeg_channels). Defaults to every row.
+
+        Returns:
+            numpy.ndarray: Array of shape (len(rows), stop - start), laid out like get_board_data().
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        start = max(0, min(start, stop))
+        n_rows = self.metadata['num_rows'] if rows is None else len(rows)
+        out = np.empty((n_rows, stop - start))
+        first = int(np.searchsorted(self._starts, start, side='right')) - 1
+        position = start
+        for i in range(max(first, 0), len(self._chunks)):
+            if position >= stop:
+                break
+            chunk = self.chunk(i)
+            offset = position - self._starts[i]
+            count = min(stop - position, chunk.shape[1] - offset)
+            piece = chunk[:, offset:offset + count]
+            out[:, position - start:position - start + count] = piece if rows is None else piece[rows]
+            position += count
+        return out
+
+    def read_seconds(self, start_s, stop_s=None, rows=None):
+        """
+        Same as read(), with the range given in seconds from the start of the recording.
+        """
+        stop = None if stop_s is None else int(stop_s * self.sampling_rate)
+        return self.read(int(start_s * self.sampling_rate), stop, rows)
+
+
+class RecordedSession:
+    """
+    A recording opened for offline analysis. Nothing is loaded until it is read.
+
+    Attributes:
+        path (str): The session folder.
+        index (dict): The parsed index.
+        boards (dict): RecordedBoard of every board, by key.
+        events (list): Session events added with SessionRecorder.mark().
+    """
+
+    def __init__(self, path):
+        """
+        Opens a session folder.
+
+        Args:
+            path (str): The session folder (holding index.json).
+
+        Raises:
+            FileNotFoundError: If path holds no recording.
+            ValueError: If the index was written by an unknown version.
+        """
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        if self.index.get('version') != INDEX_VERSION:
+            raise ValueError(f"Unsupported recording version {self.index.get('version')} in {path}.")
+        self.path = path
+        self.events = self.index.get('events', [])
+        self.boards = {key: RecordedBoard(os.path.join(path, key), key, metadata)
+                       for key, metadata in self.index['boards'].items()}
+
+    def __getitem__(self, key):
+        return self.boards[key]
+
+    def __iter__(self):
+        return iter(self.boards.values())
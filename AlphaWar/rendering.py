@@ -0,0 +1,292 @@
+from collections import OrderedDict
+import numpy as np
+import pygame
+
+###################
+# This file holds the rendering layer of Alpha-war. Everything that never changes during a game (background, player
+# markers, graph background, axes, x-tick labels and axis titles) is drawn once onto a cached background surface.
+# Each frame only the regions that changed are restored from that background, redrawn and sent to the display.
+###################
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+GRAPH_BACKGROUND = (230, 230, 230)
+PLAYER_1_COLOR = (255, 0, 0)
+PLAYER_2_COLOR = (0, 0, 255)
+# Colors of the players in arena mode: players on the left side (1, 3, ...) get warm colors, on the right side cold ones
+PLAYER_COLORS = (PLAYER_1_COLOR, PLAYER_2_COLOR, (255, 140, 0), (0, 150, 0), (160, 0, 200), (0, 170, 200),
+                 (200, 0, 120), (110, 80, 40))
+
+
+class TextCache:
+    """
+    Cache of rendered text, so labels are rendered with font.render only the first time they are seen.
+
+    Whole strings that repeat (tick labels, titles) are cached in an LRU of surfaces. Strings that change every
+    update (scores) are drawn glyph by glyph from a cache of single characters, so they don't render anything new.
+
+    Attributes:
+        max_size (int): Maximum number of whole strings kept.
+    """
+
+    def __init__(self, max_size=256):
+        """
+        Initializes the cache.
+
+        Args:
+            max_size (int, optional): Maximum number of whole strings kept. Defaults to 256.
+        """
+        self.max_size = max_size
+        self._surfaces = OrderedDict()
+        self._glyphs = {}
+
+    def render(self, font, text, color):
+        """
+        Returns the rendered surface of a string, rendering it only on a cache miss.
+
+        Args:
+            font (pygame.font.Font): The font to render with.
+            text (str): The text to render.
+            color (tuple): RGB color of the text.
+
+        Returns:
+            pygame.Surface: The (shared) surface of the text. Don't draw onto it.
+        """
+        key = (id(font), text, color)
+        surface = self._surfaces.get(key)
+        if surface is None:
+            surface = font.render(text, True, color)
+            self._surfaces[key] = surface
+            if len(self._surfaces) > self.max_size:
+                self._surfaces.popitem(last=False)
+        else:
+            self._surfaces.move_to_end(key)
+        return surface
+
+    def blit_glyphs(self, target, font, text, color, position):
+        """
+        Draws a string character by character from cached glyphs.
+
+        Args:
+            target (pygame.Surface): The surface to draw on.
+            font (pygame.font.Font): The font to render with.
+            text (str): The text to draw.
+            color (tuple): RGB color of the text.
+            position (tuple): Top-left (x, y) position of the text.
+
+        Returns:
+            pygame.Rect: The area covered by the text.
+        """
+        x, y = position
+        height = font.get_height()
+        for char in text:
+            key = (id(font), char, color)
+            glyph = self._glyphs.get(key)
+            if glyph is None:
+                glyph = font.render(char, True, color)
+                self._glyphs[key] = glyph
+            target.blit(glyph, (x, y))
+            x += glyph.get_width()
+        return pygame.Rect(position[0], y, x - position[0], height)
+
+
+class AlphaWarRenderer:
+    """
+    Draws the Alpha-war scene with a cached static background and dirty-rectangle display updates.
+
+    The draw_* methods restore their region from the background, draw the new content and mark the region dirty.
+    present() sends all dirty regions to the display in a single pygame.display.update call.
+
+    Attributes:
+        screen (pygame.Surface): The display surface.
+        background (pygame.Surface): Cached static part of the scene.
+        text_cache (TextCache): Cache of rendered labels.
+        graph_rect (pygame.Rect): Plot area of the alpha power graph.
+        history_length (int): Number of points shown on the graph.
+    """
+
+    def __init__(self, screen, player_rects, history_length, x_label, y_label='Alpha Power', rope_y=400, rope_height=10,
+                 player_colors=(PLAYER_1_COLOR, PLAYER_2_COLOR), marker_colors=None):
+        """
+        Initializes the renderer and draws the static background.
+
+        Args:
+            screen (pygame.Surface): The display surface.
+            player_rects (list): pygame.Rect of the marker of each side.
+            history_length (int): Number of points shown on the graph.
+            x_label (str): Title of the graph's x-axis.
+            y_label (str, optional): Title of the graph's y-axis. Defaults to 'Alpha Power'.
+            rope_y (int, optional): Vertical position of the rope. Defaults to 400.
+            rope_height (int, optional): Height of the rope. Defaults to 10.
+            player_colors (tuple, optional): Color of each player (graph lines and scores). Defaults to red and blue.
+            marker_colors (tuple, optional): Color of each side's marker. Defaults to the first player colors.
+        """
+        self.screen = screen
+        self.width, self.height = screen.get_size()
+        self.player_rects = player_rects
+        self.player_colors = player_colors
+        self.marker_colors = marker_colors or player_colors[:len(player_rects)]
+        self.history_length = history_length
+        self.text_cache = TextCache()
+
+        self.font = pygame.font.Font(None, 36)
+        self.alpha_font = pygame.font.Font(None, 28)
+        self.label_font = pygame.font.Font(None, 24)
+
+        # Layout
+        self.graph_rect = pygame.Rect(200, 650, 1000, 100)
+        self.rope_region = pygame.Rect(0, rope_y, self.width, rope_height)
+        self.y_tick_region = pygame.Rect(self.graph_rect.left - 45, self.graph_rect.top - 12, 45, self.graph_rect.height + 24)
+        self.plot_region = self.graph_rect.inflate(4, 4)  # Lines are 2 px wide and can overhang the plot area
+        self.score_rows = -(-len(player_colors) // 2)  # Scores of each side are listed under each other
+        self.score_region = pygame.Rect(0, 60, self.width, 40 + 25 * (self.score_rows - 1))
+        self.message_region = pygame.Rect(0, 190, self.width, 100)
+
+        self._dirty = []
+        self.background = pygame.Surface((self.width, self.height))
+        self._draw_background(x_label, y_label)
+
+    def _draw_background(self, x_label, y_label):
+        """
+        Draws everything that stays the same for the whole game onto the background surface.
+        """
+        background = self.background
+        graph = self.graph_rect
+        background.fill(WHITE)
+        for rect, color in zip(self.player_rects, self.marker_colors):
+            pygame.draw.rect(background, color, rect)
+
+        # Graph background and axes
+        pygame.draw.rect(background, GRAPH_BACKGROUND, graph)
+        pygame.draw.line(background, BLACK, graph.bottomleft, (graph.right, graph.bottom), 2)  # x-axis
+        pygame.draw.line(background, BLACK, graph.topleft, graph.bottomleft, 2)  # y-axis
+
+        # x-axis labels and tick marks for epochs (starting from 0 on the left and incrementing by 5, or by a multiple
+        # of 5 that keeps the labels at least 50 px apart for long histories)
+        label_interval = 5 * max(1, -(-10 * self.history_length // graph.width))
+        for i in range(0, self.history_length, label_interval):
+            x_position = graph.left + i * graph.width // self.history_length
+            tick_label = self.text_cache.render(self.label_font, f"{i}", BLACK)
+            background.blit(tick_label, (x_position - tick_label.get_width() // 2, graph.bottom + 5))
+            pygame.draw.line(background, BLACK, (x_position, graph.bottom), (x_position, graph.bottom + 5), 2)
+
+        # Axis titles
+        x_title = self.label_font.render(x_label, True, BLACK)
+        background.blit(x_title, (graph.centerx - x_title.get_width() // 2, graph.bottom + 25))
+        y_title = self.label_font.render(y_label, True, BLACK)
+        background.blit(y_title, (graph.left - 155, graph.centery - y_title.get_height() // 2))
+
+    def _restore(self, region):
+        """
+        Restores a region of the screen from the background and marks it dirty.
+        """
+        self.screen.blit(self.background, region, region)
+        self._dirty.append(region)
+
+    def reset(self):
+        """
+        Draws the whole background, e.g. at the start of a game. The whole screen is updated on the next present().
+        """
+        self.screen.blit(self.background, (0, 0))
+        self._dirty = [self.screen.get_rect()]
+
+    def draw_message(self, text):
+        """
+        Clears the screen and shows a centered message (e.g. while the boards start).
+        """
+        self.screen.fill(WHITE)
+        message = self.label_font.render(text, True, BLACK)
+        self.screen.blit(message, message.get_rect(center=(self.width // 2, self.height // 2)))
+        self._dirty = [self.screen.get_rect()]
+
+    def draw_rope(self, rope):
+        """
+        Draws the rope, with the player markers on top of it.
+
+        Args:
+            rope (pygame.Rect): The rope.
+        """
+        self._restore(self.rope_region)
+        pygame.draw.rect(self.screen, BLACK, rope)
+        for rect, color in zip(self.player_rects, self.marker_colors):
+            if rect.colliderect(self.rope_region):
+                pygame.draw.rect(self.screen, color, rect.clip(self.rope_region))
+
+    def draw_graph(self, history):
+        """
+        Draws the alpha power history of each player and the y-axis scale.
+
+        Args:
+            history (ScoreHistory): The alpha power history of the players.
+        """
+        self._restore(self.plot_region)
+        self._restore(self.y_tick_region)
+        if len(history) < 2:
+            return
+
+        graph = self.graph_rect
+        # Determine dynamic max_alpha and min_alpha based on data, rounded to ensure integer values
+        min_alpha = int(history.min() - 2)
+        raw_max_alpha = history.max() * 1.1  # Add 10% buffer above the maximum data point
+        max_alpha = int(np.ceil(raw_max_alpha))  # Round up to the nearest integer
+
+        # Ensure integer tick interval
+        tick_interval = max(1, (max_alpha - min_alpha) // 4)  # Choose an interval to divide the range into 4 or more ticks
+        max_alpha = min_alpha + (tick_interval * 4)
+
+        # Scale the points for each player's alpha power history and draw the lines
+        # (clipped to the plot region, values rounded off the top of the scale would otherwise leave stale pixels)
+        self.screen.set_clip(self.plot_region)
+        for points, color in zip(history.polylines(graph, min_alpha, max_alpha), self.player_colors):
+            pygame.draw.lines(self.screen, color, False, points, 2)
+        self.screen.set_clip(None)
+
+        # Add y-axis labels and tick marks
+        for i in range(5):
+            y_value = min_alpha + (tick_interval * i)
+            y_position = graph.bottom - int(((y_value - min_alpha) / (max_alpha - min_alpha)) * graph.height)
+            tick_label = self.text_cache.render(self.label_font, f"{y_value:.1f}", BLACK)
+            self.screen.blit(tick_label, (graph.left - 40, y_position - tick_label.get_height() // 2))
+            pygame.draw.line(self.screen, BLACK, (graph.left - 5, y_position), (graph.left, y_position), 2)
+
+    def draw_scores(self, texts):
+        """
+        Draws the current and average alpha power of each player, players 1, 3, ... on the left and 2, 4, ... on the right.
+
+        Args:
+            texts (list): One text per player, e.g. 'Player 1 Alpha Power: 1.23 (Avg: 1.10)'.
+        """
+        self._restore(self.score_region)
+        center_offset = 300  # Distance from the center
+        bar_max_width = 300  # Maximum width for the bars
+        columns = [(self.width // 2) - center_offset - bar_max_width, (self.width // 2) + 200]
+        for i, (text, color) in enumerate(zip(texts, self.player_colors)):
+            position = (columns[i % 2], 70 + 25 * (i // 2))
+            self.text_cache.blit_glyphs(self.screen, self.alpha_font, text, color, position)
+
+    def draw_game_over(self, winner, recalibrate=False):
+        """
+        Draws the game over message.
+
+        Args:
+            winner (str): Name of the winner.
+            recalibrate (bool, optional): Also tell that C calibrates the players again. Defaults to False.
+        """
+        self._restore(self.message_region)
+        self.screen.blit(self.text_cache.render(self.font, 'Game Over! ' + winner + ' is the winner.', BLACK), (200, 200))
+        instructions = ('Press space to play again, C to calibrate again first, or escape to quit.' if recalibrate
+                        else 'Press space to play again or escape to quit.')
+        self.screen.blit(self.text_cache.render(self.font, instructions, BLACK), (200, 250))
+
+    def present(self):
+        """
+        Sends the regions drawn since the last call to the display, in a single update.
+
+        Returns:
+            int: Number of regions updated (0 if nothing changed).
+        """
+        if not self._dirty:
+            return 0
+        pygame.display.update(self._dirty)
+        count = len(self._dirty)
+        self._dirty = []
+        return count
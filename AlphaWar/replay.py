@@ -0,0 +1,433 @@
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+import pygame
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from band_power import NORMALIZATION_MODES
+from board_health import BoardHealth
+from brainflow.board_shim import BoardShim, BrainFlowError
+from calibration import Calibration, RunningStats, baseline_key
+from filters import DEFAULT_NOTCH_FREQUENCY, DEFAULT_BANDPASS
+from pipeline import ScorePipeline, SCORE, player_config
+from recording import RecordedSession
+from tug_of_war import TugOfWar, arena_teams, SCREEN_SIZE, PLAYER_1_RECT, PLAYER_2_RECT, ROPE_RECT
+
+###################
+# Replay engine of Alpha-war. It feeds sessions saved by the recorder (recording.py) through the same ScorePipeline as
+# the live game (acquisition, time alignment, filters, band power and board health) and the same TugOfWar rules, with
+# every board of the session and the live team split. Calibrations and games start where the recording marks them,
+# from the baselines the live game used (or, with other settings, from the recorded calibration scored again). The
+# replay clock is virtual, so a session replays in real time, at N times real time, or as fast as the DSP allows,
+# with the game window optional. Use it to re-score past games with other epoch, hop, speed or normalization settings.
+#   python replay.py recordings/2025-01-01_12-00-00 --normalize max --rope-speed 45
+#   python replay.py recordings/* --output rescored.json
+#   python replay.py recordings/2025-01-01_12-00-00 --speed 4 --render
+###################
+class ReplayClock:
+    """
+    Virtual clock of a replay, in seconds of recording since every board was streaming. The board health checks and
+    the calibration run on it, so they see the timing of the live session at any replay speed.
+
+    Attributes:
+        now (float): The current replay time.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ReplayBoard:
+    """
+    Stands in for a streaming BrainFlowBoardSetup, serving the samples of a recorded board.
+
+    Samples only become available as the replay releases them (release_until), so the pipeline drains the
+    recording in the same increments it would drain a live board, and its health is followed on the replay clock.
+
+    Attributes:
+        recorded (RecordedBoard): The recorded board.
+        name (str): Name of the board in the recording.
+        board_id (int): BrainFlow board ID of the recorded board.
+        master_board (int): Master board ID of the recorded board (None if there was none).
+        eeg_channels (list): EEG rows of the recorded data.
+        sampling_rate (int): Sampling rate of the recorded data.
+        serial_port (str): Always '' (nothing is connected).
+        start (int): First sample served.
+        position (int): Next sample served by get_board_data().
+        released (int): Samples available to get_board_data().
+        health (BoardHealth): Health counters of the served data, on the replay clock.
+    """
+
+    def __init__(self, recorded, start=0, clock=time.perf_counter):
+        """
+        Initializes the board at a sample of the recording.
+
+        Args:
+            recorded (RecordedBoard): The recorded board.
+            start (int, optional): First sample to serve. Defaults to 0.
+            clock (callable, optional): Seconds now, for the health counters. Defaults to time.perf_counter.
+        """
+        self.recorded = recorded
+        self.name = recorded.metadata['name']
+        self.board_id = recorded.metadata['board_id']
+        self.master_board = recorded.metadata.get('master_board')
+        self.eeg_channels = recorded.eeg_channels
+        self.sampling_rate = recorded.sampling_rate
+        self.serial_port = ''
+        self.start = start
+        self.position = start
+        self.released = start
+        self.clock = clock
+        try:
+            package_channel = BoardShim.get_package_num_channel(self.master_board if self.master_board is not None else self.board_id)
+        except BrainFlowError:
+            package_channel = None
+        self.health = BoardHealth(self.sampling_rate, self.eeg_channels, package_channel)
+        self.health.reset(now=clock())
+
+    def __len__(self):
+        """
+        Returns:
+            int: Number of samples in the recording.
+        """
+        return len(self.recorded)
+
+    def release_until(self, sample):
+        """
+        Makes the samples before a position available, like a board that has streamed up to there.
+        """
+        self.released = max(self.released, min(sample, len(self.recorded)))
+
+    def is_exhausted(self):
+        """
+        Returns:
+            bool: True once every sample of the recording has been served.
+        """
+        return self.position >= len(self.recorded)
+
+    def get_board_data(self):
+        """
+        Returns the released samples that weren't served yet, like BoardShim.get_board_data().
+        """
+        data = self.recorded.read(self.position, self.released)
+        self.position = self.released
+        self.health.record(data, now=self.clock())
+        return data
+
+    def get_board_name(self):
+        return self.name
+
+    def get_sampling_rate(self):
+        return self.sampling_rate
+
+    def get_num_rows(self):
+        return self.recorded.metadata['num_rows']
+
+    def is_streaming(self):
+        return not self.is_exhausted()
+
+    def insert_marker(self, marker, verbose=True):
+        pass
+
+    def stop(self):
+        pass
+
+
+def find_common_start(recorded_boards):
+    """
+    Finds the first sample of each board at which every board was streaming, from the timestamp channel.
+
+    Args:
+        recorded_boards (list): RecordedBoard of each player.
+
+    Returns:
+        list: First sample of each board (zeros if the recording has no timestamps).
+    """
+    timestamps = []
+    for recorded in recorded_boards:
+        channel = recorded.metadata.get('timestamp_channel')
+        if channel is None or len(recorded) == 0:
+            return [0] * len(recorded_boards)
+        timestamps.append(recorded.read(rows=[channel])[0])
+    start_time = max(board_timestamps[0] for board_timestamps in timestamps)
+    return [int(np.searchsorted(board_timestamps, start_time)) for board_timestamps in timestamps]
+
+
+def session_events(session, boards):
+    """
+    Places the events of a session on the replay clock.
+
+    Args:
+        session (RecordedSession): The recording.
+        boards (list): ReplayBoard of every player.
+
+    Returns:
+        list: (replay time in seconds, event) of every event that has sample positions, in order.
+    """
+    timed = []
+    for event in session.events:
+        for board in boards:
+            sample = event.get('samples', {}).get(board.recorded.key)
+            if sample is not None:
+                timed.append(((sample - board.start) / board.sampling_rate, event))
+                break
+    return sorted(timed, key=lambda item: item[0])
+
+
+def replay_session(session, speed=None, render=False, epoch_duration=2, hop_duration=0.25, normalize='betaalpha',
+                   rope_speed=30, players=None, channels=None, history_length=100, frame_rate=60,
+                   notch_frequency=DEFAULT_NOTCH_FREQUENCY, bandpass=DEFAULT_BANDPASS, align_boards=True):
+    """
+    Replays a recorded session through the game pipeline and returns the games it produces.
+
+    Games start where the recording marks a game start and end with a win, or where the live game ended. Each game
+    uses the baselines recorded with its start when the settings are the live ones, otherwise those of the recorded
+    calibrations, scored again with these settings (raw scores if a player wasn't calibrated in the session).
+    Recordings without game starts play a game from the start, and a new one right after each win, on raw scores.
+
+    Args:
+        session (RecordedSession or str): The recording (or its folder).
+        speed (float, optional): Replay speed relative to real time (1 for real time, 4 for 4x). Defaults to None
+                                 (as fast as possible).
+        render (bool, optional): Whether to show the game window. Defaults to False.
+        epoch_duration (float, optional): Seconds of data per score. Defaults to 2.
+        hop_duration (float, optional): Seconds between two scores. Defaults to 0.25.
+        normalize (str, optional): Alpha power normalization. Defaults to 'betaalpha'.
+        rope_speed (float, optional): Pixels the rope moves per epoch_duration. Defaults to 30.
+        players (list, optional): Keys of the boards in the recording, in player order (players 1, 3, ... pull left).
+                                  Defaults to every board, in the live order.
+        channels (list, optional): Rows used as EEG channels for each player. Defaults to each board's eeg_channels.
+        history_length (int, optional): Number of points on the graph when rendering. Defaults to 100.
+        frame_rate (int, optional): Frames per second when rendering. Defaults to 60.
+        notch_frequency (float, optional): Mains notch in Hz, None for no notch. Defaults to DEFAULT_NOTCH_FREQUENCY.
+        bandpass (tuple, optional): Bandpass edges in Hz, None for no bandpass. Defaults to DEFAULT_BANDPASS.
+        align_boards (bool, optional): Score every board over the same interval, from their timestamps. Defaults to True.
+
+    Returns:
+        dict: The settings, the teams, the games ('winner', 'epochs', 'start_s' and 'end_s' in seconds of recording,
+              'baselines' ('recorded', 'recalibrated' or None for raw scores) and 'recorded_winner', the winner of the
+              live game), the average score of each player and the replayed and wall-clock durations.
+
+    Raises:
+        ValueError: If the recording holds fewer than two boards.
+    """
+    if not isinstance(session, RecordedSession):
+        session = RecordedSession(session)
+    players = players or list(session.boards)
+    if len(players) < 2:
+        raise ValueError(f"A replay needs at least two boards, {session.path} holds {len(session.boards)}.")
+    recorded_boards = [session[key] for key in players]
+
+    clock = ReplayClock()
+    starts = find_common_start(recorded_boards)
+    boards = [ReplayBoard(recorded, start, clock) for recorded, start in zip(recorded_boards, starts)]
+    channels = channels or [None] * len(boards)
+    names = [board.get_board_name() for board in boards]
+    rates = [board.get_sampling_rate() for board in boards]
+
+    # The live scoring: acquisition, alignment, filters, band power and health, drained on every read
+    scorer = ScorePipeline([player_config(name, board.board_id, channels=board_channels)
+                            for name, board, board_channels in zip(names, boards, channels)],
+                           epoch_duration, hop_duration, normalize, notch_frequency, bandpass, threaded=False,
+                           reconnect_boards=False, align_boards=align_boards, clock=clock)
+    scorer.start(boards=boards)
+    keys = [baseline_key(board.board_id, normalize, epoch_duration, hop_duration, notch_frequency, bandpass) for board in boards]
+
+    player_rects = [pygame.Rect(PLAYER_1_RECT), pygame.Rect(PLAYER_2_RECT)]
+    game = TugOfWar(player_rects, pygame.Rect(ROPE_RECT), rope_speed, hop_duration, epoch_duration, history_length,
+                    names=names, teams=arena_teams(len(boards)))
+
+    renderer = None
+    if render:
+        from rendering import AlphaWarRenderer, PLAYER_COLORS
+        pygame.init()
+        screen = pygame.display.set_mode(SCREEN_SIZE)
+        pygame.display.set_caption(f'Tug of War - replay of {os.path.basename(os.path.normpath(session.path))}')
+        renderer = AlphaWarRenderer(screen, player_rects, history_length, rope_y=ROPE_RECT[1], rope_height=ROPE_RECT[3],
+                                    x_label=f"Epochs ({epoch_duration}s each, every {hop_duration}s)",
+                                    player_colors=PLAYER_COLORS[:len(boards)])
+
+    events = session_events(session, boards)
+    scheduled = any(event['label'] == 'game start' for _, event in events)
+    next_event = 0
+
+    # The replay clock advances one hop per iteration, or one frame of the window when rendering at a set speed
+    step = speed / frame_rate if render and speed is not None else hop_duration
+    games = []
+    wall_start = time.perf_counter()
+    calibration, calibrated_players = None, []
+    calibrated = [None] * len(boards)
+    running = False
+    new_game, baselines_source = not scheduled, None
+    quit_replay = False
+    while not quit_replay and not any(board.is_exhausted() for board in boards):
+        clock.now += step
+        for board, start, rate in zip(boards, starts, rates):
+            board.release_until(start + int(round(clock.now * rate)))
+
+        # The calibrations and games of the live session, as the replay clock reaches them
+        while next_event < len(events) and events[next_event][0] <= clock.now:
+            event = events[next_event][1]
+            details = event.get('details') or {}
+            label = event['label']
+            next_event += 1
+            if label == 'calibration start' and 'duration' in details:
+                calibration = Calibration(names, details['duration'], settle_time=epoch_duration)
+                calibration.start(now=clock.now)
+                calibrated_players = [names.index(name) for name in details.get('players', names) if name in names]
+                scorer.restart()
+            elif label == 'calibration end' and calibration is not None:
+                # Marked right after the last phase, unless the players quit during the calibration
+                if calibration.is_done(now=clock.now + step):
+                    for i in calibrated_players:
+                        # As in the game, a player whose calibration failed plays from an empty baseline
+                        baseline = calibration.baselines[i]
+                        calibrated[i] = baseline if baseline.spread_known else RunningStats()
+                calibration = None
+            elif label == 'game start':
+                if 'teams' in details:
+                    game.teams = tuple(list(team) for team in details['teams'])
+                game.calibrated_baselines, baselines_source = None, None
+                if details.get('baselines') is not None:
+                    decay = details.get('baseline_decay')
+                    if details.get('baseline_keys') == keys:
+                        game.calibrated_baselines = [RunningStats.from_dict(values, decay=decay) for values in details['baselines']]
+                        baselines_source = 'recorded'
+                    elif all(baseline is not None for baseline in calibrated):
+                        game.calibrated_baselines = [RunningStats.from_dict(baseline.to_dict(), decay=decay) for baseline in calibrated]
+                        baselines_source = 'recalibrated'
+                    else:
+                        print(f"[Replay] Game at {clock.now:.0f} s: no recorded calibration of "
+                              f"{', '.join(name for name, baseline in zip(names, calibrated) if baseline is None)} "
+                              f"with these settings, playing on raw scores")
+                new_game = True
+            elif label == 'quit' or label.endswith(' won'):
+                recorded_winner = label[:-len(' won')] if label.endswith(' won') else None
+                if running:
+                    games[-1]['end_s'] = clock.now
+                    running = False
+                if games and 'recorded_winner' not in games[-1]:
+                    games[-1]['recorded_winner'] = recorded_winner
+
+        if new_game:
+            # Start each game from the latest full epoch of each board, like the live game
+            game.reset()
+            scorer.restart()
+            games.append({'winner': None, 'epochs': 0, 'start_s': clock.now, 'end_s': None,
+                          'baselines': baselines_source})
+            if renderer is not None:
+                renderer.reset()
+            running = True
+            new_game = False
+
+        records = scorer.read()
+        if calibration is not None:
+            for i, board_records in enumerate(records):
+                calibration.add(i, board_records[:, SCORE], now=clock.now)
+
+        updates, rope_moved = 0, False
+        paused = scorer.paused_boards()
+        if running:
+            # Players whose board is unhealthy sit out, the others keep playing
+            for i, reason in enumerate(paused):
+                if (reason is not None) != game.paused[i]:
+                    game.set_paused(i, reason is not None)
+            updates = game.push_all([board_records[:, SCORE].tolist() for board_records in records])
+            rope_moved = game.advance(step)
+            games[-1]['epochs'] += updates
+            if game.winner is not None:
+                games[-1].update(winner=game.winner, end_s=clock.now)
+                running = False
+                new_game = not scheduled
+
+        if renderer is not None:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                    quit_replay = True
+            if calibration is not None:
+                renderer.draw_message(calibration.message(now=clock.now))
+            if rope_moved:
+                renderer.draw_rope(game.rope)
+            if updates:
+                renderer.draw_graph(game.history)
+                renderer.draw_scores([f'{name}: paused ({reason})' if reason is not None else
+                                      f'{name} Alpha Power: -' if score is None else
+                                      f'{name} Alpha Power: {score:.2f} (Avg: {average:.2f})'
+                                      for name, score, average, reason in zip(names, game.scores, game.averages, paused)])
+            if game.winner is not None:
+                renderer.draw_game_over(game.winner)
+            renderer.present()
+
+        if speed is not None:
+            # Wait until the wall clock catches up with the replay clock
+            delay = wall_start + clock.now / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    if running:
+        games[-1]['end_s'] = clock.now
+    scorer.stop()
+    if renderer is not None:
+        pygame.quit()
+
+    wins = {}
+    for game_result in games:
+        if game_result['winner'] is not None:
+            wins[game_result['winner']] = wins.get(game_result['winner'], 0) + 1
+    return {
+        'session': session.path,
+        'players': players,
+        'teams': [list(team) for team in game.teams],
+        'settings': {'epoch_duration': epoch_duration, 'hop_duration': hop_duration, 'normalize': normalize,
+                     'rope_speed': rope_speed, 'speed': speed, 'notch_frequency': notch_frequency,
+                     'bandpass': list(bandpass) if bandpass is not None else None, 'align_boards': align_boards},
+        'games': games,
+        'wins': wins,
+        'epochs': game.count,
+        'averages': game.averages,
+        'replayed_s': clock.now,
+        'wall_s': time.perf_counter() - wall_start,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay recorded AlphaWar sessions through the game pipeline.')
+    parser.add_argument('sessions', nargs='+', help='Session folders (holding index.json).')
+    parser.add_argument('--speed', type=float, default=0, help='Speed relative to real time, 0 for as fast as possible (default: 0).')
+    parser.add_argument('--render', action='store_true', help='Show the game window.')
+    parser.add_argument('--epoch-duration', type=float, default=2)
+    parser.add_argument('--hop-duration', type=float, default=0.25)
+    parser.add_argument('--normalize', choices=NORMALIZATION_MODES, default='betaalpha')
+    parser.add_argument('--rope-speed', type=float, default=30, help='Top speed of the rope in pixels per epoch (default: 30).')
+    parser.add_argument('--notch', type=float, default=DEFAULT_NOTCH_FREQUENCY, help='Mains notch in Hz, 0 for none (default: %(default)s).')
+    parser.add_argument('--bandpass', type=float, nargs=2, default=DEFAULT_BANDPASS, metavar=('LOW', 'HIGH'), help='Bandpass in Hz (default: 1 45).')
+    parser.add_argument('--no-bandpass', action='store_true', help='Score without the bandpass.')
+    parser.add_argument('--output', help='File to write the results of every session to, as JSON.')
+    args = parser.parse_args()
+
+    results = []
+    for path in args.sessions:
+        try:
+            result = replay_session(path, speed=args.speed or None, render=args.render,
+                                    epoch_duration=args.epoch_duration, hop_duration=args.hop_duration,
+                                    normalize=args.normalize, rope_speed=args.rope_speed, notch_frequency=args.notch or None,
+                                    bandpass=None if args.no_bandpass else tuple(args.bandpass))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Couldn't replay {path}: {e}")
+            continue
+        results.append(result)
+        wins = ', '.join(f"{name}: {count}" for name, count in result['wins'].items())
+        live = [game for game in result['games'] if game.get('recorded_winner') is not None]
+        same = sum(game['winner'] == game['recorded_winner'] for game in live)
+        print(f"{path}: {len(result['games'])} games ({wins}), {same} of {len(live)} live wins reproduced, "
+              f"{result['epochs']} epochs, {result['replayed_s']:.0f} s replayed in {result['wall_s']:.2f} s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
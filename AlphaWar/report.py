@@ -0,0 +1,315 @@
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import time
+import numpy as np
+from band_power import ALPHA_BAND, BETA_BAND
+from filters import DEFAULT_BANDPASS, DEFAULT_NOTCH_FREQUENCY, StreamingFilter
+from recording import RecordedSession
+
+###################
+# This file holds the post-game reports of Alpha-war. After each game of a recorded session, a report worker process
+# reads the game back from the recording and draws the spectrogram and the alpha and beta power of every player over
+# the game, above the margin of the rope. Each report is saved once as a PNG in the session folder
+# (reports/game_<n>.png, next to the game's description in game_<n>.json); asking for it again returns the file.
+# Matplotlib is only imported by the worker, the game process never loads it.
+#
+# Run `python report.py <session folder>` to build (or find) the reports of a recorded session.
+###################
+REPORTS_DIR = 'reports'
+GAME_START = 'game start'  # Label of the session event starting a game, the next event with value 2 ends it
+
+
+def report_path(session_path, game):
+    """
+    Returns:
+        str: The report of a game of a session (games are numbered from 1).
+    """
+    return os.path.join(session_path, REPORTS_DIR, f"game_{game}.png")
+
+
+def info_path(session_path, game):
+    """
+    Returns:
+        str: The description of a game saved with its report (names, teams, winner, rope margin, ...).
+    """
+    return os.path.join(session_path, REPORTS_DIR, f"game_{game}.json")
+
+
+def game_spans(session):
+    """
+    Finds the games of a recorded session from its events.
+
+    Args:
+        session (RecordedSession): The session.
+
+    Returns:
+        list: (start event, end event) of every game, the end event is None while the game isn't over.
+    """
+    spans = []
+    for event in session.events:
+        if event['label'] == GAME_START:
+            spans.append([event, None])
+        elif event.get('value') == 2 and spans and spans[-1][1] is None:
+            spans[-1][1] = event
+    return [tuple(span) for span in spans]
+
+
+def _wait_for_game(session_path, game, timeout):
+    """
+    Opens a session once the recorder has written the whole game (its index is only saved every few seconds).
+
+    Returns:
+        tuple: The RecordedSession and the (start, end) events of the game.
+
+    Raises:
+        ValueError: If the game isn't in the session within timeout seconds.
+    """
+    deadline = time.perf_counter() + timeout
+    while True:
+        session = RecordedSession(session_path)
+        spans = game_spans(session)
+        if len(spans) >= game and spans[game - 1][1] is not None:
+            start, end = spans[game - 1]
+            if all(len(board) >= end['samples'].get(board.key, 0) for board in session):
+                return session, (start, end)
+        if time.perf_counter() > deadline:
+            raise ValueError(f"Game {game} isn't (fully) recorded in {session_path}")
+        time.sleep(0.5)
+
+
+def _player_spectra(board, channels, start, end, epoch_duration, hop_duration, notch_frequency, bandpass):
+    """
+    Spectrogram and band power of a player over a game, from the EEG filtered like the game filters it.
+
+    Returns:
+        dict: 'freqs', 'times' (seconds from the start of the game to the end of each window), 'power' (mean power
+              over the channels, shape (n_freqs, n_windows)), 'alpha' and 'beta' (band power of each window). None
+              if the game is shorter than an epoch.
+    """
+    from scipy.signal import spectrogram
+
+    rate = board.sampling_rate
+    window = int(epoch_duration * rate)
+    hop = max(1, int(hop_duration * rate))
+    eeg = board.read(start, end, rows=channels)
+    if eeg.shape[1] < window:
+        return None
+    eeg = StreamingFilter(len(channels), rate, notch_frequency, bandpass).process(eeg)
+    freqs, times, power = spectrogram(eeg, fs=rate, nperseg=window, noverlap=window - hop, detrend='constant', axis=-1)
+    power = power.mean(axis=0)
+    alpha = (freqs >= ALPHA_BAND[0]) & (freqs <= ALPHA_BAND[1])
+    beta = (freqs > BETA_BAND[0]) & (freqs <= BETA_BAND[1])
+    return {'freqs': freqs, 'times': times + window / (2 * rate), 'power': power,
+            'alpha': power[alpha].sum(axis=0), 'beta': power[beta].sum(axis=0)}
+
+
+def build_report(session_path, game, info=None, rebuild=False, timeout=30.0):
+    """
+    Builds the report of a game of a recorded session, or returns it if it was already built.
+
+    Args:
+        session_path (str): The session folder.
+        game (int): Number of the game in the session, from 1.
+        info (dict, optional): Description of the game from the game loop (see AlphaWar.py), saved with the report.
+                               Defaults to the one saved with a previous report, if any.
+        rebuild (bool, optional): Build the report again even if it exists. Defaults to False.
+        timeout (float, optional): Seconds to wait for the recorder to write the game. Defaults to 30.0.
+
+    Returns:
+        str: The report (PNG).
+
+    Raises:
+        ValueError: If the game isn't in the session.
+    """
+    path = report_path(session_path, game)
+    if os.path.exists(path) and not rebuild:
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if info is not None:
+        with open(info_path(session_path, game), 'w') as f:
+            json.dump(info, f, indent=2)
+    elif os.path.exists(info_path(session_path, game)):
+        with open(info_path(session_path, game)) as f:
+            info = json.load(f)
+    info = info or {}
+
+    session, (start, end) = _wait_for_game(session_path, game, timeout)
+    boards = {board.metadata['name']: board for board in session}
+    names = [name for name in info.get('names', boards) if name in boards]
+    channels = info.get('channels') or [None] * len(names)
+    epoch_duration = info.get('epoch_duration', 2)
+    hop_duration = info.get('hop_duration', 0.25)
+    notch_frequency = info.get('notch_frequency', DEFAULT_NOTCH_FREQUENCY)
+    bandpass = info.get('bandpass', DEFAULT_BANDPASS)
+    spectra = [_player_spectra(boards[name], player_channels or boards[name].eeg_channels,
+                               start['samples'].get(boards[name].key, 0), end['samples'].get(boards[name].key, 0),
+                               epoch_duration, hop_duration, notch_frequency, bandpass)
+               for name, player_channels in zip(names, channels)]
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    figure = plt.figure(figsize=(12, 2.4 * len(names) + 2.6))
+    grid = figure.add_gridspec(len(names) + 1, 2, width_ratios=(3, 2))
+    winner = info.get('winner') or end['label']
+    figure.suptitle(f"Game {game} ({winner}) - {time.strftime('%Y-%m-%d %H:%M', time.localtime(start['time']))}")
+    top_frequency = bandpass[1] if bandpass else 45
+    for row, (name, spectrum) in enumerate(zip(names, spectra)):
+        spectrogram_axes = figure.add_subplot(grid[row, 0])
+        power_axes = figure.add_subplot(grid[row, 1])
+        spectrogram_axes.set_ylabel(f"{name}\nHz")
+        if spectrum is None:
+            spectrogram_axes.text(0.5, 0.5, 'Shorter than an epoch', ha='center', va='center', transform=spectrogram_axes.transAxes)
+            continue
+        shown = spectrum['freqs'] <= top_frequency
+        spectrogram_axes.pcolormesh(spectrum['times'], spectrum['freqs'][shown],
+                                    10 * np.log10(spectrum['power'][shown] + 1e-12), shading='auto', cmap='viridis')
+        for edge in (ALPHA_BAND[0], ALPHA_BAND[1], BETA_BAND[1]):
+            spectrogram_axes.axhline(edge, color='white', linewidth=0.5, alpha=0.6)
+        power_axes.semilogy(spectrum['times'], spectrum['alpha'], label=f"Alpha {ALPHA_BAND[0]}-{ALPHA_BAND[1]} Hz")
+        power_axes.semilogy(spectrum['times'], spectrum['beta'], label=f"Beta {BETA_BAND[0]}-{BETA_BAND[1]} Hz")
+        power_axes.set_ylabel('uV^2/Hz')
+        power_axes.legend(loc='upper right', fontsize='small')
+
+    margin_axes = figure.add_subplot(grid[len(names), :])
+    margin = info.get('margin')
+    if margin and margin['times']:
+        times, values = np.asarray(margin['times']), np.asarray(margin['values'])
+        margin_axes.plot(times, values, color='black')
+        margin_axes.fill_between(times, values, 0, where=values < 0, color='tab:blue', alpha=0.3)
+        margin_axes.fill_between(times, values, 0, where=values > 0, color='tab:red', alpha=0.3)
+        teams = info.get('teams')
+        if teams:
+            margin_axes.set_yticks([-1, 0, 1], [' & '.join(info['names'][i] for i in teams[0]), '0',
+                                                ' & '.join(info['names'][i] for i in teams[1])])
+    else:
+        margin_axes.text(0.5, 0.5, 'No rope margin saved with this game', ha='center', va='center', transform=margin_axes.transAxes)
+    margin_axes.set_ylim(-1.05, 1.05)
+    margin_axes.set_ylabel('Rope margin')
+    margin_axes.set_xlabel('Seconds since the start of the game')
+    figure.tight_layout()
+    figure.savefig(path, dpi=100)
+    plt.close(figure)
+    return path
+
+
+def _run_reports(jobs, results):
+    """
+    Main function of the report process: builds the reports of the games it receives until it gets None.
+    """
+    # Ctrl+C reaches the whole process group, the game process closes the worker when it is done
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Load the plotting libraries while the first game is played (scipy.signal for _player_spectra)
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot
+    importlib.import_module('scipy.signal')
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        session_path, game, info = job
+        build_start = time.perf_counter()
+        try:
+            path = build_report(session_path, game, info)
+        except Exception as e:
+            results.put((game, None, str(e)))
+        else:
+            results.put((game, path, time.perf_counter() - build_start))
+
+
+class ReportWorker:
+    """
+    Background process building the report of each game (see build_report()), so the game-over screen and the next
+    game never wait on it.
+
+    Attributes:
+        pending (int): Reports submitted and not returned by poll() yet.
+    """
+
+    def __init__(self):
+        """
+        Initializes the worker. The process starts with start().
+        """
+        self.pending = 0
+        self._jobs = multiprocessing.Queue()
+        self._results = multiprocessing.Queue()
+        self._process = None
+
+    def start(self):
+        """
+        Starts the report process (before the boards are connected, so no acquisition thread is running yet).
+        """
+        self._process = multiprocessing.Process(target=_run_reports, name='Alpha-war reports', args=(self._jobs, self._results))
+        self._process.start()
+
+    def submit(self, session_path, game, info=None):
+        """
+        Asks for the report of a game, see build_report().
+        """
+        self.pending += 1
+        self._jobs.put((session_path, game, info))
+
+    def poll(self):
+        """
+        Returns:
+            list: (game, report path or None, seconds it took or the error) of every report finished since the last call.
+        """
+        finished = []
+        while True:
+            try:
+                finished.append(self._results.get_nowait())
+            except queue.Empty:
+                break
+        self.pending -= len(finished)
+        return finished
+
+    def close(self, timeout=60.0):
+        """
+        Lets the process finish the reports submitted so far (up to timeout seconds), then stops it.
+
+        Returns:
+            list: The reports finished since the last poll(), see poll().
+        """
+        if self._process is None:
+            return []
+        if self.pending:
+            print(f"[Report] Finishing {self.pending} report(s)...")
+        self._jobs.put(None)
+        self._process.join(timeout)
+        if self._process.is_alive():
+            print("[Report] Reports didn't finish in time, stopping")
+            self._process.terminate()
+            self._process.join()
+        self._process = None
+        return self.poll()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the post-game reports of a recorded AlphaWar session.')
+    parser.add_argument('session', help='Session folder, e.g. recordings/2025-01-01_12-00-00')
+    parser.add_argument('--game', type=int, action='append', help='Number of a game (from 1), can be repeated. Defaults to every game.')
+    parser.add_argument('--rebuild', action='store_true', help='Build the reports again even if they exist')
+    args = parser.parse_args()
+
+    games = args.game or range(1, len(game_spans(RecordedSession(args.session))) + 1)
+    for game in games:
+        report_start = time.perf_counter()
+        cached = os.path.exists(report_path(args.session, game)) and not args.rebuild
+        try:
+            path = build_report(args.session, game, rebuild=args.rebuild, timeout=0)
+        except ValueError as e:
+            print(f"[Report] {e}")
+            continue
+        print(f"[Report] Game {game}: {path} ({'cached' if cached else f'built in {time.perf_counter() - report_start:.1f} s'})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+from collections import deque
+import numpy as np
+
+###################
+# This file holds the score history of Alpha-war: a fixed-capacity ring buffer of the scores of every player that
+# keeps a running minimum and maximum and projects the whole history to screen-space polylines in one NumPy call.
+###################
+class ScoreHistory:
+    """
+    A fixed-capacity, NumPy-backed history of the scores of N players, oldest first.
+
+    Every score is written twice, capacity apart, in a buffer of twice the capacity, so the last len() scores
+    are always one contiguous slice and reading the history in order never copies or rolls the buffer.
+    The running minimum and maximum are kept with monotonic queues, so they cost O(1) amortized per append
+    instead of a pass over the whole history.
+
+    Attributes:
+        n_players (int): Number of players.
+        capacity (int): Maximum number of scores kept per player.
+        total_appended (int): Number of scores appended per player since creation or the last reset.
+    """
+
+    def __init__(self, n_players, capacity):
+        """
+        Initializes the history.
+
+        Args:
+            n_players (int): Number of players.
+            capacity (int): Maximum number of scores kept per player.
+
+        Raises:
+            ValueError: If n_players or capacity is smaller than 1.
+        """
+        if n_players < 1 or capacity < 1:
+            raise ValueError("n_players and capacity must be at least 1")
+
+        self.n_players = n_players
+        self.capacity = capacity
+        self._data = np.zeros((n_players, 2 * capacity))
+        self._points = np.zeros((n_players, capacity, 2), dtype=np.int32)
+        self._scaled = np.zeros((n_players, capacity))
+        self._x_cache = {}
+        self.reset()
+
+    def reset(self):
+        """
+        Removes all scores.
+        """
+        self.total_appended = 0
+        self._min_queues = [deque() for _ in range(self.n_players)]
+        self._max_queues = [deque() for _ in range(self.n_players)]
+
+    def __len__(self):
+        """
+        Returns:
+            int: Number of scores currently held per player (at most capacity).
+        """
+        return min(self.total_appended, self.capacity)
+
+    def append(self, scores):
+        """
+        Appends one score per player, dropping the oldest ones once the history is full.
+
+        Args:
+            scores (sequence): One score per player.
+        """
+        index = self.total_appended
+        slot = index % self.capacity
+        self._data[:, slot] = scores
+        self._data[:, slot + self.capacity] = scores
+        self.total_appended += 1
+
+        oldest = self.total_appended - self.capacity
+        for player in range(self.n_players):
+            value = self._data[player, slot]
+            min_queue = self._min_queues[player]
+            while min_queue and min_queue[-1][1] >= value:
+                min_queue.pop()
+            min_queue.append((index, value))
+            if min_queue[0][0] < oldest:
+                min_queue.popleft()
+
+            max_queue = self._max_queues[player]
+            while max_queue and max_queue[-1][1] <= value:
+                max_queue.pop()
+            max_queue.append((index, value))
+            if max_queue[0][0] < oldest:
+                max_queue.popleft()
+
+    def values(self):
+        """
+        Returns the scores in the history, oldest first.
+
+        Returns:
+            numpy.ndarray: (n_players, len()) view of the history. It is overwritten by later appends, copy it to keep it.
+        """
+        n = len(self)
+        start = self.total_appended % self.capacity if self.total_appended > self.capacity else 0
+        return self._data[:, start:start + n]
+
+    def latest(self):
+        """
+        Returns:
+            numpy.ndarray: The last score of each player, or None if the history is empty.
+        """
+        if self.total_appended == 0:
+            return None
+        return self._data[:, (self.total_appended - 1) % self.capacity].copy()
+
+    def min(self, player=None):
+        """
+        Returns the smallest score in the history.
+
+        Args:
+            player (int, optional): Only consider this player. Defaults to all players.
+
+        Returns:
+            float: The smallest score, or None if the history is empty.
+        """
+        if self.total_appended == 0:
+            return None
+        queues = self._min_queues if player is None else [self._min_queues[player]]
+        return min(queue[0][1] for queue in queues)
+
+    def max(self, player=None):
+        """
+        Returns the largest score in the history.
+
+        Args:
+            player (int, optional): Only consider this player. Defaults to all players.
+
+        Returns:
+            float: The largest score, or None if the history is empty.
+        """
+        if self.total_appended == 0:
+            return None
+        queues = self._max_queues if player is None else [self._max_queues[player]]
+        return max(queue[0][1] for queue in queues)
+
+    def polylines(self, rect, min_value, max_value):
+        """
+        Projects the history of every player to screen coordinates inside a rectangle.
+
+        The full capacity spans the width of the rectangle, so the points keep their spacing as the history fills.
+        min_value maps to the bottom of the rectangle and max_value to its top (values outside that range fall
+        outside the rectangle).
+
+        Args:
+            rect (pygame.Rect): The plot area.
+            min_value (float): Score drawn at the bottom of the rectangle.
+            max_value (float): Score drawn at the top of the rectangle.
+
+        Returns:
+            numpy.ndarray: (n_players, len(), 2) integer (x, y) points, a view of a buffer reused by the next call.
+        """
+        n = len(self)
+        points = self._points[:, :n]
+        points[:, :, 0] = self._get_x(rect.left, rect.width)[:n]
+
+        # Same rounding as int(): truncate the scaled height toward zero
+        scaled = self._scaled[:, :n]
+        np.subtract(self.values(), min_value, out=scaled)
+        scaled *= rect.height / (max_value - min_value)
+        np.trunc(scaled, out=scaled)
+        np.subtract(rect.bottom, scaled, out=points[:, :, 1], casting='unsafe')
+        return points
+
+    def _get_x(self, left, width):
+        """
+        Returns the (cached) x coordinate of every slot of the history.
+        """
+        key = (left, width)
+        x = self._x_cache.get(key)
+        if x is None:
+            x = (left + np.arange(self.capacity) * width // self.capacity).astype(np.int32)
+            self._x_cache = {key: x}
+        return x
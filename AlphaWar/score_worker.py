@@ -0,0 +1,470 @@
+import multiprocessing
+import queue
+import signal
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from brainflow.board_shim import BoardShim
+from device_registry import DeviceRegistry
+from pipeline import ScorePipeline, SCORE_FIELDS
+
+###################
+# This file holds the multi-process mode of Alpha-war. A worker process owns the boards and runs the ScorePipeline
+# (acquisition, filters, band power), so the BrainFlow reads and the FFTs never compete with pygame for the GIL.
+# It publishes the scores and the latest epoch of every board through shared-memory rings; the game process only
+# reads them. ScoreWorker has the same interface as ScorePipeline, so the game loop runs either one.
+###################
+# Header of a ring (int64): number of records written, sequence counter of the window (odd while it is written)
+_RECORDS_WRITTEN = 0
+_WINDOW_SEQUENCE = 1
+_HEADER_SIZE = 2
+
+
+class SharedScoreRing:
+    """
+    Score records and latest window of one board in shared memory, written by a single process.
+
+    Records are appended to a ring and the number written is published after them, so readers copy everything up to
+    that count without a lock (and check afterwards that the writer didn't wrap over what they copied). The window is
+    guarded by a sequence counter: the writer makes it odd while it copies the window in and even when done, readers
+    retry if it was odd or changed during their copy.
+
+    Attributes:
+        name (str): Name of the shared memory block.
+        n_channels (int): Number of EEG channels of the window.
+        window_samples (int): Number of samples of the window.
+        capacity (int): Number of records kept.
+        records (numpy.ndarray): The (capacity, len(SCORE_FIELDS)) ring of records, in shared memory.
+        window (numpy.ndarray): The (n_channels, window_samples) latest window, in shared memory.
+    """
+
+    def __init__(self, n_channels, window_samples, capacity=1024, name=None):
+        """
+        Creates a ring, or attaches to an existing one when a name is given.
+
+        Args:
+            n_channels (int): Number of EEG channels of the window.
+            window_samples (int): Number of samples of the window.
+            capacity (int, optional): Number of records kept. Defaults to 1024.
+            name (str, optional): Name of an existing ring to attach to. Defaults to None (create a new one).
+        """
+        self.n_channels = n_channels
+        self.window_samples = window_samples
+        self.capacity = capacity
+        n_fields = len(SCORE_FIELDS)
+        size = 8 * (_HEADER_SIZE + capacity * n_fields + n_channels * window_samples)
+        self._owner = name is None
+        # The worker shares the resource tracker of the game process, which frees the block if neither could
+        self._shm = shared_memory.SharedMemory(name=name, create=self._owner, size=size)
+        self.name = self._shm.name
+
+        buffer = self._shm.buf
+        self._header = np.ndarray((_HEADER_SIZE,), dtype=np.int64, buffer=buffer)
+        self.records = np.ndarray((capacity, n_fields), dtype=np.float64, buffer=buffer, offset=8 * _HEADER_SIZE)
+        self.window = np.ndarray((n_channels, window_samples), dtype=np.float64, buffer=buffer,
+                                 offset=8 * (_HEADER_SIZE + capacity * n_fields))
+        if self._owner:
+            self._header[:] = 0
+
+    def spec(self):
+        """
+        Returns:
+            dict: The arguments to attach to this ring from another process.
+        """
+        return {'n_channels': self.n_channels, 'window_samples': self.window_samples, 'capacity': self.capacity, 'name': self.name}
+
+    @property
+    def written(self):
+        """
+        int: Number of records written since creation.
+        """
+        return int(self._header[_RECORDS_WRITTEN])
+
+    def publish(self, records):
+        """
+        Appends records (writer only).
+
+        Args:
+            records (numpy.ndarray): Array of shape (n, len(SCORE_FIELDS)), oldest first.
+        """
+        written, n = self.written, len(records)
+        kept = records[-self.capacity:]
+        self.records[np.arange(written + n - len(kept), written + n) % self.capacity] = kept
+        # Published after the records, readers never copy a record before it is complete
+        self._header[_RECORDS_WRITTEN] = written + n
+
+    def publish_window(self, write):
+        """
+        Replaces the window (writer only).
+
+        Args:
+            write (callable): Called with the shared window array to fill it in.
+        """
+        self._header[_WINDOW_SEQUENCE] += 1
+        try:
+            write(self.window)
+        finally:
+            self._header[_WINDOW_SEQUENCE] += 1
+
+    def read_since(self, position):
+        """
+        Copies the records written after a position.
+
+        Args:
+            position (int): Position returned by the previous call (0 to read from the start).
+
+        Returns:
+            tuple: The records (numpy.ndarray of shape (n, len(SCORE_FIELDS))) and the position to pass to the next call.
+                   Records overwritten before they could be read are skipped.
+        """
+        written = self.written
+        start = max(position, written - self.capacity)
+        indices = np.arange(start, written) % self.capacity
+        records = self.records[indices]
+        # The writer may have wrapped over the oldest copied records meanwhile
+        overwritten = self.written - self.capacity - start
+        if overwritten > 0:
+            records = records[overwritten:]
+        return records, written
+
+    def read_window(self, out=None, retries=100):
+        """
+        Copies the latest window.
+
+        Args:
+            out (numpy.ndarray, optional): Preallocated array to copy the window into.
+            retries (int, optional): Copies attempted while the writer is busy. Defaults to 100.
+
+        Returns:
+            numpy.ndarray: The window, or None if no window was published yet (or the writer kept it busy).
+        """
+        out = np.empty_like(self.window) if out is None else out
+        for _ in range(retries):
+            sequence = int(self._header[_WINDOW_SEQUENCE])
+            if sequence == 0:
+                return None
+            if sequence % 2 == 0:
+                np.copyto(out, self.window)
+                if int(self._header[_WINDOW_SEQUENCE]) == sequence:
+                    return out
+            time.sleep(0)
+        return None
+
+    def close(self):
+        """
+        Detaches from the ring, and frees it if this process created it.
+        """
+        self._header = self.records = self.window = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def _run_worker(players, settings, ring_specs, commands, status, stop_event, poll_interval):
+    """
+    Main function of the worker process: runs the pipeline and publishes its scores until stop_event is set (or
+    the game process died), then releases the boards. Any error is sent to the game process before it stops.
+    """
+    # Ctrl+C reaches the whole process group, the game process stops the worker through stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    rings = [SharedScoreRing(**spec) for spec in ring_specs]
+    settings = dict(settings)
+    registry_path = settings.pop('registry_path')
+    registry = DeviceRegistry(registry_path) if registry_path is not None else None
+    pipeline = ScorePipeline(players, threaded=False, registry=registry, **settings)
+    try:
+        try:
+            pipeline.start()
+        except Exception as e:
+            status.put(('error', str(e)))
+            return
+        status.put(('connected', None))
+
+        warm = None
+        while warm is None or not all(warm):
+            if stop_event.wait(poll_interval):
+                return
+            previous, warm = warm, pipeline.warm_boards()
+            if warm != previous:
+                status.put(('waiting', warm))
+        pipeline.restart()
+        status.put(('warm', None))
+
+        parent = multiprocessing.parent_process()
+        paused, next_health = None, 0.0
+        while not stop_event.is_set() and (parent is None or parent.is_alive()):
+            while True:
+                try:
+                    command, *args = commands.get_nowait()
+                except queue.Empty:
+                    break
+                if command == 'mark':
+                    pipeline.mark(*args)
+                elif command == 'marker':
+                    pipeline.insert_marker(*args)
+
+            for i, (ring, records) in enumerate(zip(rings, pipeline.read())):
+                if len(records):
+                    ring.publish_window(lambda window: pipeline.latest_window(i, out=window))
+                    ring.publish(records)
+
+            # Which boards are paused as soon as it changes, and their health counters every second
+            previous, paused = paused, pipeline.paused_boards()
+            if paused != previous or time.perf_counter() >= next_health:
+                status.put(('health', (paused, pipeline.health())))
+                next_health = time.perf_counter() + 1.0
+            stop_event.wait(poll_interval)
+    except Exception as e:
+        status.put(('error', f"Scoring worker failed: {type(e).__name__}: {e}"))
+        raise
+    finally:
+        pipeline.stop()
+        for ring in rings:
+            ring.close()
+        status.put(('stopped', None))
+
+
+class ScoreWorker:
+    """
+    Runs the ScorePipeline of every board in a worker process and reads its scores from shared memory.
+
+    Has the interface of ScorePipeline (start, warm_boards, is_warm, restart, read, paused_boards, health,
+    latest_window, mark, insert_marker, stop), so the game loop doesn't need to know which one it runs.
+
+    Attributes:
+        players (list): player_config() of every board.
+        names (list): Name of every board.
+        rings (list): SharedScoreRing of every board.
+        record_path (str): Session folder the worker records to, None when not recording.
+    """
+
+    def __init__(self, players, epoch_duration, hop_duration, normalize='betaalpha', notch_frequency=None,
+                 bandpass=None, record_path=None, poll_interval=0.01, capacity=1024, align_boards=True,
+                 registry_path=None):
+        """
+        Initializes the worker and its shared memory. The process starts with start().
+
+        Args:
+            players (list): player_config() of every board.
+            epoch_duration (float): Seconds of data in each score.
+            hop_duration (float): Seconds between two scores.
+            normalize (str, optional): Alpha power normalization. Defaults to 'betaalpha'.
+            notch_frequency (float, optional): Notch filter frequency in Hz, None for no notch. Defaults to None.
+            bandpass (tuple, optional): (low, high) bandpass edges in Hz, None for no bandpass. Defaults to None.
+            record_path (str, optional): Session folder to record the boards to, None to not record. Defaults to None.
+            poll_interval (float, optional): Seconds between two drains of the boards in the worker. Defaults to 0.01.
+            capacity (int, optional): Records kept per board, the game must read more often than this many hops. Defaults to 1024.
+            align_boards (bool, optional): Score every board over the same interval, from their timestamps. Defaults to True.
+            registry_path (str, optional): Device registry the worker looks the dongles up in (and registers
+                auto-detected ones to), None to always probe. Defaults to None.
+        """
+        self.players = players
+        self.names = [player['name'] for player in players]
+        self.record_path = record_path
+        self.poll_interval = poll_interval
+        self._settings = {'epoch_duration': epoch_duration, 'hop_duration': hop_duration, 'normalize': normalize,
+                          'notch_frequency': notch_frequency, 'bandpass': bandpass, 'record_path': record_path,
+                          'align_boards': align_boards, 'registry_path': registry_path}
+
+        # The shape of every window is known from the board descriptions, without a session
+        self.rings = []
+        for player in players:
+            n_channels = len(player['channels'] or BoardShim.get_eeg_channels(player['board_id']))
+            window_samples = int(epoch_duration * BoardShim.get_sampling_rate(player['board_id']))
+            self.rings.append(SharedScoreRing(n_channels, window_samples, capacity))
+        self.positions = [0] * len(players)
+        self._commands = multiprocessing.Queue()
+        self._status = multiprocessing.Queue()
+        self._stop_event = multiprocessing.Event()
+        self._process = None
+        self._launch_time = None
+        self._state = None
+        self._error = None
+        self._warm = [False] * len(players)
+        self._paused = ['waiting for a full epoch'] * len(players)
+        self._health = [{} for _ in players]
+
+    def _update_state(self, timeout=None):
+        """
+        Reads the next status message of the worker (waiting up to timeout seconds, None to not wait).
+        """
+        try:
+            state, message = self._status.get(timeout=timeout) if timeout else self._status.get_nowait()
+        except queue.Empty:
+            return
+        if state == 'waiting':
+            self._warm = message
+            return
+        if state == 'health':
+            self._paused, self._health = message
+            return
+        self._state = state
+        if state == 'warm':
+            self._warm = [True] * len(self.players)
+        elif state == 'error':
+            self._error = message
+
+    def launch(self):
+        """
+        Starts the worker process without waiting for its boards. The process is forked from this one, so call it
+        from the main thread before other threads run (start() then only waits for the boards).
+        """
+        if self._process is not None:
+            return
+        self._launch_time = time.perf_counter()
+        # Not a daemon: the worker starts port-probing processes of its own
+        self._process = multiprocessing.Process(target=_run_worker, name='Alpha-war scoring',
+                                                args=(self.players, self._settings, [ring.spec() for ring in self.rings],
+                                                      self._commands, self._status, self._stop_event, self.poll_interval))
+        self._process.start()
+
+    def start(self, stats=None, timeout=120):
+        """
+        Starts the worker process (unless launch() already did) and waits until its boards are connected.
+
+        Args:
+            stats (PerfStats, optional): Receives the time until the boards were connected as 'board_setup'. Defaults to None.
+            timeout (float, optional): Seconds to wait for the boards. Defaults to 120.
+
+        Raises:
+            Exception: If the worker couldn't connect the boards.
+        """
+        self.launch()
+        deadline = time.perf_counter() + timeout
+        while self._state not in ('connected', 'warm', 'error'):
+            if not self._process.is_alive() and self._status.empty():
+                self._error = f"Scoring worker exited with code {self._process.exitcode}"
+                break
+            if time.perf_counter() > deadline:
+                self._error = f"Scoring worker didn't connect the boards within {timeout} s"
+                break
+            self._update_state(timeout=0.1)
+        if self._error is not None:
+            self.stop()
+            raise Exception(self._error)
+        if stats is not None:
+            stats.add('board_setup', time.perf_counter() - self._launch_time)
+
+    def _check_worker(self):
+        """
+        Reads the pending status messages of the worker and checks that it is still scoring.
+
+        Raises:
+            Exception: The worker's error if it failed, or its exit code if it stopped or died (the worker is then
+                       stopped and its rings freed).
+        """
+        while not self._status.empty():
+            self._update_state()
+        if self._process is None:
+            return
+        if self._state in ('stopped', 'error') or not self._process.is_alive():
+            # A message sent just before the worker exited may only arrive now
+            self._update_state(timeout=0.1)
+            error = self._error or f"Scoring worker stopped (exit code {self._process.exitcode})"
+            self.stop()
+            raise Exception(error)
+
+    def warm_boards(self):
+        """
+        Returns:
+            list: For every board, True once the worker has a full, valid epoch of its data.
+
+        Raises:
+            Exception: If the worker failed or stopped.
+        """
+        self._check_worker()
+        return list(self._warm)
+
+    def is_warm(self):
+        """
+        Returns:
+            bool: True once every board has a full, valid epoch of data and the worker is scoring.
+
+        Raises:
+            Exception: If the worker failed or stopped.
+        """
+        self.warm_boards()
+        return self._state == 'warm'
+
+    def restart(self):
+        """
+        Starts reading from the next scores. The worker scores continuously, so those come from the latest epochs.
+        """
+        self.positions = [ring.written for ring in self.rings]
+
+    def read(self, stats=None):
+        """
+        Returns the scores published since the last read.
+
+        Args:
+            stats (PerfStats, optional): Receives the time spent reading as 'acquisition_read'. Defaults to None.
+
+        Returns:
+            list: One array of shape (n_scores, len(SCORE_FIELDS)) per board, oldest score first.
+
+        Raises:
+            Exception: If the worker failed or stopped.
+        """
+        read_start = time.perf_counter()
+        self._check_worker()
+        records = []
+        for i, ring in enumerate(self.rings):
+            board_records, self.positions[i] = ring.read_since(self.positions[i])
+            records.append(board_records)
+        if stats is not None:
+            stats.add('acquisition_read', time.perf_counter() - read_start)
+        return records
+
+    def paused_boards(self):
+        """
+        Returns:
+            list: For every board, why the worker isn't scoring it, None if it is (see ScorePipeline.paused_boards).
+        """
+        return list(self._paused)
+
+    def health(self):
+        """
+        Returns:
+            list: The health counters of every board last sent by the worker (at most a second old).
+        """
+        return list(self._health)
+
+    def latest_window(self, board, out=None):
+        """
+        Returns the latest epoch of a board's EEG channels (as acquired, before filtering), see ScorePipeline.latest_window.
+        """
+        return self.rings[board].read_window(out=out)
+
+    def mark(self, label, value=None, details=None):
+        """
+        Records a session event (and inserts value as a marker into every board) when recording.
+        """
+        if self.record_path is not None:
+            self._commands.put(('mark', label, value, details))
+
+    def insert_marker(self, value):
+        """
+        Inserts a marker into the stream of every board.
+        """
+        self._commands.put(('marker', value))
+
+    def stop(self, timeout=10):
+        """
+        Stops the worker, which stops acquiring, closes the recording and releases every board, then frees the rings.
+
+        Args:
+            timeout (float, optional): Seconds to wait for the worker before terminating it. Defaults to 10.
+        """
+        if self._process is not None:
+            # Setting the event waits for its sleepers to wake up, which a worker that died (e.g. killed) never does
+            if self._process.is_alive():
+                self._stop_event.set()
+            self._process.join(timeout)
+            if self._process.is_alive():
+                print(f"Scoring worker didn't stop within {timeout} s, terminating it")
+                self._process.terminate()
+                self._process.join()
+            self._process = None
+        for ring in self.rings:
+            ring.close()
+        self.rings = []
@@ -0,0 +1,313 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import time
+import numpy as np
+from band_power import ALPHA_BAND, BETA_BAND, NORMALIZATION_MODES, BatchSlidingBandPower
+from calibration import RunningStats
+from filters import DEFAULT_BANDPASS, DEFAULT_NOTCH_FREQUENCY, StreamingFilter
+from tug_of_war import PLAYER_1_RECT, PLAYER_2_RECT, ROPE_RECT, RopePhysics, arena_teams
+
+###################
+# Monte Carlo simulator of Alpha-war, to tune the rope speed, epoch length and normalization without players. Thousands
+# of matches run at once as NumPy arrays: synthetic EEG (alpha and beta rhythms of a chosen amplitude per player, over
+# 1/f background noise) is generated a hop at a time for every channel of every player of every game, filtered by one
+# StreamingFilter, scored by one BatchSlidingBandPower, z-scored against a calibrated baseline like TugOfWar.update()
+# does, and moves one RopePhysics whose rope positions are arrays. The scoring and the rope are the game's own code, so
+# the win probabilities and match lengths carry over to the live game (with the same layout and settings).
+# Players are z-scored against their own calibration, so what decides a game is how far each player's rhythms move
+# away from their calibration amplitudes during play.
+#   python simulate.py --games 2000 --sweep 0.8 0.9 1.1 1.25 --output simulation.json
+###################
+LEFT, RIGHT, UNDECIDED = 0, 1, -1  # Winner of a simulated game
+# 1/f ("pink") noise shaping filter (b, a), Julius O. Smith's approximation
+BACKGROUND_FILTER = ([0.049922035, -0.095993537, 0.050612699, -0.004408786], [1, -2.494956002, 2.017265875, -0.522189400])
+
+
+class SyntheticEEG:
+    """
+    Stream of synthetic EEG for many rows (channels) at once: an alpha rhythm, a beta rhythm and 1/f background noise,
+    each white noise shaped by a filter (band-limited to ALPHA_BAND and BETA_BAND for the rhythms) and scaled to a RMS
+    amplitude per row. The filter states carry over between chunks, so consecutive chunks form one continuous signal.
+    The white noise is uniform, several times faster to draw than normal noise and just as Gaussian once filtered.
+    """
+
+    def __init__(self, alpha, beta, background, sampling_rate, rng):
+        """
+        Initializes the stream, already at its steady state.
+
+        Args:
+            alpha (numpy.ndarray): RMS amplitude in microvolts of the alpha rhythm of each row.
+            beta (numpy.ndarray): RMS amplitude in microvolts of the beta rhythm of each row.
+            background (numpy.ndarray): RMS amplitude in microvolts of the background noise of each row.
+            sampling_rate (int): Sampling rate in Hz.
+            rng (numpy.random.Generator): Source of the noise.
+        """
+        from scipy.signal import butter, sosfilt, tf2sos
+
+        self.rng = rng
+        self.sampling_rate = sampling_rate
+        self.sos = [butter(4, ALPHA_BAND, btype='bandpass', fs=sampling_rate, output='sos'),
+                    butter(4, BETA_BAND, btype='bandpass', fs=sampling_rate, output='sos'),
+                    tf2sos(*BACKGROUND_FILTER)]
+        # Unit RMS for uniform noise in [-0.5, 0.5) (variance 1/12), from the energy of each filter's impulse response
+        impulse = np.zeros(int(20 * sampling_rate))
+        impulse[0] = 1.0
+        self.gains = [np.sqrt(12 / np.sum(sosfilt(sos, impulse) ** 2)) for sos in self.sos]
+        self.set_amplitudes(alpha, beta, background)
+        self.n_rows = len(self.scales[0])
+        self.zi = [np.zeros((sos.shape[0], self.n_rows, 2)) for sos in self.sos]
+        self.next(int(sampling_rate))
+
+    def set_amplitudes(self, alpha, beta, background):
+        """
+        Changes the RMS amplitudes (microvolts per row) of the samples from now on, see __init__().
+        """
+        self.scales = [np.asarray(amplitude, dtype=float)[:, None] * gain for amplitude, gain in zip((alpha, beta, background), self.gains)]
+
+    def next(self, n_samples):
+        """
+        Returns:
+            numpy.ndarray: The next n_samples of every row, shape (n_rows, n_samples).
+        """
+        from scipy.signal import sosfilt
+
+        eeg = np.zeros((self.n_rows, n_samples))
+        noise = self.rng.random((len(self.sos), self.n_rows, n_samples))
+        noise -= 0.5
+        for i, (sos, scale) in enumerate(zip(self.sos, self.scales)):
+            shaped, self.zi[i] = sosfilt(sos, noise[i], axis=-1, zi=self.zi[i])
+            shaped *= scale
+            eeg += shaped
+        return eeg
+
+
+def _simulate_batch(n_games, alpha, beta, background, rng, calibration_alpha=None, calibration_beta=None, n_channels=8,
+                    sampling_rate=250, epoch_duration=2, hop_duration=0.25, normalize='betaalpha', rope_speed=30,
+                    calibration_duration=15, baseline_decay=None, notch_frequency=DEFAULT_NOTCH_FREQUENCY,
+                    bandpass=DEFAULT_BANDPASS, spread=0.0, max_duration=300):
+    """
+    Plays n_games games at once, see simulate().
+
+    Returns:
+        tuple: Winner (LEFT, RIGHT or UNDECIDED) and length in seconds (NaN if undecided) of each game.
+    """
+    n_players = len(alpha)
+    teams = arena_teams(n_players)
+
+    # Each player's alpha and beta differ from one game to the next by the same factors in calibration and in play
+    factors = [np.exp(spread * rng.standard_normal((n_games, n_players))) if spread else 1.0 for _ in range(2)]
+
+    def amplitudes(values, factor):
+        # One amplitude per channel, player after player within each game
+        values = np.broadcast_to(np.asarray(values, dtype=float), (n_games, n_players)) * factor
+        return np.repeat(values.reshape(-1), n_channels)
+
+    n_rows = n_games * n_players * n_channels
+    background = np.full(n_rows, float(background))
+    calibration_alpha = alpha if calibration_alpha is None else calibration_alpha
+    calibration_beta = beta if calibration_beta is None else calibration_beta
+    eeg = SyntheticEEG(amplitudes(calibration_alpha, factors[0]), amplitudes(calibration_beta, factors[1]), background, sampling_rate, rng)
+    eeg_filter = StreamingFilter(n_rows, sampling_rate, notch_frequency, bandpass)
+    hop = max(1, int(hop_duration * sampling_rate))
+    engine = BatchSlidingBandPower(n_games * n_players, n_channels, sampling_rate, int(epoch_duration * sampling_rate), hop, normalize)
+
+    def next_round():
+        # Scores of the next hop, shape (n_games, n_players)
+        while True:
+            scores = engine.update(eeg_filter.process(eeg.next(hop)))
+            if scores:
+                return scores[-1].reshape(n_games, n_players)
+
+    # Calibration: both phases, without the first epoch of each (see Calibration.settle_time)
+    baselines = None
+    if calibration_duration:
+        baselines = [RunningStats() for _ in range(n_players)]
+        for _ in range(max(2, int(2 * (calibration_duration - epoch_duration) / (hop / sampling_rate)))):
+            scores = next_round()
+            for player, baseline in enumerate(baselines):
+                baseline.update(scores[:, player])
+        for baseline in baselines:
+            baseline.decay = baseline_decay
+    eeg.set_amplitudes(amplitudes(alpha, factors[0]), amplitudes(beta, factors[1]), background)
+
+    left_finish = PLAYER_1_RECT[0] - ROPE_RECT[2]  # The rope has completely passed a marker (see TugOfWar._passed_marker)
+    right_finish = PLAYER_2_RECT[0] + PLAYER_2_RECT[2]
+    physics = RopePhysics(np.full(n_games, float(ROPE_RECT[0])), rope_speed / epoch_duration, response_time=hop_duration)
+    winners = np.full(n_games, UNDECIDED)
+    durations = np.full(n_games, np.nan)
+    playing = np.ones(n_games, dtype=bool)
+    max_ticks = int(max_duration / physics.timestep)
+    accumulator = 0.0
+    while playing.any() and physics.ticks < max_ticks:
+        scores = next_round()
+        if baselines is not None:
+            z_scores = np.column_stack([baseline.zscore(scores[:, player]) for player, baseline in enumerate(baselines)])
+            for player, baseline in enumerate(baselines):
+                baseline.update(scores[:, player])
+            scores = z_scores
+        physics.set_difference(scores[:, teams[1]].mean(axis=1) - scores[:, teams[0]].mean(axis=1))
+
+        # The rope moves until the next round, the games over keep their winner and length
+        accumulator += hop / sampling_rate
+        while accumulator >= physics.timestep and physics.ticks < max_ticks:
+            accumulator -= physics.timestep
+            physics.step()
+            left_won = playing & (physics.x < left_finish)
+            right_won = playing & (physics.x > right_finish)
+            if left_won.any() or right_won.any():
+                winners[left_won] = LEFT
+                winners[right_won] = RIGHT
+                durations[left_won | right_won] = physics.ticks * physics.timestep
+                playing &= ~(left_won | right_won)
+    return winners, durations
+
+
+def summarize(winners, durations, bins=10):
+    """
+    Returns:
+        dict: Win probability of each side and of no winner, with the half-width of their 95% confidence interval, and
+              the distribution of the length of the decided games (seconds).
+    """
+    n = len(winners)
+    summary = {'games': n}
+    for name, code in (('left', LEFT), ('right', RIGHT), ('undecided', UNDECIDED)):
+        p = float(np.mean(winners == code)) if n else 0.0
+        summary[f"p_{name}"] = p
+        summary[f"p_{name}_ci"] = 1.96 * float(np.sqrt(p * (1 - p) / n)) if n else 0.0
+    decided = durations[np.isfinite(durations)]
+    if len(decided):
+        counts, edges = np.histogram(decided, bins=bins)
+        summary['duration'] = {'mean': float(decided.mean()), 'min': float(decided.min()), 'max': float(decided.max()),
+                               **{f"p{q}": float(np.percentile(decided, q)) for q in (10, 25, 50, 75, 90)},
+                               'histogram': {'counts': counts.tolist(), 'edges': edges.tolist()}}
+    else:
+        summary['duration'] = None
+    return summary
+
+
+def _run_batch(n_games, alpha, beta, background, seed, batch, settings):
+    return _simulate_batch(n_games, alpha, beta, background, np.random.default_rng([seed, batch]), **settings)
+
+
+def simulate(n_games, alpha, beta, background=10.0, batch_size=500, seed=0, processes=1, **settings):
+    """
+    Plays n_games simulated games, batch_size at a time (the EEG of a batch is generated a hop at a time, so memory
+    grows with batch_size * players * channels, not with the length of the games).
+
+    Args:
+        n_games (int): Number of games.
+        alpha (list): RMS amplitude in microvolts of the alpha rhythm of each player during play (players 1, 3, ...
+                      pull left, players 2, 4, ... pull right, as in arena mode), or one list per game.
+        beta (list): RMS amplitude in microvolts of the beta rhythm of each player during play, like alpha.
+        background (float, optional): RMS amplitude in microvolts of the 1/f background noise. Defaults to 10.0.
+        batch_size (int, optional): Games played at once. Defaults to 500.
+        seed (int, optional): Seed of the noise. The same seed plays the same noise with other settings, so their
+                              results differ by the settings and not by chance. Defaults to 0.
+        processes (int, optional): Processes playing batches in parallel. Defaults to 1.
+        **settings: calibration_alpha and calibration_beta (amplitudes during the calibration, like alpha and beta,
+                    defaulting to them), n_channels, sampling_rate, epoch_duration, hop_duration, normalize,
+                    rope_speed, calibration_duration (0 to play on raw scores), baseline_decay, notch_frequency,
+                    bandpass, spread (log-normal spread of each player's amplitudes across games) and max_duration
+                    (seconds after which a game is undecided), see _simulate_batch.
+
+    Returns:
+        dict: The summary of the games (see summarize()).
+    """
+    jobs = [(min(batch_size, n_games - start), alpha, beta, background, seed, batch, settings)
+            for batch, start in enumerate(range(0, n_games, batch_size))]
+    if processes > 1 and len(jobs) > 1:
+        with multiprocessing.Pool(min(processes, len(jobs))) as pool:
+            batches = pool.starmap(_run_batch, jobs)
+    else:
+        batches = [_run_batch(*job) for job in jobs]
+    return summarize(np.concatenate([winners for winners, _ in batches]), np.concatenate([durations for _, durations in batches]))
+
+
+def _per_player(values, n_players, name):
+    if len(values) == 1:
+        return values * n_players
+    if len(values) != n_players:
+        raise SystemExit(f"--{name} takes one value or one per player ({n_players})")
+    return list(values)
+
+
+def _histogram_lines(duration, width=40):
+    counts = duration['histogram']['counts']
+    edges = duration['histogram']['edges']
+    top = max(counts) or 1
+    return [f"  {low:6.1f}-{high:6.1f} s {'#' * round(width * count / top):<{width}} {count}"
+            for low, high, count in zip(edges[:-1], edges[1:], counts)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate AlphaWar games with synthetic EEG and report win probabilities and match lengths.')
+    parser.add_argument('--games', type=int, default=1000, help='Games per configuration (default: 1000).')
+    parser.add_argument('--batch', type=int, default=500, help='Games simulated at once (default: 500).')
+    parser.add_argument('--players', type=int, default=2, help='Number of players, odd ones pull left and even ones right (default: 2).')
+    parser.add_argument('--alpha', type=float, nargs='+', default=[10.0], help='Alpha RMS in uV during play, one value or one per player (default: 10).')
+    parser.add_argument('--beta', type=float, nargs='+', default=[4.0], help='Beta RMS in uV during play, one value or one per player (default: 4).')
+    parser.add_argument('--calibration-alpha', type=float, nargs='+', default=None, help='Alpha RMS in uV during the calibration (default: --alpha).')
+    parser.add_argument('--calibration-beta', type=float, nargs='+', default=None, help='Beta RMS in uV during the calibration (default: --beta).')
+    parser.add_argument('--background', type=float, default=10.0, help='1/f background noise RMS in uV (default: 10).')
+    parser.add_argument('--spread', type=float, default=0.0, help='Log-normal spread of each player\'s amplitudes across games (default: 0).')
+    parser.add_argument('--channels', type=int, default=8, help='EEG channels per player (default: 8).')
+    parser.add_argument('--sampling-rate', type=int, default=250)
+    parser.add_argument('--epoch-duration', type=float, nargs='+', default=[2], help='Seconds per epoch, several values are each simulated (default: 2).')
+    parser.add_argument('--hop-duration', type=float, default=0.25)
+    parser.add_argument('--normalize', choices=NORMALIZATION_MODES, nargs='+', default=['betaalpha'], help='Normalization(s) to simulate (default: betaalpha).')
+    parser.add_argument('--rope-speed', type=float, nargs='+', default=[30], help='Top speed(s) of the rope in pixels per epoch (default: 30).')
+    parser.add_argument('--calibration-duration', type=float, default=15, help='Seconds of each calibration phase, 0 to play on raw scores (default: 15).')
+    parser.add_argument('--baseline-decay', type=float, default=0, help='Weight of each new score in the baseline during play, 0 to weight all scores equally (default: 0).')
+    parser.add_argument('--notch', type=float, default=DEFAULT_NOTCH_FREQUENCY, help='Mains notch in Hz, 0 for none (default: %(default)s).')
+    parser.add_argument('--bandpass', type=float, nargs=2, default=DEFAULT_BANDPASS, metavar=('LOW', 'HIGH'), help='Bandpass in Hz (default: 1 45).')
+    parser.add_argument('--no-bandpass', action='store_true', help='Score without the bandpass.')
+    parser.add_argument('--max-duration', type=float, default=300, help='Seconds after which a game has no winner (default: 300).')
+    parser.add_argument('--sweep', type=float, nargs='*', default=[], help='Factors to also scale the right team\'s amplitudes during play by, for the sensitivity to signal differences.')
+    parser.add_argument('--sweep-band', choices=('alpha', 'beta'), default='alpha', help='Amplitude scaled by --sweep (default: alpha).')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=1, help='Processes playing batches in parallel (default: 1).')
+    parser.add_argument('--output', help='File to write the results to, as JSON.')
+    args = parser.parse_args()
+
+    alpha = _per_player(args.alpha, args.players, 'alpha')
+    beta = _per_player(args.beta, args.players, 'beta')
+    # The sweep only changes the play, the players calibrate at their usual amplitudes
+    settings = {'calibration_alpha': _per_player(args.calibration_alpha or args.alpha, args.players, 'calibration-alpha'),
+                'calibration_beta': _per_player(args.calibration_beta or args.beta, args.players, 'calibration-beta'),
+                'n_channels': args.channels, 'sampling_rate': args.sampling_rate, 'hop_duration': args.hop_duration,
+                'calibration_duration': args.calibration_duration, 'baseline_decay': args.baseline_decay or None,
+                'notch_frequency': args.notch or None, 'bandpass': None if args.no_bandpass else tuple(args.bandpass),
+                'spread': args.spread, 'max_duration': args.max_duration}
+    factors = [1.0] + [factor for factor in args.sweep if factor != 1.0]
+    results = []
+    for epoch_duration, normalize, rope_speed in itertools.product(args.epoch_duration, args.normalize, args.rope_speed):
+        baseline = None
+        for factor in factors:
+            swept = {'alpha': list(alpha), 'beta': list(beta)}
+            for player in range(1, args.players, 2):
+                swept[args.sweep_band][player] *= factor
+            config = dict(settings, epoch_duration=epoch_duration, normalize=normalize, rope_speed=rope_speed)
+            run_start = time.perf_counter()
+            summary = simulate(args.games, swept['alpha'], swept['beta'], args.background, args.batch, args.seed, args.processes, **config)
+            baseline = baseline or summary
+            results.append({'config': dict(config, alpha=swept['alpha'], beta=swept['beta'], background=args.background, right_factor=factor),
+                            **summary, 'p_right_change': summary['p_right'] - baseline['p_right']})
+            duration = summary['duration']
+            lengths = f"length p10/p50/p90 {duration['p10']:.0f}/{duration['p50']:.0f}/{duration['p90']:.0f} s" if duration else "no game decided"
+            change = f" ({results[-1]['p_right_change']:+.1%})" if factor != 1.0 else ''
+            print(f"[Simulate] epoch {epoch_duration:g} s, {normalize}, speed {rope_speed:g}, right {args.sweep_band} x{factor:g}: "
+                  f"left {summary['p_left']:.1%} +-{summary['p_left_ci']:.1%}, right {summary['p_right']:.1%} +-{summary['p_right_ci']:.1%}{change}, "
+                  f"undecided {summary['p_undecided']:.1%}, {lengths} ({time.perf_counter() - run_start:.1f} s)")
+            if factor == 1.0 and duration:
+                print("\n".join(_histogram_lines(duration)))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"[Simulate] Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,372 @@
+import math
+import numpy as np
+import pygame
+from score_history import ScoreHistory
+
+###################
+# This file holds the rules of Alpha-war: pairing the scores of the players hop by hop, the running averages and
+# history, and the rope physics and winner (one player per side, or two teams in arena mode). It has no clock or
+# rendering of its own: the live game (AlphaWar.py) advances it by the time of each frame and the replay engine
+# (replay.py) by its replay clock, so both run exactly the same updates.
+###################
+# Layout of the game window: the two player markers and the rope at the start of a game, as (left, top, width, height)
+SCREEN_SIZE = (1440, 800)
+PLAYER_1_RECT = (100, 250, 10, 300)
+PLAYER_2_RECT = (1340, 250, 10, 300)
+ROPE_RECT = (595, 400, 250, 10)
+# Seconds per tick of the rope physics, independent of the frame rate and of the score rate
+PHYSICS_TIMESTEP = 1 / 120
+
+
+def arena_teams(n_players):
+    """
+    Returns:
+        tuple: Player indices of the left and of the right team: players 1, 3, 5, ... pull left and players 2, 4,
+               6, ... pull right (one player per side for two players).
+    """
+    return list(range(0, n_players, 2)), list(range(1, n_players, 2))
+
+
+class RopePhysics:
+    """
+    Fixed-timestep motion of the rope, pulled by a continuous force from the score difference of the two sides.
+
+    The force is tanh(difference / scale) in [-1, 1], where scale is the running RMS of the differences, so raw and
+    z-scored scores give the same range of forces. The velocity follows force * max_velocity with a first-order lag
+    of response_time seconds, so the rope speeds up and slows down smoothly between scores. advance() runs as many
+    ticks of `timestep` seconds as the elapsed time allows and position() interpolates between the last two ticks,
+    so the rope moves at any frame rate without depending on it.
+
+    x and the differences can also be arrays, one rope per element, which is how the simulator (simulate.py) moves
+    thousands of games at once.
+
+    Attributes:
+        x (float): Position of the rope at the last tick.
+        velocity (float): Velocity of the rope in pixels per second at the last tick.
+        force (float): Current force, in [-1, 1] (positive pulls right).
+        max_velocity (float): Velocity in pixels per second under a full force.
+        timestep (float): Seconds per tick.
+        ticks (int): Number of ticks since the last reset.
+    """
+
+    def __init__(self, x, max_velocity, response_time=0.25, timestep=PHYSICS_TIMESTEP, scale_decay=0.05, max_elapsed=1.0):
+        """
+        Initializes the rope at rest.
+
+        Args:
+            x (float): Starting position of the rope.
+            max_velocity (float): Velocity in pixels per second under a full force.
+            response_time (float, optional): Time constant in seconds of the velocity following the force. Defaults to 0.25.
+            timestep (float, optional): Seconds per tick. Defaults to PHYSICS_TIMESTEP.
+            scale_decay (float, optional): Weight of each new difference in the running RMS. Defaults to 0.05.
+            max_elapsed (float, optional): Longest time a single advance() simulates (e.g. after the window was
+                dragged), the rest is dropped. Defaults to 1.0.
+        """
+        self.max_velocity = max_velocity
+        self.timestep = timestep
+        self.scale_decay = scale_decay
+        self.max_elapsed = max_elapsed
+        self._blend = 1 - math.exp(-timestep / response_time) if response_time > 0 else 1.0
+        self._mean_square = None
+        self.reset(x)
+
+    def reset(self, x):
+        """
+        Puts the rope at rest at x, with no force. The scale of the differences is kept.
+        """
+        self.x = self._previous_x = float(x) if np.ndim(x) == 0 else np.array(x, dtype=float)
+        self.velocity = 0.0
+        self.force = 0.0
+        self.ticks = 0
+        self._accumulator = 0.0
+
+    def set_difference(self, difference):
+        """
+        Sets the force from a new score difference (right side minus left side), None for no force.
+        """
+        if difference is None:
+            self.force = 0.0
+            return
+        square = difference * difference
+        if self._mean_square is None:
+            self._mean_square = square
+        else:
+            self._mean_square += self.scale_decay * (square - self._mean_square)
+        if np.ndim(difference) == 0:
+            scale = math.sqrt(self._mean_square)
+            self.force = math.tanh(difference / scale) if scale > 0 else 0.0
+        else:
+            scale = np.sqrt(self._mean_square)
+            self.force = np.tanh(difference / np.where(scale > 0, scale, np.inf))
+
+    def step(self):
+        """
+        Runs one tick.
+        """
+        self._previous_x = self.x
+        self.velocity = self.velocity + (self.force * self.max_velocity - self.velocity) * self._blend
+        # Not in place: with arrays, _previous_x would be the same array
+        self.x = self.x + self.velocity * self.timestep
+        self.ticks += 1
+
+    def advance(self, elapsed, stop=None):
+        """
+        Runs the ticks that fit in the time elapsed since the last advance (the remainder carries over).
+
+        Args:
+            elapsed (float): Seconds since the last advance.
+            stop (callable, optional): Called with the position after each tick, the rope stops there (at rest,
+                dropping the remaining time) when it returns True. Defaults to None.
+
+        Returns:
+            int: Number of ticks run.
+        """
+        self._accumulator += min(elapsed, self.max_elapsed)
+        ticks = 0
+        while self._accumulator >= self.timestep:
+            self._accumulator -= self.timestep
+            self.step()
+            ticks += 1
+            if stop is not None and stop(self.x):
+                self._previous_x = self.x
+                self._accumulator = 0.0
+                self.velocity = 0.0
+                break
+        return ticks
+
+    def position(self):
+        """
+        Returns:
+            float: Position of the rope for display, interpolated between the last two ticks.
+        """
+        return self._previous_x + (self.x - self._previous_x) * (self._accumulator / self.timestep)
+
+
+class TugOfWar:
+    """
+    State of a tug-of-war between two players (or two teams of players), updated from their alpha power scores.
+
+    Each board produces a score every hop. Scores wait until every player has a score for the same hop; a board
+    that is ahead (e.g. it started streaming first) only keeps its newest unmatched score. Every round of scores sets
+    the force pulling the rope towards the side with the higher score (the average score of its players for teams),
+    and advance() moves the rope with fixed-timestep physics (see RopePhysics), checking for a winner every tick.
+    Averages and history run across games, the rope restarts every game.
+
+    A paused player (e.g. while their board reconnects) is left out of the rounds: the others keep playing, the
+    history holds the paused player's last score, and a side without any unpaused player stops pulling the rope.
+
+    With baselines (see calibration.py), every score is first z-scored against its player's baseline, which is then
+    updated with it; the averages, history and rope all use the z-scores. Every game starts from a copy of the
+    calibrated baselines, so the scores of a game never shift the baseline of the next one.
+
+    Attributes:
+        player_rects (list): pygame.Rect of the marker of each side.
+        names (tuple): Name of each player, used for the winner.
+        teams (tuple): Player indices of the left and of the right side.
+        n_players (int): Number of players.
+        speed (float): Pixels the rope moves per epoch_duration under a full force.
+        physics (RopePhysics): Motion of the rope.
+        rope (pygame.Rect): The rope, at its (rounded, interpolated) display position.
+        scores (list): Last score of each player.
+        paused (list): Whether each player is paused, see set_paused().
+        count (int): Number of rounds applied since creation.
+        history (ScoreHistory): Scores shown on the graph.
+        winner (str): Name of the winner (the names of its players for a team) of the current game, or None while it is running.
+        applied_tags (list): Tags of each round applied by the last push, one per player, see push_all().
+        calibrated_baselines (list): RunningStats of each player from their calibration, or None for raw scores.
+            Set it (e.g. after calibrating again) before reset() for the next game to use it.
+        baselines (list): Copy of calibrated_baselines the scores of the current game are z-scored against and
+            update, or None for raw scores.
+    """
+
+    def __init__(self, player_rects, rope_rect, speed, hop_duration, epoch_duration, history_length=100,
+                 names=('Player 1', 'Player 2'), baselines=None, teams=None):
+        """
+        Initializes the game.
+
+        Args:
+            player_rects (list): pygame.Rect of the marker of each side (left side first).
+            rope_rect (pygame.Rect): The rope at the start of each game.
+            speed (float): Pixels the rope moves per epoch_duration under a full force.
+            hop_duration (float): Seconds between two scores, also the response time of the rope to a new force.
+            epoch_duration (float): Seconds of data in each score.
+            history_length (int, optional): Number of scores kept for the graph. Defaults to 100.
+            names (tuple, optional): Name of each player. Defaults to ('Player 1', 'Player 2').
+            baselines (list, optional): RunningStats of each player to z-score the scores against. Defaults to None.
+            teams (tuple, optional): Player indices of the left and of the right team, e.g. ([0, 2], [1, 3]).
+                Defaults to the first player on the left and the second on the right.
+        """
+        self.player_rects = player_rects
+        self.names = names
+        self.n_players = len(names)
+        self.teams = teams or ([0], [1])
+        self.calibrated_baselines = baselines
+        self.start_rope = pygame.Rect(rope_rect)
+        self.speed = speed
+        self.physics = RopePhysics(self.start_rope.x, speed / epoch_duration, response_time=hop_duration)
+        self.history = ScoreHistory(self.n_players, history_length)
+        self.sums = [0.0] * self.n_players
+        self.counts = [0] * self.n_players
+        self.count = 0
+        self.paused = [False] * self.n_players
+        self.scores = [None] * self.n_players
+        self.reset()
+
+    def reset(self):
+        """
+        Starts a new game: the rope goes back to the middle and unmatched scores are dropped.
+        """
+        self.rope = pygame.Rect(self.start_rope)
+        self.physics.reset(self.rope.x)
+        self.baselines = None if self.calibrated_baselines is None else [baseline.copy() for baseline in self.calibrated_baselines]
+        self.winner = None
+        self.applied_tags = []
+        self._pending = tuple([] for _ in range(self.n_players))
+
+    @property
+    def averages(self):
+        """
+        list: Average score of each player since creation (None before their first score).
+        """
+        return [total / count if count else None for total, count in zip(self.sums, self.counts)]
+
+    def set_paused(self, player, paused=True):
+        """
+        Pauses (or resumes) the input of a player, the others keep playing. The scores of a paused player waiting
+        for a round are dropped.
+
+        Args:
+            player (int): Index of the player.
+            paused (bool, optional): Whether the player is paused. Defaults to True.
+        """
+        self.paused[player] = paused
+        if paused:
+            self._pending[player].clear()
+
+    def push(self, scores1, scores2, max_updates=None, tags1=None, tags2=None):
+        """
+        Adds new scores of both players of a two-player game, see push_all().
+
+        Args:
+            scores1 (list): New scores of the left player, oldest first.
+            scores2 (list): New scores of the right player, oldest first.
+            max_updates (int, optional): Apply at most this many pairs, the others keep waiting. Defaults to no limit.
+            tags1 (list, optional): One object per score of scores1, see push_all().
+            tags2 (list, optional): Same for scores2.
+
+        Returns:
+            int: Number of pairs applied.
+        """
+        return self.push_all([scores1, scores2], max_updates, [tags1, tags2])
+
+    def push_all(self, scores, max_updates=None, tags=None):
+        """
+        Adds new scores of every player and applies every complete round (while there is no winner).
+
+        Args:
+            scores (list): New scores of each player, oldest first.
+            max_updates (int, optional): Apply at most this many rounds, the others keep waiting. Defaults to no limit.
+            tags (list, optional): For each player, None or one object per new score (e.g. a latency record), handed
+                back in applied_tags (one tuple per round, one tag per player) when its score is applied to the rope.
+
+        Returns:
+            int: Number of rounds applied.
+        """
+        tags = tags or [None] * self.n_players
+        players = [i for i in range(self.n_players) if not self.paused[i]]
+        for i in players:
+            self._pending[i].extend(zip(scores[i], tags[i] or [None] * len(scores[i])))
+
+        # A board that is ahead only keeps its newest unmatched score
+        self.applied_tags = []
+        if not players:
+            return 0
+        matched = min(len(self._pending[i]) for i in players)
+        for i in players:
+            del self._pending[i][:-(matched + 1)]
+
+        while (self.winner is None and all(self._pending[i] for i in players)
+               and (max_updates is None or len(self.applied_tags) < max_updates)):
+            round_scores, round_tags = [None] * self.n_players, [None] * self.n_players
+            for i in players:
+                round_scores[i], round_tags[i] = self._pending[i].pop(0)
+            self.update(*round_scores)
+            self.applied_tags.append(tuple(round_tags))
+        return len(self.applied_tags)
+
+    def update(self, *scores):
+        """
+        Applies one round of scores: averages, history and the force on the rope.
+
+        Args:
+            *scores (float): Raw score of each player, e.g. update(alpha_power1, alpha_power2), None for a paused player.
+        """
+        # Score every player against their own baseline, which keeps following them
+        if self.baselines is not None:
+            z_scores = [None if score is None else baseline.zscore(score) for baseline, score in zip(self.baselines, scores)]
+            for baseline, score in zip(self.baselines, scores):
+                if score is not None:
+                    baseline.update(score)
+            scores = z_scores
+
+        # Update cumulative sum and count for averages
+        for i, score in enumerate(scores):
+            if score is not None:
+                self.sums[i] += score
+                self.counts[i] += 1
+                self.scores[i] = score
+        self.count += 1
+
+        # Update alpha power history (a paused player keeps their last score)
+        self.history.append([0.0 if score is None else score for score in self.scores])
+
+        # The rope is pulled by the alpha power difference of the two sides, if both have a player
+        sides = [[scores[i] for i in team if scores[i] is not None] for team in self.teams]
+        if all(sides):
+            left, right = (sum(side) / len(side) for side in sides)
+            self.physics.set_difference(right - left)
+        else:
+            self.physics.set_difference(None)
+
+    def margin(self):
+        """
+        Returns:
+            float: How far the rope is towards a side, from -1 (it passed the left marker) to 1 (it passed the right
+                   one), 0 where it starts.
+        """
+        x = self.physics.position()
+        start = self.start_rope.x
+        left_finish = self.player_rects[0].left - self.rope.width
+        right_finish = self.player_rects[1].right
+        if x < start:
+            return max(-1.0, (x - start) / (start - left_finish))
+        return min(1.0, (x - start) / (right_finish - start))
+
+    def _passed_marker(self, x):
+        """
+        Returns True (and sets the winner) once the rope at x has completely passed one of the player markers.
+        """
+        left_rect, right_rect = self.player_rects
+        if x + self.rope.width < left_rect.left:
+            self.winner = ' & '.join(self.names[i] for i in self.teams[0])
+        elif x > right_rect.right:
+            self.winner = ' & '.join(self.names[i] for i in self.teams[1])
+        return self.winner is not None
+
+    def advance(self, elapsed):
+        """
+        Moves the rope by the time elapsed since the last advance, checking for a winner every physics tick.
+
+        Args:
+            elapsed (float): Seconds since the last advance (e.g. the last frame, or a hop of a replay).
+
+        Returns:
+            bool: True if the displayed rope moved.
+        """
+        if self.winner is None:
+            self.physics.advance(elapsed, stop=self._passed_marker)
+        x = round(self.physics.position())
+        if x == self.rope.x:
+            return False
+        self.rope.x = x
+        return True